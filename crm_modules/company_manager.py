@@ -6,19 +6,68 @@ fusion_crm_main.pyから抽出
 import streamlit as st
 import pandas as pd
 from .data_processor import ENRDataProcessor
+from modules.columnar_transport import COLUMNAR_PARAMS, companies_dataframe
+from .schema_registry import SchemaRegistry
+
+try:
+    from .company_mirror import CompanyMirror
+    MIRROR_AVAILABLE = True
+except ImportError:
+    MIRROR_AVAILABLE = False
+
+try:
+    from .mutation_journal import MutationJournal
+    JOURNAL_AVAILABLE = True
+except ImportError:
+    JOURNAL_AVAILABLE = False
+
+
+@st.cache_resource
+def get_company_mirror(gas_url, _api):
+    """GAS URLごとにプロセス内で共有する企業データのローカルミラー"""
+    return CompanyMirror(_api)
+
+
+@st.cache_resource
+def get_schema_registry():
+    """init_databaseの実行結果をプロセス内で共有するレジストリ"""
+    return SchemaRegistry()
+
+
+@st.cache_resource
+def get_mutation_journal(gas_url, _session):
+    """GAS URLごとにプロセス内で共有する書き込みジャーナル（バックグラウンド再送を開始）"""
+    return MutationJournal(gas_url, session=_session).start()
+
 
 class CompanyManager:
     """企業管理クラス（Google Sheets専用版）"""
     
     def __init__(self, api):
         self.api = api
+        self.mirror = get_company_mirror(api.gas_url, api) if MIRROR_AVAILABLE else None
+        self.journal = get_mutation_journal(api.gas_url, api.session) if JOURNAL_AVAILABLE else None
+        if self.journal is not None:
+            self.journal.on_applied = self._sync_mirror
         self._ensure_database()
     
     def _ensure_database(self):
-        """データベース初期化確認"""
-        result = self.api.call_api('init_database', method='POST')
-        if result and result.get('success') and result.get('spreadsheet_url'):
-            st.session_state.spreadsheet_url = result['spreadsheet_url']
+        """データベース初期化確認（GAS URL・スキーマバージョンごとにプロセス内で1回のみ実行）"""
+        self._apply_schema_status(get_schema_registry().ensure(self.api))
+    
+    def recheck_database(self):
+        """データベース初期化を再実行（管理者向け）"""
+        status = get_schema_registry().ensure(self.api, force=True)
+        self._apply_schema_status(status)
+        return status
+    
+    def get_schema_status(self):
+        """キャッシュ済みの初期化結果"""
+        return get_schema_registry().get(self.api.gas_url)
+    
+    def _apply_schema_status(self, status):
+        if status.get('initialized') and status.get('spreadsheet_url'):
+            st.session_state.spreadsheet_url = status['spreadsheet_url']
     
     def add_company(self, company_data, user_id="system"):
         """企業追加"""
@@ -26,16 +75,21 @@ class CompanyManager:
             # PicoCELA関連度とWiFi需要を自動計算
             relevance_score = ENRDataProcessor.calculate_picocela_relevance(company_data)
             wifi_required = 1 if ENRDataProcessor.detect_wifi_requirement(company_data) else 0
-            priority_score = ENRDataProcessor.calculate_priority_score(company_data)
+            priority_score = ENRDataProcessor.calculate_priority_score(company_data, relevance_score, wifi_required)
             
             company_data['picocela_relevance_score'] = relevance_score
             company_data['wifi_required'] = wifi_required
             company_data['priority_score'] = priority_score
             company_data['sales_status'] = company_data.get('sales_status', 'New')
             
+            if self.journal is not None:
+                # ジャーナルに記録して即座に受け付け（GASへはバックグラウンドで送信、仮IDを返す）
+                return self.journal.record_add_company(company_data)
+            
             result = self.api.call_api('add_company', method='POST', data={'company': company_data})
             
             if result and result.get('success'):
+                self._sync_mirror()
                 return result.get('company_id')
             return None
             
@@ -46,25 +100,84 @@ class CompanyManager:
     def update_status(self, company_id, new_status, user_id, reason="", notes=""):
         """ステータス更新"""
         try:
+            if self.journal is not None:
+                self.journal.record_status_update(company_id, new_status, f"{reason} - {notes}" if reason else notes)
+                return True
+            
             result = self.api.call_api('update_status', method='POST', data={
                 'company_id': company_id,
                 'new_status': new_status,
                 'note': f"{reason} - {notes}" if reason else notes
             })
             
+            if result and result.get('success'):
+                self._sync_mirror()
             return result and result.get('success')
             
         except Exception as e:
             st.error(f"ステータス更新エラー: {str(e)}")
             return False
     
+    def update_status_batch(self, company_ids, new_status, user_id, reason="", notes=""):
+        """複数企業のステータスを1回のAPI呼び出しで一括更新（キャンペーン後の一括移行など）"""
+        try:
+            if self.journal is not None:
+                count = self.journal.record_status_updates(
+                    [str(company_id) for company_id in company_ids], new_status,
+                    f"{reason} - {notes}" if reason else notes
+                )
+                return {'success': True, 'updated': count, 'failed': 0, 'queued': True}
+            
+            result = self.api.call_api('update_status_batch', method='POST', data={
+                'company_ids': list(company_ids),
+                'new_status': new_status,
+                'note': f"{reason} - {notes}" if reason else notes
+            })
+            
+            if result and result.get('success'):
+                self._sync_mirror()
+            return result
+            
+        except Exception as e:
+            st.error(f"一括ステータス更新エラー: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def _sync_mirror(self):
+        """書き込み後にミラーへ差分を反映"""
+        if self.mirror is not None:
+            try:
+                self.mirror.sync()
+            except Exception:
+                pass
+    
     def get_companies_by_status(self, status=None, wifi_required=None):
-        """ステータス別企業取得"""
+        """ステータス別企業取得（未送信の書き込みを重ねて表示）"""
+        if self.journal is None or not self.journal.stats()['pending']:
+            return self._load_companies(status, wifi_required)
+        
+        df = self.journal.overlay_dataframe(self._load_companies())
+        if status and not df.empty and 'sales_status' in df.columns:
+            df = df[df['sales_status'] == status]
+        if wifi_required is not None and not df.empty and 'wifi_required' in df.columns:
+            df = df[df['wifi_required'] == wifi_required]
+        return df
+    
+    def _load_companies(self, status=None, wifi_required=None):
+        """ステータス別企業取得（ローカルミラー優先、失敗時はGASから全件取得）"""
+        if self.mirror is not None:
+            try:
+                self.mirror.sync_if_stale()
+                if self.mirror.count() > 0:
+                    return self.mirror.get_companies(status, wifi_required)
+            except Exception as e:
+                st.warning(f"⚠️ ローカルミラーを利用できません: {str(e)}")
+        
         try:
-            result = self.api.call_api('get_companies')
+            # 列形式（gzip圧縮）で取得し、行ごとの辞書を作らずにDataFrameへ変換
+            result = self.api.call_api('get_companies', method='POST', data=dict(COLUMNAR_PARAMS))
             
-            if result and result.get('success') and result.get('companies'):
-                df = pd.DataFrame(result['companies'])
+            if result and result.get('success'):
+                df = companies_dataframe(result)
                 
                 # 安全なフィルタリング（カラムの存在確認）
                 if status and not df.empty and 'sales_status' in df.columns:
@@ -156,4 +269,48 @@ class EmailCampaignManager:
                 color: white;
                 padding: 12px 24px;
                 border: none;
-                border-radius: 8
\ No newline at end of file
+                border-radius: 8px;
+                font-size: 16px;
+                font-weight: bold;
+                cursor: pointer;
+                margin: 10px 0;
+                width: 100%;
+                box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+            ">
+                🚀 メール配信システムを開く（新しいタブ）
+            </button>
+        </a>
+        """, unsafe_allow_html=True)
+        
+        # または、Streamlitの標準ボタンとlink_buttonを使用する方法
+        st.markdown("**または:**")
+        
+        if st.button("🚀 メール配信システムを開く", type="primary", use_container_width=True):
+            # JavaScriptでウィンドウを開く
+            st.markdown(f"""
+            <script>
+            window.open('{email_system_url}', '_blank');
+            </script>
+            """, unsafe_allow_html=True)
+            
+            # ユーザーに手動で開くよう案内
+            st.info(f"新しいタブでメール配信システムが開きます。開かない場合は以下のリンクをクリックしてください:")
+            st.markdown(f"[📧 メール配信システム]({email_system_url})")
+        
+        # 使用方法（更新版）
+        with st.expander("📋 使用方法"):
+            st.markdown(f"""
+            **メール配信システム:**
+            - URL: {email_system_url}
+            - 上記ボタンをクリックして新しいタブで開きます
+            
+            **使用手順:**
+            1. 上記ボタンをクリックしてメール配信システムを開く
+            2. Gmail設定を行う（初回のみ）
+            3. 企業データを選択してメール配信を実行
+            
+            **特徴:**
+            - 独立したメール配信アプリケーション
+            - Gmail設定から配信まで完結
+            - このメインシステムとは別に動作
+            """)
@@ -0,0 +1,204 @@
+"""
+企業データのローカルミラー
+Google Sheetsの企業テーブルをSQLiteに複製し、最終更新日の差分のみ同期
+読み込みはミラーから、書き込みはGAS経由（書き込み後に差分同期）
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from modules.columnar_transport import COLUMNAR_PARAMS, companies_records
+
+
+# 差分同期の最小間隔（秒）と、削除行を反映するための全件同期間隔（秒）
+DEFAULT_SYNC_INTERVAL = 60
+FULL_SYNC_INTERVAL = 24 * 60 * 60
+
+# 絞り込みに使う列（JSON本体とは別に索引付きで保持）
+INDEXED_COLUMNS = ['company_name', 'email', 'sales_status', 'wifi_required']
+
+
+def mirror_db_path(gas_url: str) -> str:
+    """GAS URLごとのミラーDBファイル名（送信先を切り替えても行・同期位置が混ざらない）"""
+    digest = hashlib.sha256(str(gas_url or '').encode('utf-8')).hexdigest()[:12]
+    return f"fusion_crm_mirror_{digest}.db"
+
+
+def _row_id(company: Dict) -> Optional[str]:
+    """GAS応答の企業ID（バックエンドの版によりidまたはcompany_id）"""
+    value = company.get('company_id') or company.get('id')
+    return str(value) if value else None
+
+
+def _row_updated(company: Dict) -> str:
+    return str(company.get('last_updated') or company.get('updated_at') or '')
+
+
+class CompanyMirror:
+    """Google Sheets企業テーブルのSQLiteミラー"""
+
+    def __init__(self, api, db_path: Optional[str] = None,
+                 sync_interval: int = DEFAULT_SYNC_INTERVAL,
+                 full_sync_interval: int = FULL_SYNC_INTERVAL):
+        self.api = api
+        # 既定ではGAS URLごとに別のファイル（本番とローカルサーバーの切替でデータが混ざらない）
+        self.db_path = db_path or mirror_db_path(getattr(api, 'gas_url', ''))
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self._last_sync_check = 0.0
+        self.init_database()
+
+    def init_database(self):
+        """ミラーテーブルと同期状態テーブルを作成"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS companies_mirror (
+                company_id TEXT PRIMARY KEY,
+                company_name TEXT,
+                email TEXT,
+                sales_status TEXT,
+                wifi_required INTEGER,
+                last_updated TEXT,
+                data TEXT
+            )
+        """)
+        for column in INDEXED_COLUMNS:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_mirror_{column} ON companies_mirror({column})")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS mirror_sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+
+        conn.commit()
+        conn.close()
+
+    def _get_state(self, key: str) -> Optional[str]:
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute("SELECT value FROM mirror_sync_state WHERE key = ?", (key,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def _set_state(self, cursor, key: str, value: str):
+        cursor.execute("INSERT OR REPLACE INTO mirror_sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def watermark(self) -> Optional[str]:
+        """前回同期時のサーバー時刻"""
+        return self._get_state('watermark')
+
+    def count(self) -> int:
+        conn = sqlite3.connect(self.db_path)
+        total = conn.execute("SELECT COUNT(*) FROM companies_mirror").fetchone()[0]
+        conn.close()
+        return total
+
+    def _upsert(self, cursor, companies: List[Dict]) -> int:
+        rows = []
+        for company in companies:
+            company_id = _row_id(company)
+            if not company_id:
+                continue
+            wifi_required = company.get('wifi_required')
+            rows.append((
+                company_id,
+                company.get('company_name') or company.get('name'),
+                company.get('email'),
+                company.get('sales_status') or company.get('status'),
+                int(wifi_required) if str(wifi_required).isdigit() else None,
+                _row_updated(company),
+                json.dumps(company, ensure_ascii=False, default=str)
+            ))
+
+        cursor.executemany("""
+            INSERT OR REPLACE INTO companies_mirror
+            (company_id, company_name, email, sales_status, wifi_required, last_updated, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        return len(rows)
+
+    def sync(self, full: bool = False) -> Dict:
+        """GASから差分（full=Trueなら全件）を取得してミラーに反映"""
+        last_full = float(self._get_state('last_full_sync') or 0)
+        full = full or self.watermark is None or time.time() - last_full > self.full_sync_interval
+        since = None if full else self.watermark
+
+        # 転送量を減らすため列形式（gzip圧縮）で要求（未対応のバックエンドは従来の行形式で応答）
+        params = dict(COLUMNAR_PARAMS, since=since) if since else dict(COLUMNAR_PARAMS)
+        result = self.api.call_api('get_companies', method='POST', data=params)
+        if not result or not result.get('success'):
+            return {'success': False, 'error': (result or {}).get('error', 'Unknown error')}
+
+        companies = companies_records(result)
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        if full:
+            # 全件同期時はシート側で削除された行も反映
+            cursor.execute("DELETE FROM companies_mirror")
+        updated = self._upsert(cursor, companies)
+
+        # サーバー時刻を次回の基準に（未対応のバックエンドでは取得行の最大更新日）
+        watermark = result.get('server_time') or max((_row_updated(c) for c in companies), default=since or '')
+        if watermark:
+            self._set_state(cursor, 'watermark', watermark)
+        if full:
+            self._set_state(cursor, 'last_full_sync', str(time.time()))
+        self._set_state(cursor, 'last_sync', datetime.now().isoformat())
+        conn.commit()
+        conn.close()
+
+        self._last_sync_check = time.time()
+        stats = {'success': True, 'full': full, 'updated': updated, 'total': self.count()}
+
+        # 行数がシートと一致しない場合（行の削除等）は全件同期で補正
+        server_total = result.get('total')
+        if not full and server_total is not None and server_total != stats['total']:
+            return self.sync(full=True)
+
+        return stats
+
+    def sync_if_stale(self) -> Optional[Dict]:
+        """前回の同期からsync_interval秒以上経過していれば差分同期"""
+        if time.time() - self._last_sync_check < self.sync_interval:
+            return None
+        return self.sync()
+
+    def get_companies(self, status: Optional[str] = None, wifi_required: Optional[int] = None) -> pd.DataFrame:
+        """ミラーから企業データを取得（絞り込みはSQLiteの索引で実行）"""
+        conditions = []
+        params = []
+        if status:
+            conditions.append("sales_status = ?")
+            params.append(status)
+        if wifi_required is not None:
+            conditions.append("wifi_required = ?")
+            params.append(int(wifi_required))
+
+        query = "SELECT data FROM companies_mirror"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY last_updated DESC"
+
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+
+        return pd.DataFrame([json.loads(row[0]) for row in rows])
+
+    def write_through(self, action: str, data: Dict) -> Dict:
+        """GASへ書き込み、成功したら差分同期でミラーに反映"""
+        result = self.api.call_api(action, method='POST', data=data)
+        if result and result.get('success'):
+            self.sync()
+        return result
@@ -25,6 +25,26 @@ PICOCELA_KEYWORDS = [
     'platform', 'solution', 'integration', 'control', 'monitoring'
 ]
 
+# WiFi需要判定キーワード（ENRデータ）
+WIFI_INDICATORS = [
+    'wifi', 'wireless', 'network', 'connectivity',
+    'iot', 'smart building', 'construction tech'
+]
+
+# 手動登録時の関連度キーワード（キーワード: 加算点）
+MANUAL_SCORING_KEYWORDS = {
+    'wifi': 15, 'wireless': 15, 'network': 15, 'mesh': 15, 'connectivity': 15,
+    'construction': 20, 'building': 20, 'site': 20, 'manufacturing': 20, 'factory': 20
+}
+
+# 企業説明からの業界推定（上から順に判定）
+INDUSTRY_KEYWORDS = [
+    ('建設業', ['construction', 'building']),
+    ('製造業', ['manufacturing', 'factory']),
+    ('IT・ソフトウェア', ['software', 'ai', 'platform']),
+    ('ネットワーク・通信', ['wifi', 'wireless', 'network'])
+]
+
 # メール設定
 EMAIL_AVAILABLE = True
 EMAIL_ERROR_MESSAGE = ""
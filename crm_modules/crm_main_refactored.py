@@ -28,6 +28,7 @@ try:
         show_company_management,
         show_sidebar_info,
         show_error_handling,
+        show_schema_status,
         render_navigation_menu,
         show_page_header,
         show_quick_stats
@@ -62,6 +63,7 @@ def main():
         
         # サイドバー設定
         show_sidebar_info()
+        show_schema_status(company_manager)
         
         # クイック統計表示
         with st.sidebar:
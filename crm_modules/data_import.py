@@ -8,6 +8,7 @@ import pandas as pd
 import time
 from datetime import datetime
 from .data_processor import DataImportProcessor
+from .dedup_index import DedupIndex
 from .constants import IMPORT_SETTINGS
 
 
@@ -212,6 +213,12 @@ def execute_data_import(df, mapping, company_manager, import_mode, batch_size, a
         st.error("❌ インポート可能なデータがありません")
         return
     
+    # 重複チェック用の索引（既存企業はインポート開始時に1回だけ取得）
+    dedup_index = None
+    if import_mode == "重複チェック（メールアドレス基準）":
+        status_text.text("🔍 既存企業を確認中...")
+        dedup_index = DedupIndex.from_dataframe(company_manager.get_all_companies())
+    
     status_text.text(f"📥 {total_rows}社のデータをインポート中...")
     
     # バッチ処理でインポート
@@ -223,20 +230,18 @@ def execute_data_import(df, mapping, company_manager, import_mode, batch_size, a
                 # 企業データの準備
                 company_data = row.to_dict()
                 
-                # 重複チェック（メールアドレス基準）
-                if import_mode == "重複チェック（メールアドレス基準）" and company_data.get('email'):
-                    # 既存企業の確認
-                    existing_companies = company_manager.get_all_companies()
-                    if not existing_companies.empty and 'email' in existing_companies.columns:
-                        if company_data['email'] in existing_companies['email'].values:
-                            stats['skipped'] += 1
-                            continue
+                # 重複チェック（メールアドレス・ドメイン・企業名の索引で判定）
+                if dedup_index is not None and dedup_index.match(company_data):
+                    stats['skipped'] += 1
+                    continue
                 
                 # 企業追加
                 result = company_manager.add_company(company_data, user_id='data_import')
                 
                 if result:
                     stats['success'] += 1
+                    if dedup_index is not None:
+                        dedup_index.add(company_data)
                 else:
                     stats['failed'] += 1
                     stats['errors'].append(f"企業追加失敗: {company_data.get('company_name', 'Unknown')}")
@@ -4,7 +4,9 @@ fusion_crm_main.pyから抽出
 """
 
 import pandas as pd
-from .constants import PICOCELA_KEYWORDS, IMPORT_SETTINGS
+from .constants import IMPORT_SETTINGS
+from .keyword_matcher import PICOCELA_MATCHER, WIFI_MATCHER, IMPORT_WIFI_MATCHER, IMPORT_SCORING_MATCHER
+from .import_pipeline import build_import_preview
 
 class ENRDataProcessor:
     """ENRデータ処理クラス"""
@@ -12,7 +14,6 @@ class ENRDataProcessor:
     @staticmethod
     def calculate_picocela_relevance(company_data):
         """PicoCELA関連度スコア計算"""
-        score = 0
         text_fields = [
             str(company_data.get('company_name', '')),
             str(company_data.get('website_url', '')),
@@ -22,20 +23,13 @@ class ENRDataProcessor:
         
         full_text = ' '.join(text_fields).lower()
         
-        for keyword in PICOCELA_KEYWORDS:
-            if keyword.lower() in full_text:
-                score += 10
+        score = PICOCELA_MATCHER.score(full_text)
         
         return min(score, 100)
     
     @staticmethod
     def detect_wifi_requirement(company_data):
         """WiFi需要判定"""
-        wifi_indicators = [
-            'wifi', 'wireless', 'network', 'connectivity', 
-            'iot', 'smart building', 'construction tech'
-        ]
-        
         text_fields = [
             str(company_data.get('company_name', '')),
             str(company_data.get('notes', '')),
@@ -44,16 +38,15 @@ class ENRDataProcessor:
         
         full_text = ' '.join(text_fields).lower()
         
-        for indicator in wifi_indicators:
-            if indicator in full_text:
-                return True
-        return False
+        return WIFI_MATCHER.any(full_text)
     
     @staticmethod
-    def calculate_priority_score(company_data):
-        """優先度スコア計算"""
-        relevance = ENRDataProcessor.calculate_picocela_relevance(company_data)
-        wifi_required = ENRDataProcessor.detect_wifi_requirement(company_data)
+    def calculate_priority_score(company_data, relevance=None, wifi_required=None):
+        """優先度スコア計算（計算済みの関連度・WiFi需要を渡すと再計算しない）"""
+        if relevance is None:
+            relevance = ENRDataProcessor.calculate_picocela_relevance(company_data)
+        if wifi_required is None:
+            wifi_required = ENRDataProcessor.detect_wifi_requirement(company_data)
         
         priority = relevance
         if wifi_required:
@@ -82,8 +75,6 @@ class DataImportProcessor:
     @staticmethod
     def detect_wifi_need_from_data(company_data):
         """データからWiFi需要を判定"""
-        wifi_indicators = IMPORT_SETTINGS['wifi_indicators']
-        
         text_fields = [
             company_data.get('company_name', ''),
             company_data.get('notes', ''),
@@ -92,18 +83,11 @@ class DataImportProcessor:
         
         full_text = ' '.join(text_fields).lower()
         
-        for indicator in wifi_indicators:
-            if indicator in full_text:
-                return 1
-        
-        return 0
+        return 1 if IMPORT_WIFI_MATCHER.any(full_text) else 0
     
     @staticmethod
     def calculate_picocela_relevance_from_data(company_data):
         """データからPicoCELA関連度を計算"""
-        score = 0
-        keywords = IMPORT_SETTINGS['scoring_keywords']
-        
         text_fields = [
             company_data.get('company_name', ''),
             company_data.get('notes', ''),
@@ -112,9 +96,7 @@ class DataImportProcessor:
         
         full_text = ' '.join(text_fields).lower()
         
-        for keyword, points in keywords.items():
-            if keyword in full_text:
-                score += points
+        score = IMPORT_SCORING_MATCHER.score(full_text)
         
         return min(score, 100)
     
@@ -138,7 +120,12 @@ class DataImportProcessor:
     
     @staticmethod
     def create_import_preview(df, mapping, auto_wifi_detection, auto_picocela_scoring):
-        """インポートプレビューデータの作成"""
+        """インポートプレビューデータの作成（列単位で一括処理）"""
+        return build_import_preview(df, mapping, auto_wifi_detection, auto_picocela_scoring)
+    
+    @staticmethod
+    def create_import_preview_rows(df, mapping, auto_wifi_detection, auto_picocela_scoring):
+        """インポートプレビューデータの作成（行単位の従来実装、同一性確認用）"""
         preview_data = []
         
         for _, row in df.iterrows():
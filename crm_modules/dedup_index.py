@@ -0,0 +1,138 @@
+"""
+インポート用の重複判定インデックス
+既存企業のメールアドレス・ドメイン・正規化した企業名をインポート開始時に1回だけ索引化し、
+追加した行も索引に反映する（行ごとに全企業を取得しない）
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, Optional, Set
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+
+# ドメインでは企業を特定できないフリーメール等
+SHARED_EMAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'yahoo.co.jp', 'ymail.com', 'hotmail.com',
+    'hotmail.co.jp', 'outlook.com', 'outlook.jp', 'live.com', 'live.jp', 'msn.com', 'icloud.com',
+    'me.com', 'mac.com', 'aol.com', 'protonmail.com', 'proton.me', 'gmx.com', 'mail.com',
+    'docomo.ne.jp', 'ezweb.ne.jp', 'au.com', 'softbank.ne.jp', 'i.softbank.jp', 'nifty.com'
+}
+
+# 企業名の比較で無視する法人格
+LEGAL_SUFFIXES = re.compile(
+    r'株式会社|有限会社|合同会社|合資会社|合名会社|\(株\)|\(有\)|'
+    r'\b(?:incorporated|inc|corporation|corp|company|co|limited|ltd|llc|llp|plc|gmbh|kk)\b\.?'
+)
+NAME_NOISE = re.compile(r'[\W_]+')
+
+# 判定理由（一致したキーの種類）
+MATCH_EMAIL = 'email'
+MATCH_DOMAIN = 'domain'
+MATCH_NAME = 'name'
+
+
+def _text(value) -> str:
+    if value is None:
+        return ''
+    try:
+        if pd.isna(value):
+            return ''
+    except (TypeError, ValueError):
+        pass
+    return str(value).strip()
+
+
+def normalize_email(email) -> str:
+    """前後の空白・mailto:・山括弧を除去して小文字化"""
+    email = _text(email).lower()
+    if email.startswith('mailto:'):
+        email = email[len('mailto:'):]
+    return email.strip(' <>"\'')
+
+
+def email_domain(email) -> str:
+    """メールアドレスのドメイン（小文字化）"""
+    email = normalize_email(email)
+    if '@' not in email:
+        return ''
+    return email.rsplit('@', 1)[1]
+
+
+def website_domain(url) -> str:
+    """ウェブサイトURLのホスト名（www.を除去）"""
+    url = _text(url).lower()
+    if not url:
+        return ''
+    if '//' not in url:
+        url = '//' + url
+    host = urlsplit(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def normalize_company_name(name) -> str:
+    """全角・半角、大文字・小文字、法人格、記号の違いを無視した企業名"""
+    name = unicodedata.normalize('NFKC', _text(name)).lower()
+    name = LEGAL_SUFFIXES.sub(' ', name)
+    return NAME_NOISE.sub('', name)
+
+
+def company_domains(company: Dict) -> Set[str]:
+    """企業を特定できるドメイン（ウェブサイトと、フリーメール以外のメールアドレス）"""
+    domains = set()
+    site = website_domain(company.get('website_url') or company.get('website'))
+    if site:
+        domains.add(site)
+    mail = email_domain(company.get('email'))
+    if mail and mail not in SHARED_EMAIL_DOMAINS:
+        domains.add(mail)
+    return domains
+
+
+class DedupIndex:
+    """メールアドレス・ドメイン・企業名のハッシュ索引（判定・追加とも1行あたりO(1)）"""
+
+    def __init__(self, companies: Optional[Iterable[Dict]] = None):
+        self.emails: Set[str] = set()
+        self.domains: Set[str] = set()
+        self.names: Set[str] = set()
+        for company in companies or []:
+            self.add(company)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "DedupIndex":
+        """既存企業のDataFrameから作成（バックエンドの版によりname/company_name、website/website_url）"""
+        index = cls()
+        if df is None or df.empty:
+            return index
+        columns = [column for column in ('company_name', 'name', 'email', 'website_url', 'website')
+                   if column in df.columns]
+        for company in df[columns].to_dict('records'):
+            index.add(company)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names) + len(self.emails)
+
+    def match(self, company: Dict) -> Optional[str]:
+        """既存企業と重複していれば一致したキーの種類、なければNone"""
+        email = normalize_email(company.get('email'))
+        if email and email in self.emails:
+            return MATCH_EMAIL
+        if not self.domains.isdisjoint(company_domains(company)):
+            return MATCH_DOMAIN
+        name = normalize_company_name(company.get('company_name') or company.get('name'))
+        if name and name in self.names:
+            return MATCH_NAME
+        return None
+
+    def add(self, company: Dict):
+        """追加した企業を索引に反映（同じファイル内の重複も検出するため）"""
+        email = normalize_email(company.get('email'))
+        if email:
+            self.emails.add(email)
+        self.domains.update(company_domains(company))
+        name = normalize_company_name(company.get('company_name') or company.get('name'))
+        if name:
+            self.names.add(name)
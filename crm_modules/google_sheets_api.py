@@ -8,14 +8,61 @@ import requests
 import json
 import time
 
+import modules  # noqa: F401  modules/をsys.pathに追加
+# 他のモジュールと同じ名前で読み込む（modules.retry_policyとは別モジュールになり例外クラスが一致しない）
+from retry_policy import (
+    HTTP_RETRY_POLICY, PERMANENT, THROTTLE, PermanentError,
+    classify_exception, classify_http_status
+)
+
+# GAS呼び出し用コネクションプール（script.google.com・googleusercontent.com双方の接続を再利用）
+DEFAULT_POOL_SIZE = 10
+
+
+def create_gas_session(pool_size=DEFAULT_POOL_SIZE):
+    """Keep-Alive・gzip対応のプール付きセッションを作成"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+    return session
+
+
 class GoogleSheetsAPI:
     """Google Sheets API（Google Apps Script経由）- 完全修正版"""
     
-    def __init__(self, gas_url):
+    def __init__(self, gas_url, session=None, pool_size=DEFAULT_POOL_SIZE):
         self.gas_url = gas_url
+        self.session = session or create_gas_session(pool_size)
+        self._redirects = {}  # 恒久リダイレクト（301/308）の転送先
         self._connection_tested = False
         self._connection_status = "未テスト"
     
+    def _resolve_url(self, url):
+        """キャッシュ済みの恒久リダイレクト先を返す"""
+        return self._redirects.get(url, url)
+    
+    def _remember_redirects(self, url, response):
+        """恒久リダイレクトを記録（GASの302は応答ごとに異なるため記録しない）"""
+        for hop in response.history:
+            if hop.status_code in (301, 308) and hop.headers.get('Location'):
+                self._redirects[url] = requests.compat.urljoin(hop.url, hop.headers['Location'])
+                break
+    
+    def _get(self, url, **kwargs):
+        response = self.session.get(self._resolve_url(url), **kwargs)
+        self._remember_redirects(url, response)
+        return response
+    
+    def _post(self, url, **kwargs):
+        response = self.session.post(self._resolve_url(url), **kwargs)
+        self._remember_redirects(url, response)
+        return response
+    
     def _lazy_test_connection(self):
         """遅延接続テスト（実際の使用時に実行）"""
         if self._connection_tested:
@@ -23,7 +70,7 @@ class GoogleSheetsAPI:
             
         try:
             # シンプルなPOSTリクエストでテスト
-            response = requests.post(
+            response = self._post(
                 self.gas_url,
                 json={"action": "init_database"},
                 headers={'Content-Type': 'application/json'},
@@ -44,16 +91,36 @@ class GoogleSheetsAPI:
     
     def call_api(self, action, method='GET', data=None):
         """API呼び出しの共通メソッド（完全修正版）"""
-        try:
+        def send():
             if method == 'GET':
-                response = requests.get(f"{self.gas_url}?action={action}", timeout=30)
+                response = self._get(f"{self.gas_url}?action={action}", timeout=30)
             else:
-                response = requests.post(
+                response = self._post(
                     self.gas_url,
                     json={"action": action, **data} if data else {"action": action},
                     headers={'Content-Type': 'application/json'},
                     timeout=30
                 )
+            # 一時エラー・レート制限の応答はリトライ対象として例外化
+            if response.status_code >= 400 and classify_http_status(response.status_code) != PERMANENT:
+                raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+            return response
+        
+        def classify(error):
+            # POSTは非冪等のため、未実行が明らかなレート制限応答のみ再送
+            error_class = classify_exception(error)
+            if method != 'GET' and error_class != THROTTLE:
+                return PERMANENT
+            return error_class
+        
+        try:
+            try:
+                response = HTTP_RETRY_POLICY.call(send, classify=classify)
+            except (PermanentError, requests.exceptions.HTTPError) as e:
+                cause = e.cause if isinstance(e, PermanentError) else e
+                if not isinstance(cause, requests.exceptions.HTTPError):
+                    raise cause
+                response = cause.response
             
             # レスポンス確認
             if response.status_code != 200:
@@ -87,6 +154,12 @@ class GoogleSheetsAPI:
             return {"success": False, "error": str(e)}
 
 
+@st.cache_resource
+def get_shared_google_sheets_api(gas_url, pool_size=DEFAULT_POOL_SIZE):
+    """GAS URLごとにプロセス内で1つのAPIオブジェクト（接続プール）を共有"""
+    return GoogleSheetsAPI(gas_url, pool_size=pool_size)
+
+
 def get_google_sheets_api():
     """Google Sheets API取得（完全修正版）"""
     
@@ -95,7 +168,7 @@ def get_google_sheets_api():
         gas_url = st.secrets['google_apps_script_url']
         try:
             # 接続テストなしでAPIオブジェクトを作成
-            api = GoogleSheetsAPI(gas_url)
+            api = get_shared_google_sheets_api(gas_url)
             st.session_state.gas_url = gas_url
             return api
         except Exception as e:
@@ -105,7 +178,7 @@ def get_google_sheets_api():
     elif 'gas_url' in st.session_state:
         gas_url = st.session_state.gas_url
         try:
-            return GoogleSheetsAPI(gas_url)
+            return get_shared_google_sheets_api(gas_url)
         except Exception as e:
             st.error(f"保存済みURL初期化エラー: {str(e)}")
             del st.session_state.gas_url
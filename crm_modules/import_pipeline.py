@@ -0,0 +1,249 @@
+"""
+インポートプレビューの列単位処理
+カラムマッピング・欠損値の空文字化・WiFi需要判定・PicoCELA関連度・優先度スコアを
+行ごとの辞書を作らずに列単位で計算する（結果は行単位の従来実装と同一）
+
+計測・同一性の確認:
+    python -m crm_modules.import_pipeline 10000 100000
+"""
+
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .constants import IMPORT_SETTINGS
+from .keyword_matcher import KeywordMatcher, get_keyword_matcher
+
+
+# スコアリングに使う項目（従来実装と同じ順序で空白区切りに連結して判定）
+SCORING_FIELDS = ['company_name', 'notes', 'industry']
+
+
+def _column_text(column: pd.Series, row_dtype) -> np.ndarray:
+    """1列をiterrows()で取り出した値のstr()と同じ文字列に変換（欠損値は空文字）"""
+    # iterrows()は全列の共通型に揃えてから値を取り出す（数値のみのファイルでは整数も小数になる）
+    source = column if row_dtype == object or column.dtype == row_dtype else column.astype(row_dtype)
+    if isinstance(source.dtype, np.dtype) and source.dtype.kind in 'iub':
+        # 整数・真偽値は欠損値を持たない。Pythonの値に変換してからstr()（numpyの文字列変換より速い）
+        return np.array(list(map(str, source.to_numpy().tolist())), dtype=object)
+
+    values = source.to_numpy(dtype=object)
+    if pd.api.types.infer_dtype(values, skipna=False) == 'string':
+        return values
+    missing = pd.isna(values)
+    if pd.api.types.infer_dtype(values, skipna=True) != 'string':
+        values = np.array([str(value) for value in values], dtype=object)
+    values[missing] = ''
+    return values
+
+
+def _mapped_text(df: pd.DataFrame, mapping: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """マッピングした列を文字列化（欠損値は空文字）"""
+    row_dtype = df.iloc[:0].values.dtype
+    return {fusion_col: _column_text(df[file_col], row_dtype)
+            for fusion_col, file_col in mapping.items() if file_col in df.columns}
+
+
+def _full_text(text: Dict[str, np.ndarray], length: int) -> np.ndarray:
+    """スコアリング用の連結テキスト（小文字化）"""
+    empty = np.full(length, '', dtype=object)
+    parts = [text.get(field, empty) for field in SCORING_FIELDS]
+    return np.array([' '.join(values).lower() for values in zip(*parts)], dtype=str)
+
+
+def keyword_hits(text: Dict[str, np.ndarray], length: int, matcher: KeywordMatcher) -> Dict[str, np.ndarray]:
+    """キーワードごとの出現有無（連結テキストに含まれるか）
+
+    空白を含まないキーワードは区切りの空白をまたいで一致しないため、項目ごとに
+    重複を除いた値だけを照合して結果を各行に展開する（業界・備考は種類が少ない）
+    """
+    hits = {keyword: np.zeros(length, dtype=bool) for keyword in matcher.weights}
+    spanning = [keyword for keyword in hits if ' ' in keyword]
+    for field in SCORING_FIELDS:
+        if field not in text:
+            continue
+        values = text[field]
+        if len(pd.unique(values[:1000])) > 500:
+            # 種類が多い項目（企業名）は項目全体を1回照合し、含まれるキーワードのみ値ごとに検索
+            present = [keyword for keyword in matcher.find('\n'.join(values).lower()) if keyword not in spanning]
+            if not present:
+                continue
+            codes, uniques = pd.factorize(values)
+            searchable = np.array([value.lower() for value in uniques], dtype=str)
+            for keyword in present:
+                hits[keyword] |= (np.char.find(searchable, keyword) >= 0)[codes]
+            continue
+
+        codes, uniques = pd.factorize(values)
+        found = np.zeros((len(uniques), len(hits)), dtype=bool)
+        positions = {keyword: position for position, keyword in enumerate(hits)}
+        for row, value in enumerate(uniques):
+            for keyword in matcher.find(value.lower()):
+                if keyword not in spanning:
+                    found[row, positions[keyword]] = True
+        for keyword, position in positions.items():
+            if found[:, position].any():
+                hits[keyword] |= found[codes, position]
+    if spanning:
+        full_text = _full_text(text, length)
+        for keyword in spanning:
+            hits[keyword] = np.char.find(full_text, keyword) >= 0
+    return hits
+
+
+def detect_wifi_need(hits: Dict[str, np.ndarray], length: int, wifi_indicators: Sequence[str]) -> np.ndarray:
+    """WiFi需要（いずれかの指標を含めば1）"""
+    found = np.zeros(length, dtype=bool)
+    for indicator in wifi_indicators:
+        found |= hits[indicator]
+    return found.astype(np.int64)
+
+
+def calculate_relevance(hits: Dict[str, np.ndarray], length: int, scoring_keywords: Dict[str, int]) -> np.ndarray:
+    """PicoCELA関連度（含まれるキーワードの点数の合計、上限100）"""
+    score = np.zeros(length, dtype=np.int64)
+    for keyword, points in scoring_keywords.items():
+        score += hits[keyword] * points
+    return np.minimum(score, 100)
+
+
+def build_import_preview(df: pd.DataFrame, mapping: Dict[str, str], auto_wifi_detection: bool,
+                         auto_picocela_scoring: bool, wifi_indicators: Optional[Sequence[str]] = None,
+                         scoring_keywords: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """インポートプレビューデータを列単位で作成（DataImportProcessor.create_import_previewと同じ結果）"""
+    if wifi_indicators is None:
+        wifi_indicators = IMPORT_SETTINGS['wifi_indicators']
+    if scoring_keywords is None:
+        scoring_keywords = IMPORT_SETTINGS['scoring_keywords']
+
+    text = _mapped_text(df, mapping)
+
+    # 必須フィールド（企業名）が空の行を除外
+    if 'company_name' not in text:
+        return pd.DataFrame([])
+    keep = text['company_name'].astype(bool)
+    if not keep.any():
+        return pd.DataFrame([])
+    length = int(keep.sum())
+    if length < len(keep):
+        text = {field: values[keep] for field, values in text.items()}
+
+    # 判定・スコアリングに使うキーワードは1回ずつだけ照合
+    keywords = list(dict.fromkeys(list(wifi_indicators if auto_wifi_detection else [])
+                                  + list(scoring_keywords if auto_picocela_scoring else [])))
+    hits = keyword_hits(text, length, get_keyword_matcher(keywords))
+    zeros = np.zeros(length, dtype=np.int64)
+    wifi_required = detect_wifi_need(hits, length, wifi_indicators) if auto_wifi_detection else zeros
+    relevance = calculate_relevance(hits, length, scoring_keywords) if auto_picocela_scoring else zeros
+
+    # 優先度: 関連度 + WiFi需要50 + メールアドレス10 + ウェブサイト5（上限150）
+    priority = relevance + wifi_required * 50
+    for field, bonus in (('email', 10), ('website_url', 5)):
+        if field in text:
+            priority = priority + text[field].astype(bool) * bonus
+    priority = np.minimum(priority, 150)
+
+    columns = dict(text)
+    columns['wifi_required'] = wifi_required
+    columns['picocela_relevance_score'] = relevance
+    columns['priority_score'] = priority
+    columns['sales_status'] = np.full(length, 'New', dtype=object)
+    columns.setdefault('source', np.full(length, 'Data Import', dtype=object))
+
+    # 型推論は列ごとに行う（行の辞書からDataFrameを作った場合と同じ型にする）
+    return pd.DataFrame({name: pd.Series(values).infer_objects() for name, values in columns.items()})
+
+
+def compare_import_previews(expected: pd.DataFrame, actual: pd.DataFrame) -> List[str]:
+    """2つのプレビュー結果の差分（同一なら空リスト）"""
+    try:
+        pd.testing.assert_frame_equal(expected, actual)
+    except AssertionError as e:
+        return [str(e)]
+    return []
+
+
+def verify_import_preview(df: pd.DataFrame, mapping: Dict[str, str], reference: Callable,
+                          **keywords) -> List[str]:
+    """自動判定・自動スコアリングの全組み合わせで、行単位の実装referenceと結果が同一か確認"""
+    problems = []
+    for auto_wifi in (True, False):
+        for auto_picocela in (True, False):
+            expected = reference(df, mapping, auto_wifi, auto_picocela)
+            actual = build_import_preview(df, mapping, auto_wifi, auto_picocela, **keywords)
+            for problem in compare_import_previews(expected, actual):
+                problems.append(f"auto_wifi={auto_wifi}, auto_picocela={auto_picocela}: {problem}")
+    return problems
+
+
+def _sample_enr(count: int) -> pd.DataFrame:
+    """計測用のENR形式データ（欠損値・数値列・企業名なしの行を含む）"""
+    rng = np.random.default_rng(0)
+    descriptions = [
+        "General contractor for industrial and commercial building projects",
+        "Smart building automation and IoT sensor integration",
+        "Wireless mesh network deployment for construction sites",
+        "Heavy civil construction", "", None,
+    ]
+    return pd.DataFrame({
+        'Rank': np.arange(1, count + 1),
+        'Company Name': [f"ENR Company {i}" if i % 50 else None for i in range(count)],
+        'City': rng.choice(['New York', 'Chicago', 'Houston', 'Tokyo', 'Osaka'], count),
+        'State': rng.choice(['NY', 'IL', 'TX', None], count),
+        'Email Address': [f"info{i}@enr{i}.example.com" if i % 3 else None for i in range(count)],
+        'Phone': rng.integers(1000000, 9999999, count),
+        'Website': [f"https://enr{i}.example.com" if i % 4 else "" for i in range(count)],
+        'Sector': rng.choice(['Construction', 'Industrial', 'Networking', 'WiFi Services'], count),
+        'Description': [descriptions[i % len(descriptions)] for i in range(count)],
+        'Revenue ($ Mil)': rng.random(count) * 1000,
+        'International Revenue ($ Mil)': rng.random(count) * 100,
+        'New Contracts ($ Mil)': rng.random(count) * 500,
+        'Employees': rng.integers(10, 50000, count),
+    })
+
+
+def benchmark_import_preview(row_counts: Sequence[int] = (10000, 100000), repeat: int = 3) -> List[Dict]:
+    """行単位の従来実装と列単位処理の実行時間を計測し、結果の同一性を確認"""
+    from .data_processor import DataImportProcessor
+
+    results = []
+    for count in row_counts:
+        df = _sample_enr(count)
+        mapping = DataImportProcessor.suggest_column_mapping(df.columns.tolist())
+
+        started = time.perf_counter()
+        expected = DataImportProcessor.create_import_preview_rows(df, mapping, True, True)
+        rows_seconds = time.perf_counter() - started
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            actual = build_import_preview(df, mapping, True, True)
+            timings.append(time.perf_counter() - started)
+
+        results.append({
+            'rows': count,
+            'rows_ms': round(rows_seconds * 1000, 1),
+            'vectorized_ms': round(min(timings) * 1000, 1),
+            'speedup': round(rows_seconds / min(timings), 1),
+            'identical': not compare_import_previews(expected, actual),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    from .data_processor import DataImportProcessor
+
+    sample = _sample_enr(2000)
+    problems = verify_import_preview(sample, DataImportProcessor.suggest_column_mapping(sample.columns.tolist()),
+                                     DataImportProcessor.create_import_preview_rows)
+    print("同一性: OK" if not problems else "\n".join(problems))
+
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'行数':>8} {'従来(ms)':>10} {'列単位(ms)':>10} {'倍率':>8} {'同一':>6}")
+    for row in benchmark_import_preview(counts):
+        print(f"{row['rows']:>8} {row['rows_ms']:>10.1f} {row['vectorized_ms']:>10.1f} "
+              f"{row['speedup']:>8.1f} {str(row['identical']):>6}")
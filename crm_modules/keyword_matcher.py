@@ -0,0 +1,154 @@
+"""
+キーワード照合モジュール
+重み付きキーワード一覧を照合器に1回だけコンパイルしてキャッシュし、全てのスコアリング処理で共有する
+1回の呼び出しで一致した全キーワードと重みを返す
+
+判定は従来の `keyword in text` と同じ（重なり合う一致も検出、大文字小文字は呼び出し側で統一）
+数十語程度のキーワードでは、交互パターンの正規表現（先読みで重なりも検出）による1回の走査は
+CPythonではキーワードごとの部分文字列検索（C実装）より5〜10倍遅いため、照合は部分文字列検索で行う
+
+計測:
+    python -m crm_modules.keyword_matcher
+"""
+
+import re
+import time
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple, Union
+
+from .constants import (
+    IMPORT_SETTINGS, INDUSTRY_KEYWORDS, MANUAL_SCORING_KEYWORDS, PICOCELA_KEYWORDS, WIFI_INDICATORS
+)
+
+
+class KeywordMatcher:
+    """重み付きキーワードの照合器（1回の呼び出しで全ての一致キーワードを返す）"""
+
+    def __init__(self, weights: Dict[str, int]):
+        self.weights = dict(weights)
+        self._items: Tuple[Tuple[str, int], ...] = tuple(self.weights.items())
+
+    def find(self, text: str) -> List[str]:
+        """textに含まれるキーワード（登録順）"""
+        return [keyword for keyword, _ in self._items if keyword in text]
+
+    def hits(self, text: str) -> Dict[str, int]:
+        """textに含まれるキーワードとその重み"""
+        return {keyword: weight for keyword, weight in self._items if keyword in text}
+
+    def score(self, text: str) -> int:
+        """textに含まれるキーワードの重みの合計"""
+        return sum([weight for keyword, weight in self._items if keyword in text])
+
+    def any(self, text: str) -> bool:
+        """いずれかのキーワードを含むか（最初の一致で終了）"""
+        for keyword, _ in self._items:
+            if keyword in text:
+                return True
+        return False
+
+
+@lru_cache(maxsize=None)
+def _compile(items: Tuple[Tuple[str, int], ...]) -> KeywordMatcher:
+    weights: Dict[str, int] = {}
+    for keyword, weight in items:
+        # 重複したキーワードは従来のループと同じく重みを加算
+        weights[keyword] = weights.get(keyword, 0) + weight
+    return KeywordMatcher(weights)
+
+
+def get_keyword_matcher(keywords: Union[Dict[str, int], Sequence[str]], weight: int = 1,
+                        lower: bool = False) -> KeywordMatcher:
+    """キーワード一覧（またはキーワード→重みの辞書）からコンパイル済みの照合器を取得
+
+    同じ内容の一覧に対してはキャッシュした照合器を返す（定数を変更した場合は自動的に再コンパイル）
+    """
+    if isinstance(keywords, dict):
+        items = tuple(keywords.items())
+    else:
+        items = tuple((keyword, weight) for keyword in keywords)
+    if lower:
+        items = tuple((keyword.lower(), value) for keyword, value in items)
+    return _compile(items)
+
+
+# 定数のキーワード一覧から1回だけコンパイルした照合器（各スコアリング処理で共有）
+PICOCELA_MATCHER = get_keyword_matcher(PICOCELA_KEYWORDS, weight=10, lower=True)
+WIFI_MATCHER = get_keyword_matcher(WIFI_INDICATORS)
+IMPORT_WIFI_MATCHER = get_keyword_matcher(IMPORT_SETTINGS['wifi_indicators'])
+IMPORT_SCORING_MATCHER = get_keyword_matcher(IMPORT_SETTINGS['scoring_keywords'])
+MANUAL_SCORING_MATCHER = get_keyword_matcher(MANUAL_SCORING_KEYWORDS)
+INDUSTRY_MATCHER = get_keyword_matcher([keyword for _, keywords in INDUSTRY_KEYWORDS for keyword in keywords])
+
+
+def estimate_industry(description, default: str = 'その他') -> str:
+    """企業説明から業界を推定（INDUSTRY_KEYWORDSの上から順に、キーワードを含む最初の業界）"""
+    found = set(INDUSTRY_MATCHER.find(str(description).lower()))
+    for industry, keywords in INDUSTRY_KEYWORDS:
+        if found.intersection(keywords):
+            return industry
+    return default
+
+
+def _regex_scores(keywords: Dict[str, int], texts: Sequence[str]) -> List[int]:
+    """比較用: 交互パターンの正規表現1回の走査でスコア計算（先読みで重なりも検出）"""
+    layers: List[List[str]] = []
+    for keyword in sorted(keywords, key=len, reverse=True):
+        # 一方が他方の先頭部分となるキーワードは同じ位置で1つしか一致しないため別パターンにする
+        for layer in layers:
+            if not any(other.startswith(keyword) or keyword.startswith(other) for other in layer):
+                layer.append(keyword)
+                break
+        else:
+            layers.append([keyword])
+    patterns = [re.compile('(?=(' + '|'.join(map(re.escape, layer)) + '))') for layer in layers]
+    scores = []
+    for text in texts:
+        found = set()
+        for pattern in patterns:
+            found.update(pattern.findall(text))
+        scores.append(sum(keywords[keyword] for keyword in found))
+    return scores
+
+
+def benchmark_matcher(keywords: Dict[str, int], texts: Sequence[str], repeat: int = 3) -> Dict:
+    """正規表現1回の走査と照合器のスコア計算時間を比較（結果の同一性も確認）"""
+    matcher = get_keyword_matcher(keywords)
+    runs = {
+        'regex': lambda: _regex_scores(keywords, texts),
+        'matcher': lambda: [matcher.score(text) for text in texts],
+    }
+
+    timings = {}
+    for name, run in runs.items():
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            scores = run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = (best, scores)
+
+    return {
+        'texts': len(texts),
+        'keywords': len(keywords),
+        'regex_ms': round(timings['regex'][0] * 1000, 1),
+        'matcher_ms': round(timings['matcher'][0] * 1000, 1),
+        'identical': timings['regex'][1] == timings['matcher'][1],
+    }
+
+
+if __name__ == "__main__":
+    samples = [
+        "Turner Construction General contractor for industrial and commercial building projects",
+        "Smart building automation and IoT sensor integration platform",
+        "Wireless mesh network deployment for construction sites with WiFi monitoring",
+        "Regional law firm",
+    ]
+    for length in (100, 1000):
+        texts = [(sample * (length // len(sample) + 1))[:length].lower() for sample in samples] * 2500
+        for name, keywords in (('PICOCELA_KEYWORDS', {keyword: 10 for keyword in PICOCELA_KEYWORDS}),
+                               ('scoring_keywords', IMPORT_SETTINGS['scoring_keywords'])):
+            result = benchmark_matcher(keywords, texts)
+            print(f"{name:<18} 文字数{length:>5} 件数{result['texts']:>6} "
+                  f"正規表現{result['regex_ms']:>8.1f}ms 照合器{result['matcher_ms']:>8.1f}ms 同一:{result['identical']}")
@@ -0,0 +1,498 @@
+"""
+書き込みジャーナル（オフラインファースト）
+企業追加・ステータス更新をSQLiteに追記して即座に受け付け、
+バックグラウンドでGASへまとめて再送（冪等キー・バッチIDで二重反映を防止）
+読み込み時は未送信の書き込みを重ねて表示する
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+import requests
+
+from modules.gas_batch_uploader import GasBatchUploader
+# アップローダーと同じモジュール名で読み込む（modules.retry_policyとして読むと別モジュールになり、
+# アップローダーが送出したBackendErrorを恒久エラーと判定できない）
+from retry_policy import PERMANENT, BackendError, classify_exception
+
+
+# 書き込みの種類
+ADD_COMPANY = 'add_company'
+UPDATE_STATUS = 'update_status'
+
+# 状態
+PENDING = 'pending'
+APPLIED = 'applied'
+FAILED = 'failed'
+
+# 再送間隔（秒）と、接続できない間の最大待機時間（秒）
+DEFAULT_REPLAY_INTERVAL = 5
+MAX_REPLAY_BACKOFF = 300
+
+# 恒久エラーで失敗扱いにするまでの試行回数と、ステータス更新の1回あたり件数
+MAX_PERMANENT_ATTEMPTS = 3
+STATUS_BATCH_SIZE = 500
+
+# 反映済みの記録を保持する日数
+APPLIED_RETENTION_DAYS = 7
+
+LOCAL_ID_PREFIX = 'LOCAL_'
+REQUEST_TIMEOUT = 60
+
+# 同じDB・送信先のジャーナルが複数あっても再送は1つずつ実行
+_replay_locks: Dict[tuple, threading.Lock] = {}
+_replay_locks_guard = threading.Lock()
+
+
+def _get_replay_lock(db_path: str, gas_url: str) -> threading.Lock:
+    with _replay_locks_guard:
+        return _replay_locks.setdefault((db_path, gas_url), threading.Lock())
+
+
+def is_local_id(company_id) -> bool:
+    """未送信の企業に付与した仮IDか"""
+    return str(company_id or '').startswith(LOCAL_ID_PREFIX)
+
+
+class MutationJournal:
+    """GASへの書き込みを記録・再送するジャーナル（スレッドセーフ）"""
+
+    def __init__(self, gas_url: str, session=None, db_path: str = "fusion_crm_journal.db",
+                 replay_interval: float = DEFAULT_REPLAY_INTERVAL, headers: Optional[Dict] = None,
+                 uploader: Optional[GasBatchUploader] = None):
+        self.gas_url = gas_url
+        self.session = session or requests
+        self.db_path = db_path
+        self.replay_interval = replay_interval
+        self.headers = headers or {'Content-Type': 'application/json'}
+        self.uploader = uploader or GasBatchUploader(gas_url, session=self.session, headers=self.headers)
+        # 反映後に呼ぶ処理（ミラー同期・キャッシュ失効など）
+        self.on_applied: Optional[Callable[[], None]] = None
+        self.last_error: Optional[str] = None
+        self._replay_lock = _get_replay_lock(db_path, gas_url)
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """ジャーナルテーブルを作成"""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS mutation_journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT UNIQUE,
+                endpoint TEXT,
+                kind TEXT,
+                company_id TEXT,
+                payload TEXT,
+                state TEXT DEFAULT 'pending',
+                batch_id TEXT,
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                remote_id TEXT,
+                created_at TEXT,
+                applied_at TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_journal_state ON mutation_journal(endpoint, state, seq)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_journal_company ON mutation_journal(company_id)")
+
+        conn.commit()
+        conn.close()
+
+    # ---- 記録 ----
+
+    def _append(self, entries: List[Dict]) -> List[str]:
+        """1トランザクションで追記（同じ冪等キーは1回だけ記録）"""
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        conn.executemany("""
+            INSERT OR IGNORE INTO mutation_journal (idempotency_key, endpoint, kind, company_id, payload, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(e['key'], self.gas_url, e['kind'], e['company_id'],
+               json.dumps(e['payload'], ensure_ascii=False, default=str), now)
+              for e in entries])
+        conn.commit()
+        conn.close()
+        self._wake.set()
+        return [e['company_id'] for e in entries]
+
+    def record_add_companies(self, companies: List[Dict],
+                             idempotency_keys: Optional[List[str]] = None) -> List[str]:
+        """企業追加を記録し、仮IDを返す"""
+        keys = idempotency_keys or [uuid.uuid4().hex for _ in companies]
+        return self._append([
+            {'key': key, 'kind': ADD_COMPANY, 'company_id': LOCAL_ID_PREFIX + key[:16], 'payload': dict(company)}
+            for key, company in zip(keys, companies)
+        ])
+
+    def record_add_company(self, company_data: Dict, idempotency_key: Optional[str] = None) -> str:
+        return self.record_add_companies([company_data], [idempotency_key] if idempotency_key else None)[0]
+
+    def record_status_updates(self, company_ids: List[str], new_status: str, note: str = "",
+                              idempotency_key: Optional[str] = None) -> int:
+        """ステータス更新を記録（仮IDの企業は追加の反映後に送信）"""
+        base_key = idempotency_key or uuid.uuid4().hex
+        self._append([
+            {'key': f"{base_key}:{i}" if len(company_ids) > 1 else base_key, 'kind': UPDATE_STATUS,
+             'company_id': str(company_id), 'payload': {'new_status': new_status, 'note': note}}
+            for i, company_id in enumerate(company_ids)
+        ])
+        return len(company_ids)
+
+    def record_status_update(self, company_id: str, new_status: str, note: str = "",
+                             idempotency_key: Optional[str] = None) -> int:
+        return self.record_status_updates([company_id], new_status, note, idempotency_key)
+
+    # ---- 参照 ----
+
+    def pending(self, include_failed: bool = False) -> List[Dict]:
+        """未送信の書き込み（記録順）"""
+        states = (PENDING, FAILED) if include_failed else (PENDING,)
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT * FROM mutation_journal WHERE endpoint = ? AND state IN ({','.join('?' * len(states))}) "
+            f"ORDER BY seq",
+            (self.gas_url,) + states
+        ).fetchall()
+        conn.close()
+        return [dict(row, payload=json.loads(row['payload'])) for row in rows]
+
+    def failed(self) -> List[Dict]:
+        return [entry for entry in self.pending(include_failed=True) if entry['state'] == FAILED]
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connect()
+        rows = conn.execute("SELECT state, COUNT(*) FROM mutation_journal WHERE endpoint = ? GROUP BY state",
+                            (self.gas_url,)).fetchall()
+        conn.close()
+        counts = {PENDING: 0, APPLIED: 0, FAILED: 0}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def _remote_ids(self, local_ids: List[str]) -> Dict[str, str]:
+        """反映済みの仮ID → シート上のID"""
+        local_ids = list(dict.fromkeys(local_ids))
+        remote_ids = {}
+        conn = self._connect()
+        # SQLiteのパラメータ数上限に収まるよう分割して照会
+        for start in range(0, len(local_ids), STATUS_BATCH_SIZE):
+            chunk = local_ids[start:start + STATUS_BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT company_id, remote_id FROM mutation_journal WHERE endpoint = ? AND kind = ? "
+                f"AND remote_id IS NOT NULL AND company_id IN ({','.join('?' * len(chunk))})",
+                [self.gas_url, ADD_COMPANY] + chunk
+            ).fetchall()
+            remote_ids.update({row['company_id']: row['remote_id'] for row in rows})
+        conn.close()
+        return remote_ids
+
+    def overlay_records(self, records: List[Dict], normalize: Optional[Callable[[List[Dict]], List[Dict]]] = None,
+                        id_key: str = 'company_id', status_key: str = 'sales_status',
+                        flag_key: Optional[str] = 'pending_sync') -> List[Dict]:
+        """取得済みデータに未送信の書き込みを重ねる（元のデータは変更しない）
+
+        normalizeを指定すると、未送信の追加企業をその関数で表示形式に変換してから末尾に加える
+        """
+        entries = self.pending()
+        if not entries:
+            return records
+
+        local_ids = [e['company_id'] for e in entries if e['kind'] == UPDATE_STATUS and is_local_id(e['company_id'])]
+        remote_ids = self._remote_ids(local_ids)
+
+        statuses: Dict[str, str] = {}
+        added: List[Dict] = []
+        for entry in entries:
+            if entry['kind'] == ADD_COMPANY:
+                added.append(dict(entry['payload'], company_id=entry['company_id']))
+            else:
+                company_id = remote_ids.get(entry['company_id'], entry['company_id'])
+                statuses[company_id] = entry['payload']['new_status']
+
+        for company in added:
+            if company['company_id'] in statuses:
+                company['sales_status'] = statuses[company['company_id']]
+        if normalize:
+            added = normalize(added)
+
+        result = []
+        for record in records:
+            company_id = str(record.get(id_key))
+            if company_id in statuses:
+                record = dict(record)
+                record[status_key] = statuses[company_id]
+                if flag_key:
+                    record[flag_key] = True
+            result.append(record)
+        for record in added:
+            if flag_key:
+                record[flag_key] = True
+            result.append(record)
+        return result
+
+    def overlay_dataframe(self, df: pd.DataFrame, id_key: str = 'company_id',
+                          status_key: str = 'sales_status') -> pd.DataFrame:
+        """DataFrame版のoverlay_records"""
+        if not self.stats()[PENDING]:
+            return df
+        records = df.to_dict('records') if not df.empty else []
+        return pd.DataFrame(self.overlay_records(records, id_key=id_key, status_key=status_key))
+
+    # ---- 再送 ----
+
+    def _next_batch(self, entries: List[Dict]) -> List[Dict]:
+        """先頭から同じ種類の書き込みをまとめる（前回送信したバッチは同じ構成で再送）"""
+        head = entries[0]
+        if head['batch_id']:
+            return [e for e in entries if e['batch_id'] == head['batch_id']]
+
+        limit = self.uploader.sizer.size if head['kind'] == ADD_COMPANY else STATUS_BATCH_SIZE
+        batch = []
+        for entry in entries:
+            if entry['kind'] != head['kind'] or entry['batch_id'] or len(batch) >= limit:
+                break
+            batch.append(entry)
+
+        batch_id = uuid.uuid4().hex
+        conn = self._connect()
+        conn.executemany("UPDATE mutation_journal SET batch_id = ? WHERE seq = ?",
+                         [(batch_id, e['seq']) for e in batch])
+        conn.commit()
+        conn.close()
+        return [dict(e, batch_id=batch_id) for e in batch]
+
+    def _send_adds(self, batch: List[Dict]) -> List[Dict]:
+        result = self.uploader.send_chunk([e['payload'] for e in batch], batch[0]['batch_id'])
+        rows = {row.get('index'): row for row in result.get('rows', [])}
+        return [
+            {'success': rows.get(i, {}).get('success', False), 'remote_id': rows.get(i, {}).get('id'),
+             'error': rows.get(i, {}).get('error', '応答に結果がありません')}
+            for i in range(len(batch))
+        ]
+
+    def _send_status_updates(self, batch: List[Dict]) -> List[Dict]:
+        # 同じ企業への連続した更新は最後の1件のみ送信
+        remote_ids = self._remote_ids([e['company_id'] for e in batch if is_local_id(e['company_id'])])
+        latest: Dict[str, int] = {}
+        for i, entry in enumerate(batch):
+            latest[remote_ids.get(entry['company_id'], entry['company_id'])] = i
+
+        outcomes: List[Optional[Dict]] = [None] * len(batch)
+        updates = []
+        for company_id, i in latest.items():
+            if is_local_id(company_id):
+                outcomes[i] = {'success': False, 'error': '追加に失敗した企業のため更新できません'}
+                continue
+            updates.append((i, {'company_id': company_id, 'new_status': batch[i]['payload']['new_status'],
+                                'note': batch[i]['payload'].get('note', '')}))
+
+        if updates:
+            response = self.session.post(
+                self.gas_url,
+                json={'action': 'update_status_batch', 'updates': [u for _, u in updates]},
+                headers=self.headers,
+                timeout=REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+            result = response.json()
+            if not result.get('success'):
+                raise BackendError(result.get('error') or result.get('message') or 'Unknown error', result)
+            for (i, _), item in zip(updates, result.get('results', [])):
+                outcomes[i] = {'success': item.get('success', False), 'error': item.get('error')}
+
+        for i, entry in enumerate(batch):
+            if outcomes[i] is None:
+                company_id = remote_ids.get(entry['company_id'], entry['company_id'])
+                outcomes[i] = dict(outcomes[latest[company_id]] or {'success': False, 'error': '応答に結果がありません'})
+        return outcomes
+
+    def _mark_results(self, batch: List[Dict], outcomes: List[Dict]):
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        conn.executemany("""
+            UPDATE mutation_journal
+            SET state = ?, remote_id = ?, last_error = ?, attempts = attempts + 1, applied_at = ?
+            WHERE seq = ?
+        """, [(APPLIED if o.get('success') else FAILED, o.get('remote_id'),
+               None if o.get('success') else o.get('error'), now if o.get('success') else None, e['seq'])
+              for e, o in zip(batch, outcomes)])
+        conn.commit()
+        conn.close()
+
+    def _mark_attempt(self, batch: List[Dict], error: Exception) -> bool:
+        """送信失敗を記録（恒久エラーが続いた場合は失敗扱いにしてTrueを返す）"""
+        give_up = classify_exception(error) == PERMANENT and batch[0]['attempts'] + 1 >= MAX_PERMANENT_ATTEMPTS
+        conn = self._connect()
+        conn.executemany("""
+            UPDATE mutation_journal SET attempts = attempts + 1, last_error = ?, state = ? WHERE seq = ?
+        """, [(str(error)[:500], FAILED if give_up else PENDING, e['seq']) for e in batch])
+        conn.commit()
+        conn.close()
+        return give_up
+
+    def replay_pending(self, max_batches: Optional[int] = None,
+                       on_progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """未送信の書き込みを記録順にまとめて送信（一時エラーの場合は中断し、次回続きから再送）"""
+        with self._replay_lock:
+            stats = {'applied': 0, 'failed': 0, 'batches': 0, 'error': None}
+            entries = self.pending()
+            total = len(entries)
+            done = 0
+
+            while entries and (max_batches is None or stats['batches'] < max_batches):
+                batch = self._next_batch(entries)
+                try:
+                    outcomes = (self._send_adds(batch) if batch[0]['kind'] == ADD_COMPANY
+                                else self._send_status_updates(batch))
+                except Exception as e:
+                    if self._mark_attempt(batch, e):
+                        stats['failed'] += len(batch)
+                    else:
+                        stats['error'] = str(e)
+                        self.last_error = str(e)
+                        break
+                else:
+                    self._mark_results(batch, outcomes)
+                    applied = sum(1 for o in outcomes if o.get('success'))
+                    stats['applied'] += applied
+                    stats['failed'] += len(batch) - applied
+                    self.last_error = None
+
+                stats['batches'] += 1
+                done += len(batch)
+                if on_progress:
+                    on_progress(done, total)
+                entries = self.pending()
+
+        if stats['applied'] and self.on_applied:
+            try:
+                self.on_applied()
+            except Exception:
+                pass
+        if stats['applied']:
+            self.prune_applied()
+        return stats
+
+    def retry_failed(self) -> int:
+        """失敗した書き込みを未送信に戻す"""
+        conn = self._connect()
+        cursor = conn.execute(
+            "UPDATE mutation_journal SET state = ?, attempts = 0, batch_id = NULL WHERE endpoint = ? AND state = ?",
+            (PENDING, self.gas_url, FAILED)
+        )
+        conn.commit()
+        conn.close()
+        self._wake.set()
+        return cursor.rowcount
+
+    def discard_failed(self) -> int:
+        conn = self._connect()
+        cursor = conn.execute("DELETE FROM mutation_journal WHERE endpoint = ? AND state = ?", (self.gas_url, FAILED))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+
+    def prune_applied(self, retention_days: int = APPLIED_RETENTION_DAYS):
+        """保持期間を過ぎた反映済みの記録を削除"""
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        conn = self._connect()
+        conn.execute("DELETE FROM mutation_journal WHERE state = ? AND applied_at < ?", (APPLIED, cutoff))
+        conn.commit()
+        conn.close()
+
+    # ---- バックグラウンド再送 ----
+
+    def _run(self):
+        delay = self.replay_interval
+        while not self._stopped:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stopped:
+                break
+            try:
+                stats = self.replay_pending()
+                failed = stats['error'] is not None
+            except Exception as e:
+                self.last_error = str(e)
+                failed = True
+            # 接続できない間は間隔を延ばす
+            delay = min(delay * 2, MAX_REPLAY_BACKOFF) if failed else self.replay_interval
+
+    def start(self) -> "MutationJournal":
+        """バックグラウンド再送を開始（起動済みなら何もしない）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="mutation-journal-replay", daemon=True)
+            self._thread.start()
+            self._wake.set()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopped = True
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wait_until_idle(self, timeout: float = 30) -> bool:
+        """未送信がなくなるまで待機（検証用）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.stats()[PENDING]:
+                return True
+            time.sleep(0.05)
+        return False
+
+
+def verify_rejected_add_batch(db_dir: Optional[str] = None) -> List[str]:
+    """拒否された追加バッチが失敗扱いになり、後続のステータス更新が送信されるか検証（問題点のリストを返す）"""
+    import os
+    import tempfile
+
+    from modules.local_gas_server import LocalGasServer
+
+    def reject(request: Dict) -> Dict:
+        raise ValueError('rejected')
+
+    problems = []
+    with tempfile.TemporaryDirectory(dir=db_dir) as workdir:
+        with LocalGasServer(os.path.join(workdir, 'server.db')) as server:
+            server.store.seed_companies(1)
+            company_id = server.store.get_companies()[0]['company_id']
+            server.httpd.backend.action_add_companies_batch = reject
+
+            journal = MutationJournal(server.url, db_path=os.path.join(workdir, 'journal.db'))
+            journal.record_add_company({'company_name': 'Rejected Company'})
+            journal.record_status_update(company_id, 'Contacted')
+            for _ in range(MAX_PERMANENT_ATTEMPTS):
+                journal.replay_pending()
+
+            stats = journal.stats()
+            if stats[PENDING]:
+                problems.append(f"未送信が残っています: {stats}")
+            if stats[FAILED] != 1:
+                problems.append(f"拒否された追加が失敗扱いになっていません: {stats}")
+            if not server.stats.get('update_status_batch'):
+                problems.append("拒否された追加の後のステータス更新が送信されていません")
+            if server.store.get_companies()[0].get('sales_status') != 'Contacted':
+                problems.append("ステータス更新が反映されていません")
+    return problems
+
+
+if __name__ == "__main__":
+    problems = verify_rejected_add_batch()
+    print("拒否された追加バッチ: OK" if not problems else "\n".join(problems))
@@ -0,0 +1,80 @@
+"""
+データベース初期化レジストリ
+init_databaseの実行結果をGAS URL・スキーマバージョンごとにプロセス内で保持し、
+Streamlitの再実行のたびにApps Scriptを呼び出さないようにする
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# クライアントが前提とするシート構成のバージョン（google_apps_script_backend.jsのSCHEMA_VERSION）
+SCHEMA_VERSION = 1
+
+# 初期化に失敗した場合に再実行するまでの秒数
+FAILED_RETRY_SECONDS = 300
+
+
+class SchemaRegistry:
+    """GAS URL・スキーマバージョンごとの初期化結果（スレッドセーフ）"""
+
+    def __init__(self, schema_version: int = SCHEMA_VERSION, failed_retry_seconds: float = FAILED_RETRY_SECONDS):
+        self.schema_version = schema_version
+        self.failed_retry_seconds = failed_retry_seconds
+        self._entries: Dict[Tuple[str, int], Dict] = {}
+        self._locks: Dict[Tuple[str, int], threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _key_lock(self, key: Tuple[str, int]) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _is_fresh(self, entry: Optional[Dict]) -> bool:
+        if entry is None:
+            return False
+        if entry['initialized']:
+            return True
+        return time.time() - entry['checked_at_ts'] < self.failed_retry_seconds
+
+    def get(self, gas_url: str) -> Optional[Dict]:
+        """キャッシュ済みの初期化結果（未実行ならNone）"""
+        return self._entries.get((gas_url, self.schema_version))
+
+    def ensure(self, api, force: bool = False) -> Dict:
+        """未初期化（またはforce）の場合のみinit_databaseを実行し、結果を返す
+
+        同じURLへの同時呼び出しは1回の実行を待ち合わせる
+        """
+        key = (api.gas_url, self.schema_version)
+        entry = self._entries.get(key)
+        if not force and self._is_fresh(entry):
+            return entry
+
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if not force and self._is_fresh(entry):
+                return entry
+
+            result = api.call_api('init_database', method='POST') or {}
+            server_version = result.get('schema_version')
+            entry = {
+                'initialized': bool(result.get('success')),
+                'spreadsheet_url': result.get('spreadsheet_url'),
+                'schema_version': server_version,
+                # スキーマバージョンを返さない旧バックエンドは不一致として扱わない
+                'schema_mismatch': server_version is not None and int(server_version) != self.schema_version,
+                'error': None if result.get('success') else result.get('error') or result.get('message'),
+                'checked_at': datetime.now().isoformat(),
+                'checked_at_ts': time.time(),
+            }
+            self._entries[key] = entry
+            return entry
+
+    def invalidate(self, gas_url: Optional[str] = None):
+        """初期化結果を破棄（次回のensureで再実行）"""
+        with self._guard:
+            if gas_url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((gas_url, self.schema_version), None)
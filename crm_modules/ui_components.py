@@ -71,6 +71,8 @@ def show_company_list(company_manager):
     """企業一覧表示"""
     st.subheader("企業一覧")
     
+    show_sync_status(getattr(company_manager, 'journal', None))
+    
     companies_df = company_manager.get_all_companies()
     
     if not companies_df.empty:
@@ -104,10 +106,54 @@ def show_company_list(company_manager):
         # ステータス更新機能
         if not filtered_df.empty:
             show_status_update_form(company_manager, filtered_df)
+            show_bulk_status_update_form(company_manager, filtered_df)
     else:
         st.info("企業データがありません。まず企業を追加してください。")
 
 
+def show_sync_status(journal):
+    """Google Sheetsへの未送信の書き込み状況"""
+    if journal is None:
+        return
+    
+    stats = journal.stats()
+    if not stats['pending'] and not stats['failed']:
+        return
+    
+    if stats['pending']:
+        message = f"⏳ Google Sheets未反映の書き込み: {stats['pending']}件（バックグラウンドで送信中）"
+        if journal.last_error:
+            message += f" - 最終エラー: {journal.last_error[:100]}"
+        st.info(message)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if stats['pending'] and st.button("🔄 今すぐ同期", key="journal_replay"):
+            progress = st.progress(0.0, text="🔄 送信中...")
+            result = journal.replay_pending(
+                on_progress=lambda done, total: progress.progress(min(done / total, 1.0), text=f"🔄 {done}/{total}件を送信済み")
+            )
+            progress.empty()
+            if result['error']:
+                st.warning(f"⚠️ 送信を中断しました（自動で再試行します）: {result['error']}")
+            else:
+                st.success(f"✅ {result['applied']}件を反映しました（失敗: {result['failed']}件）")
+                time.sleep(1)
+                st.rerun()
+    
+    with col2:
+        if stats['failed']:
+            st.error(f"❌ 反映に失敗した書き込み: {stats['failed']}件")
+            with st.expander("📋 失敗した書き込み"):
+                for entry in journal.failed()[:20]:
+                    target = entry['payload'].get('company_name') or entry['company_id']
+                    st.write(f"- {entry['kind']} / {target}: {entry['last_error']}")
+            if st.button("🔁 失敗分を再試行", key="journal_retry_failed"):
+                journal.retry_failed()
+                st.rerun()
+
+
 def show_status_update_form(company_manager, companies_df):
     """ステータス更新フォーム"""
     st.subheader("📈 ステータス更新")
@@ -142,6 +188,38 @@ def show_status_update_form(company_manager, companies_df):
                     st.error("❌ ステータス更新に失敗しました")
 
 
+def show_bulk_status_update_form(company_manager, companies_df):
+    """一括ステータス更新フォーム（表示中の企業をまとめて更新）"""
+    with st.expander(f"📦 一括ステータス更新（表示中の{len(companies_df)}社）"):
+        with st.form("bulk_update_status_form"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                new_status = st.selectbox("新しいステータス", list(SALES_STATUS.keys()), key="bulk_new_status")
+            
+            with col2:
+                notes = st.text_input("更新理由・備考", key="bulk_notes")
+            
+            if st.form_submit_button("📦 一括更新", type="primary"):
+                id_column = 'company_id' if 'company_id' in companies_df.columns else 'id'
+                company_ids = companies_df[id_column].dropna().astype(str).tolist() if id_column in companies_df.columns else []
+                
+                if not company_ids:
+                    st.error("❌ 企業IDが取得できません")
+                    return
+                
+                with st.spinner(f"{len(company_ids)}社のステータスを更新中..."):
+                    result = company_manager.update_status_batch(company_ids, new_status, 'user', notes=notes)
+                
+                if result and result.get('success'):
+                    st.success(f"✅ {result.get('updated', 0)}社のステータスを{SALES_STATUS[new_status]}に更新しました"
+                               f"（失敗: {result.get('failed', 0)}社）")
+                    time.sleep(1)
+                    st.rerun()
+                else:
+                    st.error(f"❌ 一括ステータス更新に失敗しました: {(result or {}).get('error', '不明なエラー')}")
+
+
 def show_sidebar_info():
     """サイドバー情報表示"""
     st.sidebar.title("🌟 FusionCRM")
@@ -170,6 +248,31 @@ def show_connection_status():
         st.sidebar.warning("⚠️ 未接続")
 
 
+def show_schema_status(company_manager):
+    """データベース初期化状況（管理者向けの再確認ボタン付き）"""
+    status = company_manager.get_schema_status() or {}
+    
+    with st.sidebar.expander("🛠️ データベース状態（管理者向け）"):
+        if status.get('initialized'):
+            st.success(f"✅ 初期化済み（スキーマ v{status.get('schema_version') or '不明'}）")
+        else:
+            st.warning(f"⚠️ 初期化未確認: {status.get('error') or '未実行'}")
+        
+        if status.get('schema_mismatch'):
+            st.error("❌ バックエンドのスキーマバージョンが一致しません。Google Apps Scriptを更新してください")
+        
+        if status.get('checked_at'):
+            st.caption(f"最終確認: {status['checked_at'][:19]}")
+        
+        if st.button("🔁 データベースを再確認", key="recheck_database"):
+            with st.spinner("データベースを確認中..."):
+                status = company_manager.recheck_database()
+            if status.get('initialized'):
+                st.success("✅ 再確認しました")
+            else:
+                st.error(f"❌ 初期化に失敗しました: {status.get('error') or '不明なエラー'}")
+
+
 def show_error_handling(error_message, api=None):
     """エラーハンドリング表示"""
     st.error(f"アプリケーションエラー: {str(error_message)}")
@@ -13,17 +13,23 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'modules'))
 
 # モジュールインポート（modules. プレフィックスなし）
 from email_customizers import EnglishEmailCustomizer, JapaneseEmailCustomizer, get_openai_client
-from email_database import IntegratedEmailDatabase
+from email_database import IntegratedEmailDatabase, make_worker_id
 from data_manager import get_companies_from_sheets, render_company_data_management, render_csv_import
 from batch_processing import generate_english_emails_batch, generate_japanese_emails_individual
+from message_builder import get_prepared_message, submit_prepared_message
+from address_validation import format_validation_summary, validate_company_list
+from suppression import SuppressionList
 
 # 実際のSMTP送信関数（偽装関数を置き換え）
 def send_pregenerated_emails_with_resume(company_list, gmail_config, max_emails=50, language='english', template_type='standard', send_interval=60, resume_mode=False):
     """実際のSMTP送信関数"""
     import time
     import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
+    
+    # 宛先アドレスを検証し、無効な企業は送信対象から除外
+    company_list, validation_counts = validate_company_list(company_list)
+    if validation_counts.get('rejected'):
+        st.warning(format_validation_summary(validation_counts))
     
     st.write(f"📤 {len(company_list[:max_emails])}社への送信開始")
     
@@ -33,6 +39,14 @@ def send_pregenerated_emails_with_resume(company_list, gmail_config, max_emails=
     # データベース初期化
     db = IntegratedEmailDatabase()
     
+    # 配信キー（企業・言語・テンプレート・当日）を送信前に確保し、他セッションとの二重送信を防ぐ
+    campaign = datetime.now().strftime('%Y-%m-%d')
+    worker_id = make_worker_id()
+    db.reap_stale_reservations()
+    
+    # 配信停止リスト（起動時に読み込み、送信前に差分更新）
+    suppression = SuppressionList(db)
+    
     for i, company in enumerate(company_list[:max_emails]):
         company_name = company.get('company_name', 'Unknown')
         company_email = company.get('email', '')
@@ -47,6 +61,18 @@ def send_pregenerated_emails_with_resume(company_list, gmail_config, max_emails=
             failed_count += 1
             continue
         
+        # 送信直前に配信停止リストを再確認（実行中の配信停止・バウンスを反映）
+        suppression.refresh()
+        if suppression.is_suppressed(company_email):
+            st.info(f"🚫 {company_name} - 配信停止リスト該当のためスキップ")
+            continue
+        
+        # 他のセッションで送信済み・送信中の場合はスキップ
+        if not db.reserve_delivery(company_name, language, template_type, campaign, worker_id):
+            st.info(f"⚠️ {company_name} - 既に送信済みのためスキップ")
+            continue
+        
+        prepared = None
         try:
             # 生成済みメールを取得
             stored_email = db.get_generated_email(company_name, language, template_type)
@@ -59,32 +85,34 @@ def send_pregenerated_emails_with_resume(company_list, gmail_config, max_emails=
                 email_subject = f"Partnership Opportunity - {company_name}"
                 email_body = f"Dear {company_name} Team,\n\nI hope this message finds you well.\n\nMy name is Koji Tokuda from PicoCELA Inc. (NASDAQ: PCLA), a leading provider of advanced industrial multi-hop mesh Wi-Fi access point solutions.\n\nWe specialize in creating robust, scalable wireless networks that can extend up to 10 hops with ultra-low latency (2-3ms per hop), reducing traditional cabling infrastructure by up to 90%.\n\nI believe there could be significant synergies between our technologies and your operations. Would you be open to a brief conversation to explore potential partnership opportunities?\n\nI'd be happy to share more details about how our solutions have helped companies in similar industries optimize their connectivity infrastructure.\n\nBest regards,\nKoji Tokuda\nCEO\nPicoCELA Inc.\ntokuda@picocela.com"
             
-            # SMTP送信処理
+            # メッセージは一度だけレンダリング（キャッシュ済みなら再利用）
+            prepared = get_prepared_message(
+                company_email,
+                email_subject,
+                email_body,
+                {'email': gmail_config['email'], 'sender_name': 'Koji Tokuda (PicoCELA)'},
+                reply_to='tokuda@picocela.com'
+            )
+            
+            # SMTP送信処理（生バイト列をそのまま送信）
             server = smtplib.SMTP('smtp-mail.outlook.com', 587)
             server.starttls()
             server.login(gmail_config['email'], gmail_config['password'])
-            
-            msg = MIMEMultipart()
-            msg['From'] = f"Koji Tokuda (PicoCELA) <{gmail_config['email']}>"
-            msg['Reply-To'] = 'tokuda@picocela.com'
-            msg['Subject'] = email_subject
-            msg['Reply-To'] = 'tokuda@picocela.com'  # ← この行を追加
-            
-            msg.attach(MIMEText(email_body, 'plain'))
-            
-            server.send_message(msg)
+            submit_prepared_message(server, prepared)
+            db.complete_delivery(company_name, language, template_type, campaign, worker_id)
             server.quit()
             
-            # 送信履歴をデータベースに保存
-            db.save_send_record({
+            # 送信履歴をデータベースに保存（Message-IDはバウンス照合用）
+            db.save_send_history({
+                'company_id': company.get('company_id', ''),
                 'company_name': company_name,
                 'recipient_email': company_email,
-                'subject': email_subject,
-                'email_body': email_body,
                 'language': language,
-                'template_type': template_type,
+                'subject': email_subject,
                 'status': 'success',
-                'sent_at': datetime.now().isoformat()
+                'smtp_response': 'OK',
+                'template_type': template_type,
+                'message_id': prepared.message_id
             })
             
             sent_count += 1
@@ -93,31 +121,37 @@ def send_pregenerated_emails_with_resume(company_list, gmail_config, max_emails=
         except smtplib.SMTPAuthenticationError as e:
             st.error(f"❌ Gmail認証エラー: {str(e)}")
             st.error("アプリパスワードを確認してください")
+            db.release_delivery(company_name, language, template_type, campaign, worker_id)
             failed_count += 1
             break  # 認証エラーの場合は処理を停止
             
         except smtplib.SMTPRecipientsRefused as e:
             st.error(f"❌ {company_name} - 無効なメールアドレス: {company_email}")
+            db.complete_delivery(company_name, language, template_type, campaign, worker_id, status='failed')
             failed_count += 1
             
         except smtplib.SMTPServerDisconnected as e:
             st.error(f"❌ SMTP接続エラー: {str(e)}")
+            db.release_delivery(company_name, language, template_type, campaign, worker_id)
             failed_count += 1
             
         except Exception as e:
             st.error(f"❌ {company_name} - 送信失敗: {str(e)}")
             
+            # 送信完了前の失敗のみ予約を解放（送信済みの配信キーは解放されない）
+            db.release_delivery(company_name, language, template_type, campaign, worker_id)
+            
             # 送信失敗もデータベースに記録
-            db.save_send_record({
+            db.save_send_history({
+                'company_id': company.get('company_id', ''),
                 'company_name': company_name,
                 'recipient_email': company_email,
-                'subject': email_subject if 'email_subject' in locals() else 'N/A',
-                'email_body': email_body if 'email_body' in locals() else 'N/A',
                 'language': language,
-                'template_type': template_type,
+                'subject': email_subject if 'email_subject' in locals() else 'N/A',
                 'status': 'failed',
-                'error_message': str(e),
-                'sent_at': datetime.now().isoformat()
+                'smtp_response': str(e)[:500],
+                'template_type': template_type,
+                'message_id': prepared.message_id if prepared else None
             })
             
             failed_count += 1
@@ -13,6 +13,17 @@ import json
 import time
 import requests
 import os  # 既存インポートの後に1行追加
+from modules.columnar_transport import COLUMNAR_PARAMS, companies_dataframe
+# 他のモジュールと同じ名前で読み込む（modules/はmodulesパッケージの読み込み時にsys.pathへ追加される）
+from retry_policy import (
+    HTTP_RETRY_POLICY, PERMANENT, THROTTLE, PermanentError,
+    classify_exception, classify_http_status
+)
+from crm_modules.schema_registry import SchemaRegistry
+from crm_modules.dedup_index import DedupIndex
+from crm_modules.import_pipeline import build_import_preview
+from crm_modules.keyword_matcher import get_keyword_matcher, WIFI_MATCHER, IMPORT_WIFI_MATCHER, IMPORT_SCORING_MATCHER
+from crm_modules.ui_components import show_schema_status
 
 # メール関連のインポート
 EMAIL_AVAILABLE = True
@@ -58,15 +69,54 @@ PICOCELA_KEYWORDS = [
     'construction', 'building', 'site', 'industrial', 'management',
     'platform', 'solution', 'integration', 'control', 'monitoring'
 ]
+PICOCELA_MATCHER = get_keyword_matcher(PICOCELA_KEYWORDS, weight=10, lower=True)
+
+# GAS呼び出し用コネクションプール（script.google.com・googleusercontent.com双方の接続を再利用）
+DEFAULT_POOL_SIZE = 10
+
+def create_gas_session(pool_size=DEFAULT_POOL_SIZE):
+    """Keep-Alive・gzip対応のプール付きセッションを作成"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+    return session
 
 class GoogleSheetsAPI:
     """Google Sheets API（Google Apps Script経由）- 完全修正版"""
     
-    def __init__(self, gas_url):
+    def __init__(self, gas_url, session=None, pool_size=DEFAULT_POOL_SIZE):
         self.gas_url = gas_url
+        self.session = session or create_gas_session(pool_size)
+        self._redirects = {}  # 恒久リダイレクト（301/308）の転送先
         self._connection_tested = False
         self._connection_status = "未テスト"
     
+    def _resolve_url(self, url):
+        """キャッシュ済みの恒久リダイレクト先を返す"""
+        return self._redirects.get(url, url)
+    
+    def _remember_redirects(self, url, response):
+        """恒久リダイレクトを記録（GASの302は応答ごとに異なるため記録しない）"""
+        for hop in response.history:
+            if hop.status_code in (301, 308) and hop.headers.get('Location'):
+                self._redirects[url] = requests.compat.urljoin(hop.url, hop.headers['Location'])
+                break
+    
+    def _get(self, url, **kwargs):
+        response = self.session.get(self._resolve_url(url), **kwargs)
+        self._remember_redirects(url, response)
+        return response
+    
+    def _post(self, url, **kwargs):
+        response = self.session.post(self._resolve_url(url), **kwargs)
+        self._remember_redirects(url, response)
+        return response
+    
     def _lazy_test_connection(self):
         """遅延接続テスト（実際の使用時に実行）"""
         if self._connection_tested:
@@ -74,7 +124,7 @@ class GoogleSheetsAPI:
             
         try:
             # シンプルなPOSTリクエストでテスト
-            response = requests.post(
+            response = self._post(
                 self.gas_url,
                 json={"action": "init_database"},
                 headers={'Content-Type': 'application/json'},
@@ -95,16 +145,36 @@ class GoogleSheetsAPI:
     
     def call_api(self, action, method='GET', data=None):
         """API呼び出しの共通メソッド（完全修正版）"""
-        try:
+        def send():
             if method == 'GET':
-                response = requests.get(f"{self.gas_url}?action={action}", timeout=30)
+                response = self._get(f"{self.gas_url}?action={action}", timeout=30)
             else:
-                response = requests.post(
+                response = self._post(
                     self.gas_url,
                     json={"action": action, **data} if data else {"action": action},
                     headers={'Content-Type': 'application/json'},
                     timeout=30
                 )
+            # 一時エラー・レート制限の応答はリトライ対象として例外化
+            if response.status_code >= 400 and classify_http_status(response.status_code) != PERMANENT:
+                raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+            return response
+        
+        def classify(error):
+            # POSTは非冪等のため、未実行が明らかなレート制限応答のみ再送
+            error_class = classify_exception(error)
+            if method != 'GET' and error_class != THROTTLE:
+                return PERMANENT
+            return error_class
+        
+        try:
+            try:
+                response = HTTP_RETRY_POLICY.call(send, classify=classify)
+            except (PermanentError, requests.exceptions.HTTPError) as e:
+                cause = e.cause if isinstance(e, PermanentError) else e
+                if not isinstance(cause, requests.exceptions.HTTPError):
+                    raise cause
+                response = cause.response
             
             # レスポンス確認
             if response.status_code != 200:
@@ -143,7 +213,6 @@ class ENRDataProcessor:
     @staticmethod
     def calculate_picocela_relevance(company_data):
         """PicoCELA関連度スコア計算"""
-        score = 0
         text_fields = [
             str(company_data.get('company_name', '')),
             str(company_data.get('website_url', '')),
@@ -153,20 +222,13 @@ class ENRDataProcessor:
         
         full_text = ' '.join(text_fields).lower()
         
-        for keyword in PICOCELA_KEYWORDS:
-            if keyword.lower() in full_text:
-                score += 10
+        score = PICOCELA_MATCHER.score(full_text)
         
         return min(score, 100)
     
     @staticmethod
     def detect_wifi_requirement(company_data):
         """WiFi需要判定"""
-        wifi_indicators = [
-            'wifi', 'wireless', 'network', 'connectivity', 
-            'iot', 'smart building', 'construction tech'
-        ]
-        
         text_fields = [
             str(company_data.get('company_name', '')),
             str(company_data.get('notes', '')),
@@ -175,16 +237,15 @@ class ENRDataProcessor:
         
         full_text = ' '.join(text_fields).lower()
         
-        for indicator in wifi_indicators:
-            if indicator in full_text:
-                return True
-        return False
+        return WIFI_MATCHER.any(full_text)
     
     @staticmethod
-    def calculate_priority_score(company_data):
-        """優先度スコア計算"""
-        relevance = ENRDataProcessor.calculate_picocela_relevance(company_data)
-        wifi_required = ENRDataProcessor.detect_wifi_requirement(company_data)
+    def calculate_priority_score(company_data, relevance=None, wifi_required=None):
+        """優先度スコア計算（計算済みの関連度・WiFi需要を渡すと再計算しない）"""
+        if relevance is None:
+            relevance = ENRDataProcessor.calculate_picocela_relevance(company_data)
+        if wifi_required is None:
+            wifi_required = ENRDataProcessor.detect_wifi_requirement(company_data)
         
         priority = relevance
         if wifi_required:
@@ -192,18 +253,65 @@ class ENRDataProcessor:
         
         return min(priority, 150)
 
+try:
+    from crm_modules.company_mirror import CompanyMirror
+    MIRROR_AVAILABLE = True
+except ImportError:
+    MIRROR_AVAILABLE = False
+
+try:
+    from crm_modules.mutation_journal import MutationJournal
+    JOURNAL_AVAILABLE = True
+except ImportError:
+    JOURNAL_AVAILABLE = False
+
+
+@st.cache_resource
+def get_company_mirror(gas_url, _api):
+    """GAS URLごとにプロセス内で共有する企業データのローカルミラー"""
+    return CompanyMirror(_api)
+
+
+@st.cache_resource
+def get_schema_registry():
+    """init_databaseの実行結果をプロセス内で共有するレジストリ"""
+    return SchemaRegistry()
+
+
+@st.cache_resource
+def get_mutation_journal(gas_url, _session):
+    """GAS URLごとにプロセス内で共有する書き込みジャーナル（バックグラウンド再送を開始）"""
+    return MutationJournal(gas_url, session=_session).start()
+
+
 class CompanyManager:
     """企業管理クラス（Google Sheets専用版）"""
     
     def __init__(self, api):
         self.api = api
+        self.mirror = get_company_mirror(api.gas_url, api) if MIRROR_AVAILABLE else None
+        self.journal = get_mutation_journal(api.gas_url, api.session) if JOURNAL_AVAILABLE else None
+        if self.journal is not None:
+            self.journal.on_applied = self._sync_mirror
         self._ensure_database()
     
     def _ensure_database(self):
-        """データベース初期化確認"""
-        result = self.api.call_api('init_database', method='POST')
-        if result and result.get('success') and result.get('spreadsheet_url'):
-            st.session_state.spreadsheet_url = result['spreadsheet_url']
+        """データベース初期化確認（GAS URL・スキーマバージョンごとにプロセス内で1回のみ実行）"""
+        self._apply_schema_status(get_schema_registry().ensure(self.api))
+    
+    def recheck_database(self):
+        """データベース初期化を再実行（管理者向け）"""
+        status = get_schema_registry().ensure(self.api, force=True)
+        self._apply_schema_status(status)
+        return status
+    
+    def get_schema_status(self):
+        """キャッシュ済みの初期化結果"""
+        return get_schema_registry().get(self.api.gas_url)
+    
+    def _apply_schema_status(self, status):
+        if status.get('initialized') and status.get('spreadsheet_url'):
+            st.session_state.spreadsheet_url = status['spreadsheet_url']
     
     def add_company(self, company_data, user_id="system"):
         """企業追加"""
@@ -211,16 +319,21 @@ class CompanyManager:
             # PicoCELA関連度とWiFi需要を自動計算
             relevance_score = ENRDataProcessor.calculate_picocela_relevance(company_data)
             wifi_required = 1 if ENRDataProcessor.detect_wifi_requirement(company_data) else 0
-            priority_score = ENRDataProcessor.calculate_priority_score(company_data)
+            priority_score = ENRDataProcessor.calculate_priority_score(company_data, relevance_score, wifi_required)
             
             company_data['picocela_relevance_score'] = relevance_score
             company_data['wifi_required'] = wifi_required
             company_data['priority_score'] = priority_score
             company_data['sales_status'] = company_data.get('sales_status', 'New')
             
+            if self.journal is not None:
+                # ジャーナルに記録して即座に受け付け（GASへはバックグラウンドで送信、仮IDを返す）
+                return self.journal.record_add_company(company_data)
+            
             result = self.api.call_api('add_company', method='POST', data={'company': company_data})
             
             if result and result.get('success'):
+                self._sync_mirror()
                 return result.get('company_id')
             return None
             
@@ -231,25 +344,84 @@ class CompanyManager:
     def update_status(self, company_id, new_status, user_id, reason="", notes=""):
         """ステータス更新"""
         try:
+            if self.journal is not None:
+                self.journal.record_status_update(company_id, new_status, f"{reason} - {notes}" if reason else notes)
+                return True
+            
             result = self.api.call_api('update_status', method='POST', data={
                 'company_id': company_id,
                 'new_status': new_status,
                 'note': f"{reason} - {notes}" if reason else notes
             })
             
+            if result and result.get('success'):
+                self._sync_mirror()
             return result and result.get('success')
             
         except Exception as e:
             st.error(f"ステータス更新エラー: {str(e)}")
             return False
     
+    def update_status_batch(self, company_ids, new_status, user_id, reason="", notes=""):
+        """複数企業のステータスを1回のAPI呼び出しで一括更新（キャンペーン後の一括移行など）"""
+        try:
+            if self.journal is not None:
+                count = self.journal.record_status_updates(
+                    [str(company_id) for company_id in company_ids], new_status,
+                    f"{reason} - {notes}" if reason else notes
+                )
+                return {'success': True, 'updated': count, 'failed': 0, 'queued': True}
+            
+            result = self.api.call_api('update_status_batch', method='POST', data={
+                'company_ids': list(company_ids),
+                'new_status': new_status,
+                'note': f"{reason} - {notes}" if reason else notes
+            })
+            
+            if result and result.get('success'):
+                self._sync_mirror()
+            return result
+            
+        except Exception as e:
+            st.error(f"一括ステータス更新エラー: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def _sync_mirror(self):
+        """書き込み後にミラーへ差分を反映"""
+        if self.mirror is not None:
+            try:
+                self.mirror.sync()
+            except Exception:
+                pass
+    
     def get_companies_by_status(self, status=None, wifi_required=None):
-        """ステータス別企業取得"""
+        """ステータス別企業取得（未送信の書き込みを重ねて表示）"""
+        if self.journal is None or not self.journal.stats()['pending']:
+            return self._load_companies(status, wifi_required)
+        
+        df = self.journal.overlay_dataframe(self._load_companies())
+        if status and not df.empty and 'sales_status' in df.columns:
+            df = df[df['sales_status'] == status]
+        if wifi_required is not None and not df.empty and 'wifi_required' in df.columns:
+            df = df[df['wifi_required'] == wifi_required]
+        return df
+    
+    def _load_companies(self, status=None, wifi_required=None):
+        """ステータス別企業取得（ローカルミラー優先、失敗時はGASから全件取得）"""
+        if self.mirror is not None:
+            try:
+                self.mirror.sync_if_stale()
+                if self.mirror.count() > 0:
+                    return self.mirror.get_companies(status, wifi_required)
+            except Exception as e:
+                st.warning(f"⚠️ ローカルミラーを利用できません: {str(e)}")
+        
         try:
-            result = self.api.call_api('get_companies')
+            # 列形式（gzip圧縮）で取得し、行ごとの辞書を作らずにDataFrameへ変換
+            result = self.api.call_api('get_companies', method='POST', data=dict(COLUMNAR_PARAMS))
             
-            if result and result.get('success') and result.get('companies'):
-                df = pd.DataFrame(result['companies'])
+            if result and result.get('success'):
+                df = companies_dataframe(result)
                 
                 # 安全なフィルタリング（カラムの存在確認）
                 if status and not df.empty and 'sales_status' in df.columns:
@@ -351,6 +523,11 @@ class EmailCampaignManager:
             }
         }
 
+@st.cache_resource
+def get_shared_google_sheets_api(gas_url, pool_size=DEFAULT_POOL_SIZE):
+    """GAS URLごとにプロセス内で1つのAPIオブジェクト（接続プール）を共有"""
+    return GoogleSheetsAPI(gas_url, pool_size=pool_size)
+
 def get_google_sheets_api():
     """Google Sheets API取得（完全修正版）"""
     
@@ -359,7 +536,7 @@ def get_google_sheets_api():
         gas_url = st.secrets['google_apps_script_url']
         try:
             # 接続テストなしでAPIオブジェクトを作成
-            api = GoogleSheetsAPI(gas_url)
+            api = get_shared_google_sheets_api(gas_url)
             st.session_state.gas_url = gas_url
             return api
         except Exception as e:
@@ -369,7 +546,7 @@ def get_google_sheets_api():
     elif 'gas_url' in st.session_state:
         gas_url = st.session_state.gas_url
         try:
-            return GoogleSheetsAPI(gas_url)
+            return get_shared_google_sheets_api(gas_url)
         except Exception as e:
             st.error(f"保存済みURL初期化エラー: {str(e)}")
             del st.session_state.gas_url
@@ -1046,7 +1223,11 @@ def suggest_column_mapping(file_columns):
     return suggestions
 
 def create_import_preview(df, mapping, auto_wifi_detection, auto_picocela_scoring):
-    """インポートプレビューデータの作成"""
+    """インポートプレビューデータの作成（列単位で一括処理）"""
+    return build_import_preview(df, mapping, auto_wifi_detection, auto_picocela_scoring)
+
+def create_import_preview_rows(df, mapping, auto_wifi_detection, auto_picocela_scoring):
+    """インポートプレビューデータの作成（行単位の従来実装、同一性確認用）"""
     preview_data = []
     
     for _, row in df.iterrows():
@@ -1089,12 +1270,6 @@ def create_import_preview(df, mapping, auto_wifi_detection, auto_picocela_scorin
 
 def detect_wifi_need_from_data(company_data):
     """データからWiFi需要を判定"""
-    wifi_indicators = [
-        'wifi', 'wireless', 'network', 'connectivity', 'mesh',
-        'iot', 'smart', 'digital', 'automation', 'sensor',
-        'monitoring', 'tracking', 'communication'
-    ]
-    
     text_fields = [
         company_data.get('company_name', ''),
         company_data.get('notes', ''),
@@ -1103,23 +1278,10 @@ def detect_wifi_need_from_data(company_data):
     
     full_text = ' '.join(text_fields).lower()
     
-    for indicator in wifi_indicators:
-        if indicator in full_text:
-            return 1
-    
-    return 0
+    return 1 if IMPORT_WIFI_MATCHER.any(full_text) else 0
 
 def calculate_picocela_relevance_from_data(company_data):
     """データからPicoCELA関連度を計算"""
-    score = 0
-    
-    # キーワードスコアリング
-    keywords = {
-        'network': 15, 'mesh': 20, 'wireless': 15, 'wifi': 15,
-        'connectivity': 10, 'iot': 10, 'smart': 8, 'automation': 8,
-        'construction': 12, 'building': 10, 'industrial': 8
-    }
-    
     text_fields = [
         company_data.get('company_name', ''),
         company_data.get('notes', ''),
@@ -1128,9 +1290,8 @@ def calculate_picocela_relevance_from_data(company_data):
     
     full_text = ' '.join(text_fields).lower()
     
-    for keyword, points in keywords.items():
-        if keyword in full_text:
-            score += points
+    # キーワードスコアリング
+    score = IMPORT_SCORING_MATCHER.score(full_text)
     
     return min(score, 100)
 
@@ -1176,6 +1337,12 @@ def execute_data_import(df, mapping, company_manager, import_mode, batch_size, a
         st.error("❌ インポート可能なデータがありません")
         return
     
+    # 重複チェック用の索引（既存企業はインポート開始時に1回だけ取得）
+    dedup_index = None
+    if import_mode == "重複チェック（メールアドレス基準）":
+        status_text.text("🔍 既存企業を確認中...")
+        dedup_index = DedupIndex.from_dataframe(company_manager.get_all_companies())
+    
     status_text.text(f"📥 {total_rows}社のデータをインポート中...")
     
     # バッチ処理でインポート
@@ -1187,20 +1354,18 @@ def execute_data_import(df, mapping, company_manager, import_mode, batch_size, a
                 # 企業データの準備
                 company_data = row.to_dict()
                 
-                # 重複チェック（メールアドレス基準）
-                if import_mode == "重複チェック（メールアドレス基準）" and company_data.get('email'):
-                    # 既存企業の確認
-                    existing_companies = company_manager.get_all_companies()
-                    if not existing_companies.empty and 'email' in existing_companies.columns:
-                        if company_data['email'] in existing_companies['email'].values:
-                            stats['skipped'] += 1
-                            continue
+                # 重複チェック（メールアドレス・ドメイン・企業名の索引で判定）
+                if dedup_index is not None and dedup_index.match(company_data):
+                    stats['skipped'] += 1
+                    continue
                 
                 # 企業追加
                 result = company_manager.add_company(company_data, user_id='data_import')
                 
                 if result:
                     stats['success'] += 1
+                    if dedup_index is not None:
+                        dedup_index.add(company_data)
                 else:
                     stats['failed'] += 1
                     stats['errors'].append(f"企業追加失敗: {company_data.get('company_name', 'Unknown')}")
@@ -1360,6 +1525,7 @@ def main():
         
         # 接続状況表示
         show_connection_status()
+        show_schema_status(company_manager)
         
         page = st.sidebar.selectbox(
             "📋 メニュー",
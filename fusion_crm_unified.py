@@ -7,6 +7,9 @@ import pandas as pd
 from datetime import datetime
 import json
 
+from modules.gas_config import resolve_gas_url
+from crm_modules.keyword_matcher import MANUAL_SCORING_MATCHER, estimate_industry
+
 # ========================================
 # ライブラリ可用性チェック（最優先実行）
 # ========================================
@@ -16,6 +19,10 @@ REQUESTS_AVAILABLE = False
 requests_status = "⚠️ requests利用不可"
 try:
     import requests
+    from modules.company_version_cache import VersionedCompanyCache
+    from modules.paged_company_fetch import PagedCompanyFetcher
+    from crm_modules.mutation_journal import MutationJournal
+    from crm_modules.ui_components import show_sync_status
     REQUESTS_AVAILABLE = True
     requests_status = "✅ requests利用可能"
 except ImportError:
@@ -77,18 +84,8 @@ def normalize_companies_data(companies):
         else:
             wifi_display = '❓ 未確認'
         
-        # 業界の推定
-        description = str(company.get('description', '')).lower()
-        if 'construction' in description or 'building' in description:
-            industry = '建設業'
-        elif 'manufacturing' in description or 'factory' in description:
-            industry = '製造業'
-        elif 'software' in description or 'ai' in description or 'platform' in description:
-            industry = 'IT・ソフトウェア'
-        elif 'wifi' in description or 'wireless' in description or 'network' in description:
-            industry = 'ネットワーク・通信'
-        else:
-            industry = 'その他'
+        # 業界の推定（企業説明のキーワードから1回の照合で判定）
+        industry = estimate_industry(company.get('description', ''))
         
         # 正規化されたデータ
         normalized_company = {
@@ -217,68 +214,94 @@ def normalize_excel_data(df):
 # Google Sheets データ取得関数（条件分岐付き）
 # ========================================
 
-@st.cache_data(ttl=300)  # 5分間キャッシュ
+# Google Apps Script URL
+GAS_API_URL = resolve_gas_url("https://script.google.com/macros/s/AKfycby998uiOXSrg9GEDvocVfZR7a7uN_P121G__FRqyJh2zLMJA8KUB2dtsHi7GSZxoRAD-A/exec")
+
+# ページ取得の件数と同時実行数
+GAS_PAGE_SIZE = 500
+GAS_MAX_PARALLEL_PAGES = 4
+
+
+@st.cache_resource
+def get_company_cache(api_url):
+    """企業データのバージョン付きキャッシュ（全セッションで共有、データ本体はページ単位で並列取得）"""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Accept': 'application/json',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Cache-Control': 'no-cache'
+    }
+    fetcher = PagedCompanyFetcher(api_url, page_size=GAS_PAGE_SIZE, max_parallel=GAS_MAX_PARALLEL_PAGES,
+                                  headers=headers, columnar=True)
+    return VersionedCompanyCache(api_url, headers=headers, fetcher=fetcher)
+
+
+@st.cache_resource
+def get_mutation_journal(api_url):
+    """Google Sheetsへの書き込みジャーナル（全セッションで共有、バックグラウンドで再送）"""
+    journal = MutationJournal(api_url, headers={
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    })
+    # 反映後は次回表示時に必ずバージョンを確認
+    journal.on_applied = get_company_cache(api_url).expire
+    return journal.start()
+
+
 def get_google_sheets_data():
-    """Google SheetsからCRMデータを取得（条件分岐付き）"""
-    # requestsライブラリが利用できない場合
+    """Google SheetsからCRMデータを取得（データが変更された場合のみ再ダウンロード）"""
     if not REQUESTS_AVAILABLE:
         st.info("📋 requestsライブラリが利用できないため、サンプルデータを使用します")
         return [], False
     
     try:
-        st.info("🔄 Google Sheetsから企業データを取得中...")
+        cache = get_company_cache(GAS_API_URL)
+        downloads = cache.stats['downloads']
+        progress = st.empty()
+        preview = st.empty()
         
-        # Google Apps Script URL
-        api_url = "https://script.google.com/macros/s/AKfycby998uiOXSrg9GEDvocVfZR7a7uN_P121G__FRqyJh2zLMJA8KUB2dtsHi7GSZxoRAD-A/exec"
+        def on_progress(done, total_rows, normalized):
+            # 届いたページから順に正規化し、先頭ページはすぐにプレビュー表示
+            progress.progress(min(done / total_rows, 1.0) if total_rows else 1.0,
+                              text=f"📥 Google Sheetsから取得中... {done}/{total_rows}社")
+            if done <= GAS_PAGE_SIZE:
+                preview.dataframe(pd.DataFrame(normalized), use_container_width=True)
         
-        # 接続設定
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Cache-Control': 'no-cache'
-        }
-        
-        # APIリクエスト実行
-        response = requests.get(
-            api_url,
-            params={"action": "get_companies"},  # ← コンマを追加
-            headers=headers,
-            timeout=30,
-            verify=True
-        )
+        cache.get_normalized(normalize_companies_data, on_progress=on_progress)
+        progress.empty()
+        preview.empty()
+        changed = cache.stats['downloads'] > downloads
+        companies = cache.companies
         
-        st.info(f"📡 API Response Status: {response.status_code}")
-        
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                
-                # デバッグ情報
-                st.info(f"🔍 Response Keys: {list(data.keys()) if isinstance(data, dict) else 'Not dict'}")
-                
-                # 'companies' キーを使用
-                if data.get('success') and data.get('companies'):
-                    companies = data['companies']
-                    st.success(f"✅ Google Sheets連携成功！{len(companies)}社のデータを取得")
-                    
-                    # デバッグ情報
-                    if companies:
-                        company_names = [c.get('company_name', 'N/A') for c in companies[:3]]
-                        st.info(f"📊 取得企業: {', '.join(company_names)}{'...' if len(companies) > 3 else ''}")
-                    
-                    return companies, True
-                else:
-                    st.warning(f"⚠️ データ取得エラー: success={data.get('success', 'N/A')}, companies存在={bool(data.get('companies'))}")
-                    return [], False
-                    
-            except json.JSONDecodeError as e:
-                st.error(f"❌ JSON解析エラー: {str(e)}")
-                return [], False
+        if changed:
+            st.success(f"✅ Google Sheets連携成功！{len(companies)}社のデータを取得（バージョン: {cache.version}）")
+            
+            # デバッグ情報
+            if companies:
+                company_names = [c.get('company_name', 'N/A') for c in companies[:3]]
+                st.info(f"📊 取得企業: {', '.join(company_names)}{'...' if len(companies) > 3 else ''}")
         else:
-            st.error(f"❌ Google Sheets API HTTP Error: {response.status_code}")
+            st.caption(f"✅ Google Sheetsのデータに変更なし（バージョン: {cache.version}）- キャッシュを使用")
+        
+        if not companies:
+            st.warning("⚠️ データ取得エラー: 企業データが空です")
             return [], False
-
+        
+        return companies, True
+    
+    except requests.exceptions.Timeout:
+        st.warning("⚠️ Google Sheets接続タイムアウト（30秒）- オフラインモードに切り替えます")
+        return [], False
+    except requests.exceptions.ConnectionError:
+        st.warning("⚠️ Google Sheets接続エラー - ネットワーク接続を確認してください")
+        return [], False
+    except requests.exceptions.RequestException as e:
+        st.warning(f"🔗 Google Sheets接続失敗: {str(e)}")
+        return [], False
+    except json.JSONDecodeError as e:
+        st.error(f"❌ JSON解析エラー: {str(e)}")
+        return [], False
     except Exception as e:
         st.warning(f"🔗 Google Sheetsデータ取得エラー: {str(e)}")
         return [], False
@@ -292,87 +315,21 @@ def upload_to_google_sheets(normalized_data):
         return
     
     try:
-        st.info("🔄 Google Sheetsにアップロード中...")
-        
-        # Google Apps Script URL
-        api_url = "https://script.google.com/macros/s/AKfycby998uiOXSrg9GEDvocVfZR7a7uN_P121G__FRqyJh2zLMJA8KUB2dtsHi7GSZxoRAD-A/exec"
-        
-        # アップロード用のデータを準備
-        upload_data = {
-            "action": "add_companies_batch",
-            "companies": normalized_data
-        }
-        
-        st.info(f"📤 {len(normalized_data)}社のデータを送信中...")
-        
-        # APIリクエスト設定
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        # 先にジャーナルへ記録（Google Apps Scriptが遅い・停止中でも入力内容は失われない）
+        journal = get_mutation_journal(GAS_API_URL)
+        journal.record_add_companies(normalized_data)
+        st.success(f"✅ {len(normalized_data)}社のデータを受け付けました！")
+        st.balloons()
         
-        # データサイズを確認
-        data_size = len(json.dumps(upload_data))
-        st.info(f"📊 送信データサイズ: {data_size:,} bytes")
+        # 送信はバックグラウンドでまとめて実行（接続できない間は自動で再送）
+        st.info("📤 Google Sheetsへはバックグラウンドで送信します。未反映の企業も一覧に表示されます。")
         
-        response = requests.post(
-            api_url,
-            json=upload_data,
-            headers=headers,
-            timeout=120,
-            verify=True
-        )
-        
-        st.info(f"📡 API Response Status: {response.status_code}")
-        
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                st.info(f"📄 Raw API Response: {str(result)[:300]}...")
-                
-                if result and result.get('success'):
-                    st.success(f"✅ {len(normalized_data)}社のデータをGoogle Sheetsに追加しました！")
-                    st.balloons()
-                    
-                    # 詳細結果を表示
-                    if 'results' in result:
-                        results = result['results']
-                        success_count = results.get('success', 0)
-                        error_count = results.get('errors', 0)
-                        st.info(f"📊 成功: {success_count}社 | エラー: {error_count}社")
-                        
-                        # 詳細ログを表示
-                        if results.get('details'):
-                            with st.expander("📋 詳細結果を確認"):
-                                for detail in results['details'][:10]:
-                                    if "✅" in detail:
-                                        st.success(detail)
-                                    else:
-                                        st.error(detail)
-                                
-                                if len(results['details']) > 10:
-                                    st.info(f"... 他 {len(results['details']) - 10} 件")
-                    
-                    # キャッシュをクリア
-                    st.cache_data.clear()
-                    st.info("🔄 データキャッシュをクリアしました。")
-                    
-                    # 再読み込みボタンを追加
-                    if st.button("🔄 ページを再読み込み", key="reload_page"):
-                        st.rerun()
-                    
-                else:
-                    error_msg = result.get('error', '不明なエラー') if result else 'レスポンスが空です'
-                    st.error(f"❌ アップロードに失敗しました: {error_msg}")
-                    
-            except json.JSONDecodeError as e:
-                st.error(f"❌ JSON解析エラー: {str(e)}")
-        else:
-            st.error(f"❌ HTTP エラー: {response.status_code}")
+        # 再読み込みボタンを追加
+        if st.button("🔄 ページを再読み込み", key="reload_page"):
+            st.rerun()
             
     except Exception as e:
-        st.error(f"❌ 予期しないエラー: {str(e)}")
+        st.error(f"❌ 受け付けに失敗しました: {str(e)}")
 
 # ========================================
 # データ取得実行（条件分岐）
@@ -390,8 +347,12 @@ if REQUESTS_AVAILABLE:
 # ========================================
 
 if google_sheets_success and google_sheets_companies:
-    # Google Sheetsからの実データを正規化
-    companies_data = normalize_companies_data(google_sheets_companies)
+    # Google Sheetsからの実データを正規化（データが変更された場合のみ再計算）
+    companies_data = get_company_cache(GAS_API_URL).get_normalized(normalize_companies_data)
+    # 未送信の追加・ステータス変更を重ねて表示
+    companies_data = get_mutation_journal(GAS_API_URL).overlay_records(
+        companies_data, normalize=normalize_companies_data, id_key='ID', status_key='ステータス', flag_key=None
+    )
     data_source = f"Google Sheets ({len(companies_data)}社)"
     st.success(f"🔗 リアルデータ表示中: {data_source}")
 else:
@@ -454,6 +415,10 @@ else:
     else:
         st.info(f"📋 オフラインモード（requestsライブラリ不足）: {data_source}")
 
+# Google Sheetsへの未送信の書き込み状況
+if REQUESTS_AVAILABLE:
+    show_sync_status(get_mutation_journal(GAS_API_URL))
+
 # ========================================
 # タブ作成・機能実装
 # ========================================
@@ -672,21 +637,8 @@ with tab4:
         submit_button = st.form_submit_button("🚀 企業を追加", type="primary")
         
         if submit_button and company_name:
-            # スコア計算
-            score = 0
-            desc_lower = description.lower()
-            
-            # WiFi関連キーワード
-            wifi_keywords = ['wifi', 'wireless', 'network', 'mesh', 'connectivity']
-            for keyword in wifi_keywords:
-                if keyword in desc_lower:
-                    score += 15
-            
-            # 建設・製造関連キーワード
-            construction_keywords = ['construction', 'building', 'site', 'manufacturing', 'factory']
-            for keyword in construction_keywords:
-                if keyword in desc_lower:
-                    score += 20
+            # スコア計算（WiFi関連・建設・製造関連キーワード）
+            score = MANUAL_SCORING_MATCHER.score(description.lower())
             
             # 需要レベルボーナス
             need_bonus = {"High": 30, "Medium": 20, "Low": 10}
@@ -895,6 +847,8 @@ with tab6:
     st.subheader("🔄 キャッシュ管理")
     if st.button("🗑️ データキャッシュをクリア", key="clear_cache"):
         st.cache_data.clear()
+        if REQUESTS_AVAILABLE:
+            get_company_cache(GAS_API_URL).expire()
         st.success("✅ キャッシュをクリアしました。")
     
     # システム詳細情報
@@ -7,6 +7,30 @@
 const SPREADSHEET_NAME = "FusionCRM Database";
 const COMPANIES_SHEET_NAME = "Companies";
 const HISTORY_SHEET_NAME = "Status_History";
+const DATA_VERSION_KEY = "companies_data_version";
+
+// シート構成のバージョン（列・シートを変更したら増やす。クライアントは一致を確認して初期化をキャッシュ）
+const SCHEMA_VERSION = 1;
+
+// 企業データシートの列（順序はシートの列順）
+const COMPANY_FIELDS = [
+  "id", "name", "industry", "website", "contact_person", "email", "phone",
+  "picoCela_score", "status", "notes", "created_date", "last_updated"
+];
+
+// 一括追加の処理済みチャンクを記録する期間（秒）。再送時の二重追加を防ぐ
+const BATCH_RESULT_CACHE_SECONDS = 6 * 60 * 60;
+
+// 企業ID→行番号の索引（CacheServiceの上限6時間・1キー100KB）
+const ROW_INDEX_CACHE_KEY = "company_row_index";
+const ROW_INDEX_CACHE_SECONDS = 6 * 60 * 60;
+const ROW_INDEX_CHUNK_SIZE = 2000;
+// これを超える件数の一括更新では索引を1件ずつ確認せずA列から再構築
+const ROW_VERIFY_LIMIT = 20;
+
+// ページングの既定件数と上限（レスポンスサイズ制限対策）
+const DEFAULT_PAGE_SIZE = 500;
+const MAX_PAGE_SIZE = 2000;
 
 /**
  * スプレッドシートとシートを取得または作成
@@ -49,6 +73,23 @@ function getOrCreateSpreadsheet() {
   return spreadsheet;
 }
 
+/**
+ * データベース（スプレッドシート・各シート）を初期化し、URLとスキーマバージョンを返す
+ */
+function initDatabase() {
+  const spreadsheet = getOrCreateSpreadsheet();
+  getCompaniesSheet();
+  getHistorySheet();
+  
+  return {
+    status: "success",
+    success: true,
+    spreadsheet_url: spreadsheet.getUrl(),
+    schema_version: SCHEMA_VERSION,
+    timestamp: new Date().toISOString()
+  };
+}
+
 /**
  * 企業データシートを取得
  */
@@ -95,36 +136,70 @@ function generateId() {
 }
 
 /**
- * すべての企業データを取得
+ * ユニークIDをまとめて生成（バッチ内での重複なし）
+ */
+function generateIds(count) {
+  const ids = [];
+  const seen = {};
+  while (ids.length < count) {
+    const id = generateId();
+    if (!seen[id]) {
+      seen[id] = true;
+      ids.push(id);
+    }
+  }
+  return ids;
+}
+
+/**
+ * 最終更新日をミリ秒に変換（不正な値は0）
  */
-function getCompanies() {
+function toTime(value) {
+  if (value instanceof Date) {
+    return value.getTime();
+  }
+  const time = new Date(value).getTime();
+  return isNaN(time) ? 0 : time;
+}
+
+/**
+ * 企業データを取得
+ * since: 最終更新日がそれより新しい行のみ
+ * options.offset / options.limit: データ行の範囲（ページング）
+ * options.fields: 返す項目（COMPANY_FIELDSの名前、カンマ区切り可）
+ */
+function getCompanies(since, options) {
   try {
+    options = options || {};
     const sheet = getCompaniesSheet();
-    const lastRow = sheet.getLastRow();
+    const totalRows = Math.max(sheet.getLastRow() - 1, 0);
+    const offset = Math.max(parseInt(options.offset, 10) || 0, 0);
+    const limit = options.limit ? Math.max(parseInt(options.limit, 10) || 0, 0) : totalRows;
+    const rowCount = Math.min(limit, totalRows - offset);
     
-    if (lastRow <= 1) {
+    if (rowCount <= 0) {
       return [];
     }
     
-    const data = sheet.getRange(2, 1, lastRow - 1, 12).getValues();
+    const fields = parseFields(options.fields);
+    const indexes = fields.map(field => COMPANY_FIELDS.indexOf(field));
+    
+    // 必要な列までのみ読み込む（差分取得時は最終更新日列まで）
+    const columnCount = since ? COMPANY_FIELDS.length : Math.max.apply(null, indexes) + 1;
+    const data = sheet.getRange(2 + offset, 1, rowCount, columnCount).getValues();
     const companies = [];
+    const sinceTime = since ? toTime(since) : null;
     
     data.forEach(row => {
+      if (sinceTime !== null && toTime(row[11]) <= sinceTime) {
+        return; // 差分取得: 前回同期以降に更新されていない行は除外
+      }
       if (row[0]) { // IDが存在する行のみ
-        companies.push({
-          id: row[0],
-          name: row[1],
-          industry: row[2],
-          website: row[3],
-          contact_person: row[4],
-          email: row[5],
-          phone: row[6],
-          picoCela_score: row[7],
-          status: row[8],
-          notes: row[9],
-          created_date: row[10],
-          last_updated: row[11]
+        const company = {};
+        fields.forEach((field, i) => {
+          company[field] = row[indexes[i]];
         });
+        companies.push(company);
       }
     });
     
@@ -135,6 +210,192 @@ function getCompanies() {
   }
 }
 
+/**
+ * 企業データを列形式で取得（項目名は1回のみ、値は列ごとの配列）
+ * 引数はgetCompaniesと同じ
+ */
+function getCompanyColumns(since, options) {
+  options = options || {};
+  const fields = parseFields(options.fields);
+  const columns = fields.map(() => []);
+  const sheet = getCompaniesSheet();
+  const totalRows = Math.max(sheet.getLastRow() - 1, 0);
+  const offset = Math.max(parseInt(options.offset, 10) || 0, 0);
+  const limit = options.limit ? Math.max(parseInt(options.limit, 10) || 0, 0) : totalRows;
+  const rowCount = Math.min(limit, totalRows - offset);
+  
+  if (rowCount <= 0) {
+    return {fields: fields, columns: columns, count: 0};
+  }
+  
+  const indexes = fields.map(field => COMPANY_FIELDS.indexOf(field));
+  const columnCount = since ? COMPANY_FIELDS.length : Math.max.apply(null, indexes) + 1;
+  const data = sheet.getRange(2 + offset, 1, rowCount, columnCount).getValues();
+  const sinceTime = since ? toTime(since) : null;
+  let count = 0;
+  
+  data.forEach(row => {
+    if (sinceTime !== null && toTime(row[11]) <= sinceTime) {
+      return;
+    }
+    if (row[0]) {
+      indexes.forEach((index, i) => columns[i].push(row[index]));
+      count++;
+    }
+  });
+  
+  return {fields: fields, columns: columns, count: count};
+}
+
+/**
+ * 企業データの応答部分を指定形式で作成
+ * format: "columnar"で列形式、compress: "gzip"で列形式をgzip+base64で返す
+ * （未指定時は従来通りcompanies/dataに行オブジェクトの配列）
+ */
+function buildCompaniesPayload(since, options, format, compress) {
+  if (format !== "columnar") {
+    const companies = getCompanies(since, options);
+    return {data: companies, companies: companies, count: companies.length};
+  }
+  
+  const table = getCompanyColumns(since, options);
+  const payload = {format: "columnar", count: table.count};
+  if (compress === "gzip") {
+    const json = JSON.stringify({fields: table.fields, columns: table.columns});
+    const blob = Utilities.gzip(Utilities.newBlob(json, "application/json"));
+    payload.encoding = "gzip+base64";
+    payload.payload = Utilities.base64Encode(blob.getBytes());
+  } else {
+    payload.fields = table.fields;
+    payload.columns = table.columns;
+  }
+  return payload;
+}
+
+/**
+ * 返却項目の指定を検証（未指定・不正な項目のみの場合は全項目）
+ */
+function parseFields(fields) {
+  if (!fields) {
+    return COMPANY_FIELDS;
+  }
+  const requested = Array.isArray(fields) ? fields : String(fields).split(",");
+  const valid = requested
+    .map(field => String(field).trim())
+    .filter(field => COMPANY_FIELDS.indexOf(field) !== -1);
+  if (valid.length === 0) {
+    return COMPANY_FIELDS;
+  }
+  // IDは常に含める
+  return valid.indexOf("id") === -1 ? ["id"].concat(valid) : valid;
+}
+
+/**
+ * 企業データを1ページ取得（総行数と次ページの位置を付与）
+ */
+function getCompaniesPage(params) {
+  const sheet = getCompaniesSheet();
+  const totalRows = Math.max(sheet.getLastRow() - 1, 0);
+  const offset = Math.max(parseInt(params.offset, 10) || 0, 0);
+  const limit = Math.min(Math.max(parseInt(params.limit, 10) || DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE);
+  const payload = buildCompaniesPayload(
+    params.since, {offset: offset, limit: limit, fields: params.fields}, params.format, params.compress
+  );
+  const nextOffset = offset + limit;
+  
+  return Object.assign({
+    status: "success",
+    success: true,
+    offset: offset,
+    limit: limit,
+    total_rows: totalRows,
+    has_more: nextOffset < totalRows,
+    next_offset: nextOffset < totalRows ? nextOffset : null,
+    fields: parseFields(params.fields),
+    version: getDataVersion()
+  }, payload);
+}
+
+/**
+ * 企業数（IDが存在する行数）を取得
+ */
+function countCompanies() {
+  const sheet = getCompaniesSheet();
+  const lastRow = sheet.getLastRow();
+  
+  if (lastRow <= 1) {
+    return 0;
+  }
+  
+  return sheet.getRange(2, 1, lastRow - 1, 1).getValues().filter(row => row[0]).length;
+}
+
+/**
+ * 企業データのバージョンを取得（書き込みのたびに増加）
+ */
+function getDataVersion() {
+  const version = PropertiesService.getScriptProperties().getProperty(DATA_VERSION_KEY);
+  return version ? parseInt(version, 10) : 0;
+}
+
+/**
+ * 企業データのバージョンを更新（同時書き込みでも取りこぼさないようロック）
+ */
+function bumpDataVersion() {
+  const lock = LockService.getScriptLock();
+  lock.waitLock(10000);
+  try {
+    return incrementDataVersion_();
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+/**
+ * 企業データのバージョンを更新（スクリプトロックを保持している呼び出し元用、ロックは取得・解放しない）
+ */
+function incrementDataVersion_() {
+  const version = getDataVersion() + 1;
+  PropertiesService.getScriptProperties().setProperty(DATA_VERSION_KEY, String(version));
+  return version;
+}
+
+/**
+ * バージョンが変わっていれば企業データを返し、変わっていなければ未変更のみ返す
+ * versionOnlyの場合は企業データを含めない（クライアントがページ単位で取得）
+ */
+function getCompaniesIfChanged(clientVersion, versionOnly, format, compress) {
+  const version = getDataVersion();
+  
+  if (clientVersion !== undefined && clientVersion !== null && clientVersion !== "" &&
+      parseInt(clientVersion, 10) === version) {
+    return {
+      status: "success",
+      success: true,
+      modified: false,
+      version: version
+    };
+  }
+  
+  if (versionOnly === true || versionOnly === "true") {
+    return {
+      status: "success",
+      success: true,
+      modified: true,
+      version: version,
+      total_rows: Math.max(getCompaniesSheet().getLastRow() - 1, 0)
+    };
+  }
+  
+  // 読み込み中の書き込みは次回の確認で検出されるよう、読み込み前のバージョンを返す
+  return Object.assign({
+    status: "success",
+    success: true,
+    modified: true,
+    version: version
+  }, buildCompaniesPayload(null, null, format, compress));
+}
+
 /**
  * 新しい企業を追加
  */
@@ -144,22 +405,10 @@ function addCompany(companyData) {
     const id = generateId();
     const now = new Date();
     
-    const rowData = [
-      id,
-      companyData.name,
-      companyData.industry || "",
-      companyData.website || "",
-      companyData.contact_person || "",
-      companyData.email || "",
-      companyData.phone || "",
-      companyData.picoCela_score || 5,
-      companyData.status || "New",
-      companyData.notes || "",
-      companyData.created_date || now,
-      now
-    ];
+    const rowData = buildCompanyRow(companyData, id, now);
     
     sheet.appendRow(rowData);
+    bumpDataVersion();
     
     return {
       success: true,
@@ -173,41 +422,271 @@ function addCompany(companyData) {
 }
 
 /**
- * 企業ステータスを更新
+ * 企業データを1行分の配列に変換（Python側の項目名にも対応）
  */
-function updateCompanyStatus(companyId, newStatus, note = "") {
+function buildCompanyRow(companyData, id, now) {
+  return [
+    id,
+    companyData.name || companyData.company_name,
+    companyData.industry || "",
+    companyData.website || companyData.website_url || "",
+    companyData.contact_person || companyData.contact || "",
+    companyData.email || "",
+    companyData.phone || "",
+    companyData.picoCela_score || companyData.picoCELA_relevance || 5,
+    companyData.status || companyData.sales_status || "New",
+    companyData.notes || companyData.description || "",
+    companyData.created_date || now,
+    now
+  ];
+}
+
+/**
+ * 複数の企業を一括追加（1回のsetValuesで書き込み、行ごとの結果を返す）
+ * chunkIdを指定した場合、同じチャンクの再送には前回の結果を返す
+ */
+function addCompaniesBatch(companies, chunkId) {
+  const startTime = Date.now();
+  const cache = CacheService.getScriptCache();
+  const cacheKey = chunkId ? "batch_" + chunkId : null;
+  
+  if (cacheKey) {
+    const cached = cache.get(cacheKey);
+    if (cached) {
+      return restoreBatchResult(cached);
+    }
+  }
+  
+  const lock = LockService.getScriptLock();
+  lock.waitLock(30000);
   try {
+    // ロック待ちの間に同じチャンクが処理された場合
+    if (cacheKey) {
+      const cached = cache.get(cacheKey);
+      if (cached) {
+        return restoreBatchResult(cached);
+      }
+    }
+    
     const sheet = getCompaniesSheet();
-    const data = sheet.getDataRange().getValues();
-    
-    // 企業を検索
-    let rowIndex = -1;
-    let currentStatus = "";
-    let companyName = "";
-    
-    for (let i = 1; i < data.length; i++) {
-      if (data[i][0] === companyId) {
-        rowIndex = i + 1;
-        currentStatus = data[i][8];
-        companyName = data[i][1];
-        break;
+    const now = new Date();
+    const list = companies || [];
+    const ids = generateIds(list.length);
+    const values = [];
+    const rows = [];
+    const details = [];
+    
+    list.forEach((companyData, index) => {
+      const name = companyData && (companyData.name || companyData.company_name);
+      if (!name) {
+        rows.push({index: index, success: false, error: "企業名がありません"});
+        details.push(`❌ ${index + 1}行目: 企業名がありません`);
+        return;
       }
+      values.push(buildCompanyRow(companyData, ids[index], now));
+      rows.push({index: index, success: true, id: ids[index]});
+      details.push(`✅ ${name}`);
+    });
+    
+    if (values.length > 0) {
+      sheet.getRange(sheet.getLastRow() + 1, 1, values.length, COMPANY_FIELDS.length).setValues(values);
     }
     
-    if (rowIndex === -1) {
-      throw new Error("指定された企業が見つかりません");
+    const result = {
+      status: "success",
+      success: true,
+      results: {
+        success: values.length,
+        errors: list.length - values.length,
+        details: details
+      },
+      rows: rows,
+      executionTime: Date.now() - startTime
+    };
+    
+    // 処理済みの記録はロックを保持したまま書き込む（同じchunkIdの再送がロック解放後に必ず参照できるように）
+    if (cacheKey) {
+      try {
+        // 1キー100KBの上限に収まるよう、行ごとのIDのみ記録（2000行で約26KB）
+        cache.put(cacheKey, rows.map(row => row.success ? row.id : "").join(","), BATCH_RESULT_CACHE_SECONDS);
+      } catch (error) {
+        console.error("一括追加結果のキャッシュエラー:", error);
+      }
     }
     
-    // ステータスと最終更新日を更新
-    sheet.getRange(rowIndex, 9).setValue(newStatus); // ステータス列
-    sheet.getRange(rowIndex, 12).setValue(new Date()); // 最終更新日列
+    if (values.length > 0) {
+      incrementDataVersion_();
+    }
     
-    // 履歴を記録
-    addStatusHistory(companyId, companyName, currentStatus, newStatus, note);
+    return result;
+  } catch (error) {
+    console.error("一括追加エラー:", error);
+    throw new Error("企業の一括追加に失敗しました: " + error.toString());
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+/**
+ * 処理済みチャンクの記録（行ごとのID、失敗行は空）から一括追加結果を復元
+ */
+function restoreBatchResult(cached) {
+  const rows = [];
+  const details = [];
+  cached.split(",").forEach((id, index) => {
+    if (id) {
+      rows.push({index: index, success: true, id: id});
+      details.push(`✅ ${index + 1}行目: ${id}`);
+    } else {
+      rows.push({index: index, success: false, error: "企業名がありません"});
+      details.push(`❌ ${index + 1}行目: 企業名がありません`);
+    }
+  });
+  const succeeded = rows.filter(row => row.success).length;
+  
+  return {
+    status: "success",
+    success: true,
+    results: {
+      success: succeeded,
+      errors: rows.length - succeeded,
+      details: details
+    },
+    rows: rows,
+    duplicate_chunk: true
+  };
+}
+
+/**
+ * 企業ID→行番号の索引を取得（CacheServiceに分割保存、なければA列のみ読み込んで再構築）
+ */
+function getRowIndex(forceRebuild) {
+  const cache = CacheService.getScriptCache();
+  
+  if (!forceRebuild) {
+    const meta = cache.get(ROW_INDEX_CACHE_KEY);
+    if (meta) {
+      const keys = [];
+      for (let i = 0; i < parseInt(meta, 10); i++) {
+        keys.push(ROW_INDEX_CACHE_KEY + "_" + i);
+      }
+      const parts = cache.getAll(keys);
+      if (keys.every(key => parts[key])) {
+        const index = {};
+        keys.forEach(key => Object.assign(index, JSON.parse(parts[key])));
+        return index;
+      }
+    }
+  }
+  
+  return rebuildRowIndex();
+}
+
+/**
+ * 行番号の索引を再構築して保存
+ */
+function rebuildRowIndex() {
+  const sheet = getCompaniesSheet();
+  const lastRow = sheet.getLastRow();
+  const index = {};
+  
+  if (lastRow > 1) {
+    sheet.getRange(2, 1, lastRow - 1, 1).getValues().forEach((row, i) => {
+      if (row[0]) {
+        index[row[0]] = i + 2;
+      }
+    });
+  }
+  
+  saveRowIndex(index);
+  return index;
+}
+
+/**
+ * 索引をCacheServiceに保存（1キー100KBの上限があるため分割）
+ */
+function saveRowIndex(index) {
+  const cache = CacheService.getScriptCache();
+  const ids = Object.keys(index);
+  const parts = {};
+  let count = 0;
+  
+  for (let start = 0; start < ids.length || count === 0; start += ROW_INDEX_CHUNK_SIZE) {
+    const part = {};
+    ids.slice(start, start + ROW_INDEX_CHUNK_SIZE).forEach(id => {
+      part[id] = index[id];
+    });
+    parts[ROW_INDEX_CACHE_KEY + "_" + count] = JSON.stringify(part);
+    count++;
+  }
+  
+  try {
+    cache.putAll(parts, ROW_INDEX_CACHE_SECONDS);
+    cache.put(ROW_INDEX_CACHE_KEY, String(count), ROW_INDEX_CACHE_SECONDS);
+  } catch (error) {
+    console.error("行番号索引の保存エラー:", error); // 保存できない場合は次回再構築
+  }
+}
+
+/**
+ * 索引を破棄（行の削除・並べ替えをした場合）
+ */
+function clearRowIndex() {
+  CacheService.getScriptCache().remove(ROW_INDEX_CACHE_KEY);
+}
+
+/**
+ * 企業IDの行番号を検索（索引にない・索引の行が別の企業を指している場合は索引を再構築）
+ */
+function findCompanyRows(sheet, companyIds) {
+  const rows = {};
+  
+  if (companyIds.length > ROW_VERIFY_LIMIT) {
+    // 大量更新では1件ずつ確認せず、A列を一度だけ読み込む
+    const index = rebuildRowIndex();
+    companyIds.forEach(id => {
+      if (index[id]) {
+        rows[id] = index[id];
+      }
+    });
+    return rows;
+  }
+  
+  const lookup = index => {
+    let complete = true;
+    companyIds.forEach(id => {
+      // 索引の行番号が正しいかをA列の該当セルのみで確認
+      if (index[id] && sheet.getRange(index[id], 1).getValue() === id) {
+        rows[id] = index[id];
+      } else {
+        complete = false;
+      }
+    });
+    return complete;
+  };
+  
+  if (!lookup(getRowIndex(false))) {
+    lookup(rebuildRowIndex());
+  }
+  
+  return rows;
+}
+
+/**
+ * 企業ステータスを更新
+ */
+function updateCompanyStatus(companyId, newStatus, note = "") {
+  try {
+    const result = updateStatusBatch([{company_id: companyId, new_status: newStatus, note: note}]);
+    const item = result.results[0];
+    
+    if (!item.success) {
+      throw new Error(item.error);
+    }
     
     return {
       success: true,
-      message: `ステータスを ${currentStatus} から ${newStatus} に更新しました`
+      message: `ステータスを ${item.old_status} から ${item.new_status} に更新しました`
     };
   } catch (error) {
     console.error("ステータス更新エラー:", error);
@@ -215,6 +694,110 @@ function updateCompanyStatus(companyId, newStatus, note = "") {
   }
 }
 
+/**
+ * 複数企業のステータスを一括更新
+ * updates: [{company_id, new_status, note}]（companyId / status も可）
+ * 連続する行はまとめて書き込み、履歴は1回のsetValuesで追加する
+ */
+function updateStatusBatch(updates, defaultStatus, defaultNote) {
+  const lock = LockService.getScriptLock();
+  lock.waitLock(30000);
+  try {
+    const sheet = getCompaniesSheet();
+    const now = new Date();
+    const items = (updates || []).map((update, i) => ({
+      position: i,
+      companyId: update.company_id || update.companyId,
+      newStatus: update.new_status || update.status || defaultStatus,
+      note: update.note !== undefined ? update.note : (defaultNote || "")
+    }));
+    const rows = findCompanyRows(sheet, items.map(item => item.companyId).filter(id => id));
+    const results = new Array(items.length);
+    const targets = [];
+    
+    items.forEach(item => {
+      if (!item.companyId || !item.newStatus) {
+        results[item.position] = {company_id: item.companyId || null, success: false, error: "企業IDまたはステータスがありません"};
+      } else if (!rows[item.companyId]) {
+        results[item.position] = {company_id: item.companyId, success: false, error: "指定された企業が見つかりません"};
+      } else {
+        item.row = rows[item.companyId];
+        targets.push(item);
+      }
+    });
+    
+    // 同じ企業が複数回指定された場合は最後の指定を採用
+    const byRow = {};
+    targets.forEach(item => {
+      byRow[item.row] = item;
+    });
+    const rowNumbers = Object.keys(byRow).map(Number).sort((a, b) => a - b);
+    
+    // 連続する行ごとに1回読み込み・1回書き込み（ステータス〜最終更新日の4列）
+    const history = [];
+    const user = Session.getActiveUser().getEmail();
+    let runStart = 0;
+    while (runStart < rowNumbers.length) {
+      let runEnd = runStart;
+      while (runEnd + 1 < rowNumbers.length && rowNumbers[runEnd + 1] === rowNumbers[runEnd] + 1) {
+        runEnd++;
+      }
+      const firstRow = rowNumbers[runStart];
+      const count = runEnd - runStart + 1;
+      const current = sheet.getRange(firstRow, 1, count, COMPANY_FIELDS.length).getValues();
+      const values = current.map((row, i) => {
+        const item = byRow[firstRow + i];
+        item.oldStatus = row[8];
+        item.companyName = row[1];
+        return [item.newStatus, row[9], row[10], now];
+      });
+      sheet.getRange(firstRow, 9, count, 4).setValues(values);
+      runStart = runEnd + 1;
+    }
+    
+    targets.forEach(item => {
+      const applied = byRow[item.row];
+      results[item.position] = {
+        company_id: item.companyId,
+        success: true,
+        old_status: applied.oldStatus,
+        new_status: applied.newStatus
+      };
+    });
+    
+    rowNumbers.forEach(row => {
+      const item = byRow[row];
+      history.push([
+        "HST_" + Utilities.getUuid().substring(0, 8),
+        item.companyId,
+        item.companyName,
+        item.oldStatus,
+        item.newStatus,
+        item.note || "",
+        user,
+        now
+      ]);
+    });
+    
+    if (history.length > 0) {
+      const historySheet = getHistorySheet();
+      historySheet.getRange(historySheet.getLastRow() + 1, 1, history.length, history[0].length).setValues(history);
+      incrementDataVersion_();
+    }
+    
+    const updated = results.filter(result => result.success).length;
+    return {
+      status: "success",
+      success: true,
+      updated: updated,
+      failed: results.length - updated,
+      results: results
+    };
+  } finally {
+    lock.releaseLock();
+  }
+}
+
 /**
  * ステータス変更履歴を追加
  */
@@ -273,13 +856,47 @@ function doPost(e) {
         };
         break;
         
+      case "init_database":
+      case "initDatabase":
+        result = initDatabase();
+        break;
+        
       case "getCompanies":
-        const companies = getCompanies();
-        result = {
+      case "get_companies":
+        // 読み込み前の時刻を次回の差分同期の基準にする（読み込み中の更新を取りこぼさない）
+        const serverTime = new Date().toISOString();
+        result = Object.assign({
           status: "success",
-          data: companies,
-          count: companies.length
-        };
+          success: true,
+          total: countCompanies(),
+          since: requestData.since || null,
+          server_time: serverTime
+        }, buildCompaniesPayload(requestData.since, null, requestData.format, requestData.compress));
+        break;
+        
+      case "get_companies_page":
+        result = getCompaniesPage(requestData);
+        break;
+        
+      case "get_companies_if_changed":
+        result = getCompaniesIfChanged(
+          requestData.version, requestData.version_only, requestData.format, requestData.compress
+        );
+        break;
+        
+      case "add_companies_batch":
+      case "addCompaniesBatch":
+        result = addCompaniesBatch(requestData.companies, requestData.chunkId);
+        break;
+        
+      case "update_status_batch":
+      case "updateStatusBatch":
+        result = updateStatusBatch(
+          requestData.updates ||
+            (requestData.company_ids || requestData.companyIds || []).map(id => ({company_id: id})),
+          requestData.new_status || requestData.status,
+          requestData.note
+        );
         break;
         
       case "addCompany":
@@ -330,6 +947,22 @@ function doPost(e) {
  * GET リクエスト対応（テスト用）
  */
 function doGet(e) {
+  const params = (e && e.parameter) || {};
+  
+  if (params.action === "get_companies_if_changed") {
+    return ContentService
+      .createTextOutput(JSON.stringify(
+        getCompaniesIfChanged(params.version, params.version_only, params.format, params.compress)
+      ))
+      .setMimeType(ContentService.MimeType.JSON);
+  }
+  
+  if (params.action === "get_companies_page") {
+    return ContentService
+      .createTextOutput(JSON.stringify(getCompaniesPage(params)))
+      .setMimeType(ContentService.MimeType.JSON);
+  }
+  
   const testResult = {
     status: "success",
     message: "FusionCRM Google Apps Script バックエンドが稼働中です",
@@ -0,0 +1,159 @@
+"""
+宛先アドレス検証
+企業データのメールアドレスを列単位で正規化・分割・構文チェックし、送信前に無効な宛先を除外
+"""
+
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+
+# 空欄とみなす値（Sheets・CSV由来の文字列化された欠損値）
+NULL_TOKENS = ['', 'nan', 'none', 'null', 'n/a', 'na', '-', '#n/a']
+
+# 1セル内の複数アドレスの区切り文字
+ADDRESS_SEPARATORS = r'[;,/|\s]+'
+
+# アドレス構文（RFC 5322のdot-atom形式、ドメインはTLD 2文字以上）
+EMAIL_PATTERN = (
+    r"[a-z0-9!#$%&'*+=?^_`{|}~-]+(?:\.[a-z0-9!#$%&'*+=?^_`{|}~-]+)*"
+    r"@(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}"
+)
+MAX_ADDRESS_LENGTH = 254
+
+# 使い捨てメールのドメイン
+DISPOSABLE_DOMAINS = {
+    'mailinator.com', 'guerrillamail.com', 'guerrillamail.net', 'sharklasers.com', '10minutemail.com',
+    'tempmail.com', 'temp-mail.org', 'throwawaymail.com', 'yopmail.com', 'getnada.com',
+    'trashmail.com', 'dispostable.com', 'maildrop.cc', 'fakeinbox.com', 'mintemail.com',
+    'mohmal.com', 'emailondeck.com', 'spamgourmet.com', 'mailnesia.com', 'tempr.email'
+}
+
+# 受信者がいない・送信すべきでないロールアカウント（常に除外）
+BLOCKED_ROLE_ACCOUNTS = {
+    'noreply', 'no-reply', 'donotreply', 'do-not-reply', 'mailer-daemon', 'postmaster',
+    'abuse', 'bounce', 'bounces', 'hostmaster', 'webmaster'
+}
+
+# 代表アドレス（B2Bでは唯一の窓口の場合が多いため既定では除外せずフラグのみ）
+ROLE_ACCOUNTS = {
+    'info', 'contact', 'sales', 'support', 'admin', 'office', 'hello', 'enquiries',
+    'inquiry', 'marketing', 'help', 'team', 'service', 'customerservice'
+}
+
+# 除外理由
+REASON_EMPTY = 'empty'
+REASON_SYNTAX = 'syntax'
+REASON_DISPOSABLE = 'disposable'
+REASON_ROLE = 'role_account'
+REASON_DUPLICATE = 'duplicate'
+
+
+def normalize_addresses(emails: pd.Series) -> pd.Series:
+    """前後の空白・mailto:を除去して小文字化（欠損値は空文字）"""
+    normalized = emails.astype('string').fillna('').str.strip().str.lower()
+    normalized = normalized.str.replace(r'\bmailto:', '', regex=True)
+    return normalized.mask(normalized.isin(NULL_TOKENS), '')
+
+
+def split_addresses(emails: pd.Series) -> pd.DataFrame:
+    """1セル内の複数アドレスを行に展開（表示名・山括弧は除去、元の行番号とセル内の順序を保持）"""
+    exploded = emails.str.split(ADDRESS_SEPARATORS, regex=True).explode()
+    exploded = exploded.fillna('').str.strip(' <>"\'.')
+    frame = exploded.rename('email').to_frame()
+    frame['source_row'] = frame.index
+    frame['position'] = frame.groupby(level=0).cumcount()
+    return frame.reset_index(drop=True)
+
+
+def validate_recipients(df: pd.DataFrame, email_column: str = 'email',
+                        reject_role_accounts: bool = False,
+                        drop_duplicates: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame, Dict]:
+    """企業データを検証し（有効な宛先, 除外した宛先, 件数）を返す
+
+    有効な宛先は1社1アドレス（セル内で最初に有効なもの）。複数社で同じアドレスの場合は
+    件数（shared_addresses）のみ報告し、drop_duplicates=Trueのときのみ最初の1社以外を除外する
+    """
+    source = df.reset_index(drop=True)
+    raw = source[email_column] if email_column in source.columns else pd.Series([''] * len(source))
+
+    candidates = split_addresses(normalize_addresses(raw))
+
+    address = candidates['email']
+    parts = address.str.rsplit('@', n=1, expand=True).reindex(columns=[0, 1])
+    local, domain = parts[0].fillna(''), parts[1].fillna('')
+
+    # 判定は列単位で一括実行（優先度の高い理由で上書き）
+    reason = pd.Series(pd.NA, index=candidates.index, dtype='object')
+    reason = reason.mask(address == '', REASON_EMPTY)
+    syntax_ok = address.str.fullmatch(EMAIL_PATTERN) & (address.str.len() <= MAX_ADDRESS_LENGTH)
+    reason = reason.mask(reason.isna() & ~syntax_ok.fillna(False), REASON_SYNTAX)
+    reason = reason.mask(reason.isna() & domain.isin(DISPOSABLE_DOMAINS), REASON_DISPOSABLE)
+    is_role = local.isin(ROLE_ACCOUNTS)
+    blocked_role = local.isin(BLOCKED_ROLE_ACCOUNTS) | (is_role & reject_role_accounts)
+    reason = reason.mask(reason.isna() & blocked_role, REASON_ROLE)
+
+    # 複数アドレスのセル: 構文上有効な異なるアドレスが2つ以上（表示名付きの1アドレスは含めない）
+    addresses = candidates.loc[syntax_ok.fillna(False).astype(bool), ['source_row', 'email']]
+    multi_cells = int((addresses.drop_duplicates().groupby('source_row').size() > 1).sum())
+
+    candidates['reason'] = reason
+    candidates['is_role'] = is_role
+
+    # 1社1アドレス: 各行で最初の有効アドレスを採用
+    valid = candidates[candidates['reason'].isna()].drop_duplicates('source_row', keep='first')
+
+    # 同一アドレスが複数社にある場合は件数を報告（指定時のみ最初の1社以外を除外）
+    duplicate_mask = valid.duplicated('email', keep='first')
+    shared_addresses = int(duplicate_mask.sum())
+    duplicates = valid[duplicate_mask] if drop_duplicates else valid.iloc[:0]
+    if drop_duplicates:
+        valid = valid[~duplicate_mask]
+
+    valid_rows = source.loc[valid['source_row']].copy()
+    valid_rows[email_column] = valid['email'].values
+    valid_rows['is_role_account'] = valid['is_role'].values
+
+    # 有効アドレスが1つもない行の除外理由（セル内の最初の理由）
+    invalid = candidates[~candidates['source_row'].isin(valid['source_row'])]
+    invalid = invalid.drop_duplicates('source_row', keep='first')
+    invalid.loc[invalid['source_row'].isin(duplicates['source_row']), 'reason'] = REASON_DUPLICATE
+    invalid.loc[invalid['reason'].isna(), 'reason'] = REASON_DUPLICATE
+    rejected_rows = source.loc[invalid['source_row']].copy()
+    rejected_rows['reason'] = invalid['reason'].values
+
+    reason_counts = rejected_rows['reason'].value_counts()
+    counts = {
+        'total': len(source),
+        'valid': len(valid_rows),
+        'rejected': len(rejected_rows),
+        'multi_address_cells': multi_cells,
+        'shared_addresses': shared_addresses,
+        'role_accounts': int(valid_rows['is_role_account'].sum()),
+    }
+    for key in (REASON_EMPTY, REASON_SYNTAX, REASON_DISPOSABLE, REASON_ROLE, REASON_DUPLICATE):
+        counts[key] = int(reason_counts.get(key, 0))
+
+    return valid_rows.reset_index(drop=True), rejected_rows.reset_index(drop=True), counts
+
+
+def validate_company_list(companies: List[Dict], email_column: str = 'email',
+                          reject_role_accounts: bool = False,
+                          drop_duplicates: bool = False) -> Tuple[List[Dict], Dict]:
+    """企業データ（辞書のリスト）を検証し、有効な企業のみを返す"""
+    if not companies:
+        return [], {'total': 0, 'valid': 0, 'rejected': 0}
+
+    valid_rows, _, counts = validate_recipients(pd.DataFrame(companies), email_column, reject_role_accounts,
+                                                drop_duplicates)
+    valid_rows = valid_rows.astype(object).where(valid_rows.notna(), None)
+    return valid_rows.to_dict('records'), counts
+
+
+def format_validation_summary(counts: Dict) -> str:
+    """UI表示用の件数サマリー"""
+    return (f"📮 宛先検証: 有効 {counts.get('valid', 0)}件 | 除外 {counts.get('rejected', 0)}件"
+            f"（空欄 {counts.get(REASON_EMPTY, 0)} / 形式不正 {counts.get(REASON_SYNTAX, 0)} / "
+            f"使い捨て {counts.get(REASON_DISPOSABLE, 0)} / 送信不可ロール {counts.get(REASON_ROLE, 0)} / "
+            f"重複 {counts.get(REASON_DUPLICATE, 0)}）| 複数アドレス分割 {counts.get('multi_address_cells', 0)}件"
+            f" | 他社と同じアドレス {counts.get('shared_addresses', 0)}件")
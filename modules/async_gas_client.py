@@ -0,0 +1,179 @@
+"""
+GAS非同期クライアント
+同じアクション・パラメータの読み込みを1回のリクエストにまとめ（シングルフライト）、
+結果をプロセス内で一定時間共有する。Streamlitからは同期ラッパー経由で使用
+"""
+
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from retry_policy import HTTP_RETRY_POLICY
+
+
+# 結果を共有する秒数と、同時に送信するリクエスト数の上限
+DEFAULT_CACHE_TTL = 30
+DEFAULT_MAX_CONCURRENCY = 8
+REQUEST_TIMEOUT = 30
+
+# 読み込み系のアクション（まとめて送信・結果を共有してよいもの）
+READ_ACTIONS = {
+    'get_companies', 'getCompanies', 'get_companies_page', 'get_companies_if_changed', 'test', 'ping'
+}
+
+
+def _cache_key(action: str, method: str, params: Optional[Dict]) -> Tuple[str, str, str]:
+    return action, method, json.dumps(params or {}, sort_keys=True, default=str)
+
+
+def _is_success(result) -> bool:
+    """共有してよい応答か（旧バックエンドの配列応答も成功扱い）"""
+    if isinstance(result, list):
+        return True
+    return bool(result.get('success')) or result.get('status') == 'success'
+
+
+class AsyncGasClient:
+    """asyncio版GASクライアント（イベントループ内でのみ使用）"""
+
+    def __init__(self, gas_url: str, session=None, cache_ttl: float = DEFAULT_CACHE_TTL,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, timeout: float = REQUEST_TIMEOUT,
+                 headers: Optional[Dict] = None):
+        self.gas_url = gas_url
+        self.session = session or requests.Session()
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.headers = headers or {'Accept': 'application/json'}
+        self.stats = {'requests': 0, 'cache_hits': 0, 'coalesced': 0}
+        self._cache: Dict[Tuple[str, str, str], Tuple[float, object]] = {}
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _send(self, action: str, method: str, params: Optional[Dict]):
+        """同期HTTPリクエスト（ワーカースレッドで実行）"""
+        def send():
+            if method == 'GET':
+                response = self.session.get(self.gas_url, params={'action': action, **(params or {})},
+                                            headers=self.headers, timeout=self.timeout)
+            else:
+                response = self.session.post(self.gas_url, json={'action': action, **(params or {})},
+                                             headers={'Content-Type': 'application/json', **self.headers},
+                                             timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        # 読み込みは冪等なため一時エラーをリトライ
+        if action in READ_ACTIONS:
+            return HTTP_RETRY_POLICY.call(send)
+        return send()
+
+    async def _fetch(self, key, action: str, method: str, params: Optional[Dict], ttl: float):
+        async with self._semaphore:
+            self.stats['requests'] += 1
+            result = await asyncio.get_running_loop().run_in_executor(None, self._send, action, method, params)
+        if ttl > 0 and _is_success(result):
+            self._cache[key] = (time.monotonic() + ttl, result)
+        return result
+
+    async def call(self, action: str, params: Optional[Dict] = None, method: str = 'GET',
+                   ttl: Optional[float] = None, force: bool = False):
+        """アクションを実行（読み込みは共有結果・実行中のリクエストを再利用）
+
+        返す結果は複数の呼び出し元で共有されるため、変更しないこと
+        """
+        if action not in READ_ACTIONS:
+            result = await self._fetch(None, action, method, params, 0)
+            # 書き込み後は共有結果を破棄
+            self.invalidate()
+            return result
+
+        ttl = self.cache_ttl if ttl is None else ttl
+        key = _cache_key(action, method, params)
+        if not force:
+            cached = self._cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.stats['cache_hits'] += 1
+                return cached[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(inflight)
+
+        task = asyncio.ensure_future(self._fetch(key, action, method, params, ttl))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def get_companies(self, method: str = 'GET', **params):
+        return await self.call('get_companies', params or None, method)
+
+    def invalidate(self, action: Optional[str] = None):
+        """共有結果を破棄（action指定時はそのアクションのみ）"""
+        if action is None:
+            self._cache.clear()
+        else:
+            for key in [k for k in self._cache if k[0] == action]:
+                del self._cache[key]
+
+
+class GasClient:
+    """AsyncGasClientの同期ラッパー
+
+    専用スレッドのイベントループで実行するため、別スレッド（Streamlitの各セッション）からの
+    同時呼び出しも同じループ内でまとめられる
+    """
+
+    def __init__(self, gas_url: str, **client_options):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gas-client-loop", daemon=True)
+        self._thread.start()
+        self.client: AsyncGasClient = self._run(self._create(gas_url, client_options))
+
+    @staticmethod
+    async def _create(gas_url: str, client_options: Dict) -> AsyncGasClient:
+        # セマフォ等をこのループに結び付けるため、ループ内で生成
+        return AsyncGasClient(gas_url, **client_options)
+
+    def _run(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return dict(self.client.stats)
+
+    def call(self, action: str, params: Optional[Dict] = None, method: str = 'GET',
+             ttl: Optional[float] = None, force: bool = False):
+        return self._run(self.client.call(action, params, method, ttl, force))
+
+    def get_companies(self, method: str = 'GET', **params):
+        return self._run(self.client.get_companies(method, **params))
+
+    def invalidate(self, action: Optional[str] = None):
+        self._loop.call_soon_threadsafe(self.client.invalidate, action)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_shared_clients: Dict[Tuple[str, str], GasClient] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_gas_client(gas_url: str, **client_options) -> GasClient:
+    """GAS URLとオプション（headers等）の組ごとにプロセス内で1つのクライアントを共有
+
+    同じ組の呼び出しは全セッションで結果・実行中リクエストを共有する。
+    オプションが異なる呼び出しには別のクライアントを作る（先に作られた側の設定を流用しない）
+    """
+    key = (gas_url, json.dumps(client_options, sort_keys=True, default=str))
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = _shared_clients[key] = GasClient(gas_url, **client_options)
+        return client
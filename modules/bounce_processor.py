@@ -0,0 +1,333 @@
+"""
+バウンス処理
+mbox/Maildirのエクスポートを逐次読み込み、DSN（配信状態通知）をMessage-IDで送信履歴に照合
+"""
+
+import email
+import json
+import os
+import re
+from email.message import Message
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from email_database import IntegratedEmailDatabase
+from suppression import normalize_address
+
+
+# 1通あたりの読み込み上限（元メール全文付きのバウンスでもメモリを一定に保つ）
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+# 取り込み位置の保存間隔（通数）
+CHECKPOINT_INTERVAL = 500
+
+# 送信履歴に記録する状態
+HARD_BOUNCE = 'bounced'
+SOFT_BOUNCE = 'soft_bounced'
+
+# DSNを含まないバウンス向けの簡易抽出
+MESSAGE_ID_PATTERN = re.compile(r'^\s*Message-ID:\s*(<[^>\s]+>)', re.IGNORECASE | re.MULTILINE)
+STATUS_CODE_PATTERN = re.compile(r'\b([245]\.\d{1,3}\.\d{1,3})\b')
+BOUNCE_SENDERS = ('mailer-daemon', 'postmaster')
+
+# 送信元名のみで判定する場合に必要な配信失敗の記載（SMTP応答＋拡張コード、またはStatus:行）
+FAILURE_STATUS_PATTERN = re.compile(
+    r'\b[45]\d\d[ -][45]\.\d{1,3}\.\d{1,3}\b|^\s*Status:\s*[45]\.\d{1,3}\.\d{1,3}\b',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+class BounceReport:
+    """宛先1件分の配信状態"""
+
+    def __init__(self, message_id: Optional[str], recipient: str, action: str,
+                 status: str = '', diagnostic: str = ''):
+        self.message_id = message_id
+        self.recipient = recipient
+        self.action = action
+        self.status = status
+        self.diagnostic = diagnostic
+
+    @property
+    def is_failure(self) -> bool:
+        return self.action == 'failed'
+
+    @property
+    def is_hard(self) -> bool:
+        """恒久的な配信失敗（5.x.x）か"""
+        return self.is_failure and not self.status.startswith('4')
+
+
+def _strip_type(value: Optional[str]) -> str:
+    """'rfc822; user@example.com' → 'user@example.com'"""
+    value = str(value or '')
+    if ';' in value:
+        value = value.split(';', 1)[1]
+    return ' '.join(value.split())
+
+
+def _original_message_id(msg: Message) -> Optional[str]:
+    """DSNに添付された元メールのMessage-IDを取得"""
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        if content_type in ('message/rfc822', 'message/global'):
+            payload = part.get_payload()
+            if isinstance(payload, list) and payload and payload[0].get('Message-ID'):
+                return payload[0].get('Message-ID').strip()
+        elif content_type in ('text/rfc822-headers', 'text/global-headers'):
+            payload = part.get_payload(decode=True) or b''
+            headers = email.message_from_string(payload.decode('utf-8', errors='replace'))
+            if headers.get('Message-ID'):
+                return headers.get('Message-ID').strip()
+    return None
+
+
+def _fallback_message_id(msg: Message, raw_text: str) -> Optional[str]:
+    """添付がない場合は本文中・参照ヘッダーから元メールのMessage-IDを探す"""
+    own_id = (msg.get('Message-ID') or '').strip()
+    for found in MESSAGE_ID_PATTERN.findall(raw_text):
+        if found != own_id:
+            return found
+    for header in ('In-Reply-To', 'References'):
+        value = (msg.get(header) or '').split()
+        if value:
+            return value[-1]
+    return None
+
+
+def _is_bounce(msg: Message, raw_text: str) -> bool:
+    """バウンス通知か（DSN形式、または送信元がMAILER-DAEMON等で配信失敗の記載があるもの）"""
+    if msg.get_content_type() == 'multipart/report':
+        return True
+    if msg.get('X-Failed-Recipients'):
+        return True
+    sender = str(msg.get('From') or '').lower()
+    if not any(name in sender for name in BOUNCE_SENDERS):
+        return False
+    # postmaster宛ての返信など人が書いたメールを除外するため、送信元名だけでは判定しない
+    if any(part.get_content_type() == 'message/delivery-status' for part in msg.walk()):
+        return True
+    return bool(FAILURE_STATUS_PATTERN.search(raw_text))
+
+
+def parse_dsn(raw: bytes) -> List[BounceReport]:
+    """バウンスメールを解析し、宛先ごとの配信状態を返す（バウンス以外は空リスト）"""
+    msg = email.message_from_bytes(raw)
+    raw_text = raw.decode('utf-8', errors='replace')
+    if not _is_bounce(msg, raw_text):
+        return []
+
+    message_id = _original_message_id(msg)
+    reports = []
+
+    # RFC 3464: message/delivery-statusの2ブロック目以降が宛先ごとのフィールド
+    for part in msg.walk():
+        if part.get_content_type() != 'message/delivery-status':
+            continue
+        blocks = part.get_payload()
+        if not isinstance(blocks, list):
+            continue
+        for block in blocks[1:]:
+            recipient = _strip_type(block.get('Final-Recipient') or block.get('Original-Recipient'))
+            if not recipient:
+                continue
+            reports.append(BounceReport(
+                message_id=message_id,
+                recipient=normalize_address(recipient),
+                action=str(block.get('Action') or '').strip().lower(),
+                status=str(block.get('Status') or '').strip(),
+                diagnostic=_strip_type(block.get('Diagnostic-Code'))
+            ))
+
+    if reports:
+        return reports
+
+    # DSN形式でないバウンス（X-Failed-Recipients・本文のステータスコード）
+    message_id = message_id or _fallback_message_id(msg, raw_text)
+    status_match = STATUS_CODE_PATTERN.search(raw_text)
+    status = status_match.group(1) if status_match else '5.0.0'
+
+    recipients = str(msg.get('X-Failed-Recipients') or '').split(',')
+    for recipient in recipients:
+        recipient = normalize_address(recipient)
+        if recipient:
+            reports.append(BounceReport(message_id, recipient, 'failed', status))
+
+    if not reports and message_id:
+        reports.append(BounceReport(message_id, '', 'failed', status))
+
+    return reports
+
+
+def iter_mbox(path: str, offset: int = 0,
+              max_message_bytes: int = MAX_MESSAGE_BYTES) -> Iterator[Tuple[bytes, int]]:
+    """mboxを1通ずつ読み込み（本文, 次のメールの開始オフセット）を返す"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        position = offset
+        chunks = []
+        size = 0
+        started = False
+        previous_blank = True
+
+        for line in f:
+            if previous_blank and line.startswith(b'From '):
+                if started:
+                    yield b''.join(chunks), position
+                chunks = []
+                size = 0
+                started = True
+            elif started and size < max_message_bytes:
+                # mboxrd形式のエスケープ（>From）を戻す
+                if line.startswith(b'>') and line.lstrip(b'>').startswith(b'From '):
+                    line = line[1:]
+                chunks.append(line)
+                size += len(line)
+
+            position += len(line)
+            previous_blank = line in (b'\n', b'\r\n')
+
+        if started:
+            yield b''.join(chunks), position
+
+
+def _mbox_start_offset(path: str, saved_offset: int) -> int:
+    """保存済みオフセットが有効か確認（ファイルの差し替え・切り詰め時は先頭から）"""
+    if saved_offset <= 0:
+        return 0
+    if saved_offset > os.path.getsize(path):
+        return 0
+    if saved_offset == os.path.getsize(path):
+        return saved_offset
+    with open(path, 'rb') as f:
+        f.seek(saved_offset)
+        if f.read(5) != b'From ':
+            return 0
+    return saved_offset
+
+
+def _maildir_key(filename: str) -> str:
+    """Maildirのファイル名から一意部分を取得（new→cur移動時のフラグ付与を無視）"""
+    return filename.split(':', 1)[0]
+
+
+class BounceProcessor:
+    """mbox/Maildirのバウンスを送信履歴・配信停止リストに反映"""
+
+    def __init__(self, db: Optional[IntegratedEmailDatabase] = None,
+                 checkpoint_interval: int = CHECKPOINT_INTERVAL):
+        self.db = db or IntegratedEmailDatabase()
+        self.checkpoint_interval = checkpoint_interval
+
+    @staticmethod
+    def _new_stats() -> Dict:
+        return {'messages': 0, 'bounces': 0, 'hard': 0, 'soft': 0,
+                'matched': 0, 'unmatched': 0, 'suppressed': 0}
+
+    def process_message(self, raw: bytes, stats: Dict):
+        """1通分のバウンスを反映"""
+        stats['messages'] += 1
+
+        for report in parse_dsn(raw):
+            if not report.is_failure:
+                continue
+            stats['bounces'] += 1
+
+            status = HARD_BOUNCE if report.is_hard else SOFT_BOUNCE
+            stats['hard' if report.is_hard else 'soft'] += 1
+
+            if report.message_id:
+                response = f"bounce {report.status}: {report.diagnostic}".strip()[:100]
+                if self.db.apply_bounce(report.message_id, status, response):
+                    stats['matched'] += 1
+                else:
+                    stats['unmatched'] += 1
+            else:
+                stats['unmatched'] += 1
+
+            # 恒久エラーの宛先は以後送信しない
+            if report.is_hard and report.recipient:
+                self.db.add_suppressed_address(report.recipient, reason='hard_bounce', source='dsn')
+                stats['suppressed'] += 1
+
+    def process_mbox(self, path: str) -> Dict:
+        """mboxを前回の続きから処理"""
+        source = f"mbox:{os.path.abspath(path)}"
+        saved = json.loads(self.db.get_ingest_position(source) or '{}')
+        offset = _mbox_start_offset(path, int(saved.get('offset', 0)))
+
+        stats = self._new_stats()
+        for raw, next_offset in iter_mbox(path, offset):
+            self.process_message(raw, stats)
+            offset = next_offset
+            if stats['messages'] % self.checkpoint_interval == 0:
+                self.db.set_ingest_position(source, json.dumps({'offset': offset}))
+
+        self.db.set_ingest_position(source, json.dumps({'offset': offset}))
+        return stats
+
+    def process_maildir(self, path: str) -> Dict:
+        """Maildirの新着ファイル（前回処理時刻以降）のみ処理"""
+        source = f"maildir:{os.path.abspath(path)}"
+        saved = json.loads(self.db.get_ingest_position(source) or '{}')
+        watermark = int(saved.get('mtime_ns', 0))
+        seen_at_watermark = set(saved.get('names', []))
+
+        # ファイル名と更新時刻のみ収集し、本文は1通ずつ読み込む
+        pending = []
+        for sub in ('new', 'cur'):
+            folder = os.path.join(path, sub)
+            if not os.path.isdir(folder):
+                continue
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    mtime_ns = entry.stat().st_mtime_ns
+                    key = _maildir_key(entry.name)
+                    if mtime_ns > watermark or (mtime_ns == watermark and key not in seen_at_watermark):
+                        pending.append((mtime_ns, key, entry.path))
+        pending.sort()
+
+        stats = self._new_stats()
+        for mtime_ns, key, file_path in pending:
+            try:
+                with open(file_path, 'rb') as f:
+                    raw = f.read(MAX_MESSAGE_BYTES)
+            except FileNotFoundError:
+                # 読み込み前に移動・削除されたファイル
+                continue
+
+            self.process_message(raw, stats)
+
+            if mtime_ns != watermark:
+                watermark = mtime_ns
+                seen_at_watermark = set()
+            seen_at_watermark.add(key)
+            if stats['messages'] % self.checkpoint_interval == 0:
+                self._save_maildir_position(source, watermark, seen_at_watermark)
+
+        self._save_maildir_position(source, watermark, seen_at_watermark)
+        return stats
+
+    def _save_maildir_position(self, source: str, watermark: int, names: set):
+        self.db.set_ingest_position(source, json.dumps({'mtime_ns': watermark, 'names': sorted(names)}))
+
+    def process(self, path: str) -> Dict:
+        """パスの種類（ディレクトリ=Maildir、ファイル=mbox）に応じて処理"""
+        if os.path.isdir(path):
+            return self.process_maildir(path)
+        return self.process_mbox(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="mbox/Maildirのバウンスを送信履歴に反映")
+    parser.add_argument('paths', nargs='+', help="mboxファイルまたはMaildirディレクトリ")
+    parser.add_argument('--db', default="picocela_integrated_emails.db", help="データベースファイル")
+    args = parser.parse_args()
+
+    processor = BounceProcessor(IntegratedEmailDatabase(args.db))
+    for target in args.paths:
+        result = processor.process(target)
+        print(f"{target}: {result}")
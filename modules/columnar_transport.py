@@ -0,0 +1,128 @@
+"""
+企業データの列形式転送
+GASの列形式応答（項目名は1回のみ、値は列ごとの配列。gzip+base64圧縮可）を
+行ごとの辞書を作らずに直接DataFrameへ変換する
+
+計測:
+    python modules/columnar_transport.py 10000 100000
+"""
+
+import base64
+import gzip
+import json
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+
+COLUMNAR_FORMAT = 'columnar'
+GZIP_BASE64 = 'gzip+base64'
+
+# 列形式・圧縮を要求するリクエストパラメータ
+COLUMNAR_PARAMS = {'format': COLUMNAR_FORMAT, 'compress': 'gzip'}
+
+
+def is_columnar(result: Dict) -> bool:
+    return isinstance(result, dict) and result.get('format') == COLUMNAR_FORMAT
+
+
+def _load_table(result: Dict) -> Dict:
+    """応答から{fields, columns}を取り出す（圧縮されていれば展開）"""
+    if result.get('encoding') == GZIP_BASE64:
+        return json.loads(gzip.decompress(base64.b64decode(result['payload'])))
+    return {'fields': result.get('fields') or [], 'columns': result.get('columns') or []}
+
+
+def decode_columnar(result: Dict) -> pd.DataFrame:
+    """列形式の応答をDataFrameに変換（列の配列をそのまま各列に使用）"""
+    table = _load_table(result)
+    fields = table['fields']
+    return pd.DataFrame(dict(zip(fields, table['columns'])), columns=fields)
+
+
+def companies_dataframe(result: Dict) -> pd.DataFrame:
+    """get_companies系の応答をDataFrameに変換（列形式・従来の行形式の両方に対応）"""
+    if is_columnar(result):
+        return decode_columnar(result)
+    return pd.DataFrame(result.get('companies') or result.get('data') or [])
+
+
+def companies_records(result: Dict) -> List[Dict]:
+    """get_companies系の応答を行ごとの辞書に変換（行単位で処理する既存コード向け）"""
+    if is_columnar(result):
+        table = _load_table(result)
+        fields = table['fields']
+        return [dict(zip(fields, values)) for values in zip(*table['columns'])]
+    return result.get('companies') or result.get('data') or []
+
+
+def encode_columnar(companies: List[Dict], fields: Optional[Sequence[str]] = None,
+                    compress: Optional[str] = None) -> Dict:
+    """行形式の企業データを列形式の応答に変換（ローカルGASサーバー・計測用）"""
+    if fields is None:
+        fields = list(dict.fromkeys(key for company in companies for key in company))
+    fields = list(fields)
+    columns = [[company.get(field) for company in companies] for field in fields]
+    result = {'format': COLUMNAR_FORMAT, 'count': len(companies)}
+    if compress == 'gzip':
+        raw = json.dumps({'fields': fields, 'columns': columns}, ensure_ascii=False, default=str)
+        result['encoding'] = GZIP_BASE64
+        result['payload'] = base64.b64encode(gzip.compress(raw.encode('utf-8'))).decode('ascii')
+    else:
+        result['fields'] = fields
+        result['columns'] = columns
+    return result
+
+
+def _sample_companies(count: int) -> List[Dict]:
+    """計測用の企業データ（バックエンドの12項目）"""
+    statuses = ['New', 'Contacted', 'Qualified', 'Proposal', 'Won', 'Lost']
+    return [{
+        'id': f"CMP_{i:08d}",
+        'name': f"Sample Construction Company {i}",
+        'industry': ['Construction', 'Manufacturing', 'Logistics'][i % 3],
+        'website': f"https://company{i}.example.com",
+        'contact_person': f"Contact {i % 500}",
+        'email': f"info{i}@company{i}.example.com",
+        'phone': f"03-{i % 10000:04d}-{(i * 7) % 10000:04d}",
+        'picoCela_score': (i * 37) % 100,
+        'status': statuses[i % len(statuses)],
+        'notes': "WiFi mesh deployment for large construction sites" if i % 4 == 0 else "",
+        'created_date': f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}T09:00:00.000Z",
+        'last_updated': f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}T18:30:00.000Z",
+    } for i in range(count)]
+
+
+def benchmark_transport(row_counts: Sequence[int] = (10000, 100000), repeat: int = 3) -> List[Dict]:
+    """行形式・列形式・列形式+gzipの応答サイズとデコード時間（JSON解析〜DataFrame作成）を計測"""
+    results = []
+    for count in row_counts:
+        companies = _sample_companies(count)
+        bodies = {
+            'rows': json.dumps({'success': True, 'companies': companies}),
+            'columnar': json.dumps(dict(encode_columnar(companies), success=True)),
+            'columnar+gzip': json.dumps(dict(encode_columnar(companies, compress='gzip'), success=True)),
+        }
+        for name, body in bodies.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                df = companies_dataframe(json.loads(body))
+                timings.append(time.perf_counter() - started)
+            assert len(df) == count
+            results.append({
+                'rows': count,
+                'format': name,
+                'bytes': len(body.encode('utf-8')),
+                'decode_ms': round(min(timings) * 1000, 1),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'行数':>8} {'形式':<14} {'サイズ(KB)':>12} {'デコード(ms)':>12}")
+    for row in benchmark_transport(counts):
+        print(f"{row['rows']:>8} {row['format']:<14} {row['bytes'] / 1024:>12.0f} {row['decode_ms']:>12.1f}")
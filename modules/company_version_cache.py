@@ -0,0 +1,165 @@
+"""
+企業データのバージョン付き条件取得
+GAS側のデータバージョンを確認し、変更があった場合のみ全件を再取得・再正規化する
+（ページ取得を指定した場合は、届いたページから順に正規化する）
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from paged_company_fetch import PagedCompanyFetcher
+
+
+# バージョン確認の最小間隔（秒）。この間隔内の再実行はキャッシュをそのまま返す
+DEFAULT_POLL_INTERVAL = 10
+REQUEST_TIMEOUT = 30
+
+
+class VersionedCompanyCache:
+    """get_companies_if_changedで変更時のみ企業データを取得するキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, gas_url: str, session=None, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 headers: Optional[Dict] = None, fetcher: Optional[PagedCompanyFetcher] = None):
+        self.gas_url = gas_url
+        self.session = session or requests
+        self.poll_interval = poll_interval
+        self.headers = headers or {'Accept': 'application/json', 'Cache-Control': 'no-cache'}
+        self.fetcher = fetcher
+        self.version: Optional[str] = None
+        self.companies: List[Dict] = []
+        self.last_checked = 0.0
+        self.stats = {'checks': 0, 'not_modified': 0, 'downloads': 0, 'normalizations': 0}
+        self._normalized: Dict[str, Tuple[Optional[str], object]] = {}
+        # _lockは状態の参照・差し替えのみ。取得中は_inflightで他の呼び出しに完了を知らせる
+        self._lock = threading.Lock()
+        self._inflight: Optional[Future] = None
+
+    def _request(self, params: Dict) -> Dict:
+        response = self.session.get(self.gas_url, params=params, headers=self.headers, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _fetch_all(self) -> Dict:
+        """条件取得に未対応のバックエンド向けの全件取得"""
+        return self._request({'action': 'get_companies'})
+
+    def refresh(self, force: bool = False,
+                on_page: Optional[Callable[[int, int, List[Dict]], None]] = None) -> bool:
+        """バージョンを確認し、変更があればデータを更新（更新した場合True）
+
+        on_pageには取得したページを（ページ番号, 総行数, 企業データ）としてページ順に渡す。
+        取得は同時に1つだけロックの外で実行し、その間の他の呼び出しは取得済みデータがあればそれを返す
+        （なければ実行中の取得の完了を待つ）。待った側はFalseを返す
+        """
+        with self._lock:
+            if not force and self.version is not None and time.time() - self.last_checked < self.poll_interval:
+                return False
+            inflight = self._inflight
+            if inflight is None:
+                self._inflight = Future()
+            has_data = self.version is not None or bool(self.companies)
+
+        if inflight is not None:
+            if not has_data:
+                inflight.result()
+            return False
+
+        try:
+            changed = self._download(force, on_page)
+        except BaseException as e:
+            with self._lock:
+                future, self._inflight = self._inflight, None
+            future.set_exception(e)
+            raise
+        with self._lock:
+            future, self._inflight = self._inflight, None
+        future.set_result(changed)
+        return changed
+
+    def _download(self, force: bool, on_page: Optional[Callable[[int, int, List[Dict]], None]]) -> bool:
+        """バージョン確認と取得（ロックの外で実行し、結果の差し替えのみロック内）"""
+        with self._lock:
+            self.stats['checks'] += 1
+            current_version = self.version
+        params = {'action': 'get_companies_if_changed'}
+        if current_version is not None and not force:
+            params['version'] = current_version
+        if self.fetcher is not None:
+            # データ本体はページ単位で並列取得する
+            params['version_only'] = 'true'
+        data = self._request(params)
+
+        if not data.get('success') and data.get('status') != 'success':
+            # 旧バックエンド（未知のアクション）は従来通り全件取得
+            data = self._fetch_all()
+            if not data.get('success'):
+                raise RuntimeError(data.get('error') or data.get('message') or 'Unknown error')
+            data = {'modified': True, 'version': None, 'companies': data.get('companies', [])}
+
+        if not data.get('modified', True):
+            with self._lock:
+                self.last_checked = time.time()
+                self.stats['not_modified'] += 1
+            return False
+
+        if self.fetcher is not None and 'companies' not in data:
+            companies = self.fetcher.fetch_all(on_page)
+        else:
+            companies = data.get('companies') or data.get('data') or []
+            if on_page:
+                on_page(0, len(companies), companies)
+        version = data.get('version')
+
+        with self._lock:
+            self.stats['downloads'] += 1
+            self.companies = companies
+            self.version = str(version) if version is not None else None
+            self.last_checked = time.time()
+        return True
+
+    def get_companies(self, force: bool = False) -> List[Dict]:
+        """最新の企業データ（変更がなければキャッシュ）"""
+        self.refresh(force)
+        return self.companies
+
+    def get_normalized(self, normalize: Callable[[List[Dict]], List], force: bool = False,
+                       on_progress: Optional[Callable[[int, int, List], None]] = None) -> List:
+        """正規化済みデータ（データが変更された場合のみnormalizeを再実行）
+
+        再取得時はページが届くたびに正規化し、on_progress(正規化済み件数, 総行数, 正規化済みデータ)を呼ぶ。
+        Streamlitは再実行のたびに関数を再定義するため、関数名をキーにする
+        """
+        key = f"{normalize.__module__}.{normalize.__qualname__}"
+        streamed: List = []
+
+        def on_page(page_number: int, total_rows: int, page: List[Dict]):
+            streamed.extend(normalize(page))
+            if on_progress:
+                on_progress(len(streamed), total_rows, streamed)
+
+        changed = self.refresh(force, on_page=on_page)
+        with self._lock:
+            if changed:
+                self.stats['normalizations'] += 1
+                self._normalized[key] = (self.version, streamed)
+                return streamed
+            version, companies = self.version, self.companies
+            cached_version, result = self._normalized.get(key, (None, None))
+        if result is not None and version is not None and cached_version == version:
+            return result
+
+        # 正規化もロックの外で実行（同じ版に対する重複実行は結果が同じため許容）
+        result = normalize(companies)
+        with self._lock:
+            self.stats['normalizations'] += 1
+            self._normalized[key] = (version, result)
+        return result
+
+    def expire(self):
+        """確認間隔内でも次回は必ずバージョンを確認（書き込み直後など）"""
+        with self._lock:
+            self.last_checked = 0.0
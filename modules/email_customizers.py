@@ -9,6 +9,8 @@ from typing import Dict, Optional
 from datetime import datetime
 import streamlit as st
 
+from retry_policy import OPENAI_RETRY_POLICY
+
 
 def get_openai_client():
     """OpenAI クライアントを安全に取得"""
@@ -120,8 +122,9 @@ Focus on THEIR CUSTOMERS' challenges that PicoCELA can help solve.
             return self._create_fallback_email(company_name)
         
         try:
-            # GPT-3.5でカスタマイズ部分のみ生成
-            response = self.openai_client.chat.completions.create(
+            # GPT-3.5でカスタマイズ部分のみ生成（一時エラー・レート制限のみリトライ）
+            response = OPENAI_RETRY_POLICY.call(
+                self.openai_client.chat.completions.create,
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "user", "content": self.customization_prompt.format(
@@ -254,7 +257,8 @@ JSON形式で回答:
 }}
 """
             
-            response = self.openai_client.chat.completions.create(
+            response = OPENAI_RETRY_POLICY.call(
+                self.openai_client.chat.completions.create,
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=400,
@@ -3,10 +3,22 @@
 企業データ、生成メール、送信履歴の管理機能
 """
 
+import os
 import json
+import uuid
+import socket
 import sqlite3
 from typing import Dict, List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+# 予約の有効期限（秒）: これを過ぎた予約は停止したワーカーのものとして回収
+DELIVERY_RESERVATION_TIMEOUT = 600
+
+
+def make_worker_id() -> str:
+    """送信ワーカー識別子（ホスト・プロセス・セッション単位）"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
 
 class IntegratedEmailDatabase:
@@ -73,6 +85,61 @@ class IntegratedEmailDatabase:
             )
         """)
         
+        # 既存DBへの列追加（バウンス照合用のMessage-ID）
+        cursor.execute("PRAGMA table_info(integrated_send_history)")
+        if 'message_id' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE integrated_send_history ADD COLUMN message_id TEXT")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_send_history_message_id 
+            ON integrated_send_history(message_id)
+        """)
+        
+        # 配信キーテーブル（企業・言語・テンプレート・キャンペーン単位で一意）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS delivery_keys (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                company_name TEXT NOT NULL,
+                language TEXT NOT NULL,
+                template_type TEXT NOT NULL,
+                campaign TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker_id TEXT,
+                reserved_at TEXT,
+                updated_at TEXT,
+                UNIQUE(company_name, language, template_type, campaign)
+            )
+        """)
+        
+        # 配信停止リスト（アドレス単位・ドメイン単位）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS suppressed_addresses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT UNIQUE,
+                reason TEXT,
+                source TEXT,
+                created_at TEXT
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS suppressed_domains (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                domain TEXT UNIQUE,
+                reason TEXT,
+                source TEXT,
+                created_at TEXT
+            )
+        """)
+        
+        # バウンス取り込み位置（mboxのバイトオフセット・Maildirの処理済み時刻）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bounce_ingest_state (
+                source TEXT PRIMARY KEY,
+                position TEXT,
+                updated_at TEXT
+            )
+        """)
+        
         # テンプレートテーブル
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS email_templates (
@@ -197,8 +264,8 @@ class IntegratedEmailDatabase:
         
         cursor.execute("""
             INSERT INTO integrated_send_history 
-            (company_id, company_name, recipient_email, language, subject, sent_at, status, smtp_response, template_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            (company_id, company_name, recipient_email, language, subject, sent_at, status, smtp_response, template_type, message_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             send_data.get('company_id'),
             send_data.get('company_name'),
@@ -208,7 +275,8 @@ class IntegratedEmailDatabase:
             datetime.now().isoformat(),
             send_data.get('status'),
             send_data.get('smtp_response'),
-            send_data.get('template_type', 'standard')
+            send_data.get('template_type', 'standard'),
+            send_data.get('message_id')
         ))
         
         conn.commit()
@@ -241,7 +309,7 @@ class IntegratedEmailDatabase:
         conn.close()
         
         columns = ['id', 'company_id', 'company_name', 'recipient_email', 'language', 
-                  'subject', 'sent_at', 'status', 'smtp_response', 'template_type']
+                  'subject', 'sent_at', 'status', 'smtp_response', 'template_type', 'message_id']
         
         return [dict(zip(columns, row)) for row in results]
     
@@ -262,3 +330,182 @@ class IntegratedEmailDatabase:
         conn.close()
         
         return sent_companies
+    
+    def reap_stale_reservations(self, timeout_seconds: int = DELIVERY_RESERVATION_TIMEOUT) -> int:
+        """期限切れの予約を削除（送信完了していないもののみ）"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cutoff = (datetime.now() - timedelta(seconds=timeout_seconds)).isoformat()
+        cursor.execute("""
+            DELETE FROM delivery_keys 
+            WHERE status = 'reserved' AND reserved_at < ?
+        """, (cutoff,))
+        reaped = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        
+        return reaped
+    
+    def reserve_delivery(self, company_name: str, language: str, template_type: str,
+                         campaign: str, worker_id: str,
+                         timeout_seconds: int = DELIVERY_RESERVATION_TIMEOUT) -> bool:
+        """SMTP送信前に配信キーを確保（他ワーカーが確保済みならFalse）"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        
+        now = datetime.now()
+        cutoff = (now - timedelta(seconds=timeout_seconds)).isoformat()
+        
+        try:
+            # 書き込みロックを取得して回収と確保を原子的に実行
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                DELETE FROM delivery_keys 
+                WHERE company_name = ? AND language = ? AND template_type = ? AND campaign = ?
+                AND status = 'reserved' AND reserved_at < ?
+            """, (company_name, language, template_type, campaign, cutoff))
+            cursor.execute("""
+                INSERT INTO delivery_keys 
+                (company_name, language, template_type, campaign, status, worker_id, reserved_at, updated_at)
+                VALUES (?, ?, ?, ?, 'reserved', ?, ?, ?)
+            """, (company_name, language, template_type, campaign, worker_id, now.isoformat(), now.isoformat()))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return False
+        finally:
+            conn.close()
+    
+    def complete_delivery(self, company_name: str, language: str, template_type: str,
+                          campaign: str, worker_id: str, status: str = 'sent'):
+        """確保した配信キーを送信済み等の最終状態に更新"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE delivery_keys 
+            SET status = ?, updated_at = ?
+            WHERE company_name = ? AND language = ? AND template_type = ? AND campaign = ?
+            AND worker_id = ?
+        """, (status, datetime.now().isoformat(), company_name, language, template_type, campaign, worker_id))
+        
+        conn.commit()
+        conn.close()
+    
+    def release_delivery(self, company_name: str, language: str, template_type: str,
+                         campaign: str, worker_id: str):
+        """送信失敗時に予約を解放（後続の実行で再送可能にする）"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            DELETE FROM delivery_keys 
+            WHERE company_name = ? AND language = ? AND template_type = ? AND campaign = ?
+            AND worker_id = ? AND status = 'reserved'
+        """, (company_name, language, template_type, campaign, worker_id))
+        
+        conn.commit()
+        conn.close()
+    
+    def get_claimed_companies(self, language: str, template_type: str, campaign: str) -> List[str]:
+        """キャンペーン内で送信済み・送信中の企業名リストを取得"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT company_name FROM delivery_keys 
+            WHERE language = ? AND template_type = ? AND campaign = ?
+        """, (language, template_type, campaign))
+        
+        claimed = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return claimed
+    
+    def add_suppressed_address(self, email: str, reason: str = 'unsubscribe', source: str = 'manual'):
+        """配信停止アドレスを登録（小文字で正規化）"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            INSERT OR IGNORE INTO suppressed_addresses (email, reason, source, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (email.strip().lower(), reason, source, datetime.now().isoformat()))
+        
+        conn.commit()
+        conn.close()
+    
+    def add_suppressed_domain(self, domain: str, reason: str = 'unsubscribe', source: str = 'manual'):
+        """配信停止ドメインを登録（小文字で正規化）"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            INSERT OR IGNORE INTO suppressed_domains (domain, reason, source, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (domain.strip().lower().lstrip('@'), reason, source, datetime.now().isoformat()))
+        
+        conn.commit()
+        conn.close()
+    
+    def get_suppressions_since(self, table: str, last_id: int = 0) -> List[tuple]:
+        """指定ID以降の配信停止エントリを取得（差分読み込み用）"""
+        columns = {'suppressed_addresses': 'email', 'suppressed_domains': 'domain'}
+        if table not in columns:
+            raise ValueError(f"Unknown suppression table: {table}")
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            SELECT id, {columns[table]} FROM {table} 
+            WHERE id > ? ORDER BY id
+        """, (last_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return rows
+    
+    def apply_bounce(self, message_id: str, status: str, smtp_response: str) -> int:
+        """Message-IDで送信履歴を特定し、バウンス結果で状態を更新（更新件数を返す）"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE integrated_send_history 
+            SET status = ?, smtp_response = ?
+            WHERE message_id = ?
+        """, (status, smtp_response, message_id))
+        updated = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        
+        return updated
+    
+    def get_ingest_position(self, source: str) -> Optional[str]:
+        """バウンス取り込みの前回位置を取得"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT position FROM bounce_ingest_state WHERE source = ?", (source,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        return row[0] if row else None
+    
+    def set_ingest_position(self, source: str, position: str):
+        """バウンス取り込みの処理済み位置を保存"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            INSERT OR REPLACE INTO bounce_ingest_state (source, position, updated_at)
+            VALUES (?, ?, ?)
+        """, (source, position, datetime.now().isoformat()))
+        
+        conn.commit()
+        conn.close()
@@ -5,96 +5,201 @@ Gmail SMTP経由での送信、リトライ機能、制限対策
 
 import time
 import smtplib
-from typing import Dict, List
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from datetime import datetime
+from typing import Dict, List, Optional
 import streamlit as st
 
-from email_database import IntegratedEmailDatabase
+from address_validation import format_validation_summary, validate_company_list
+from email_database import IntegratedEmailDatabase, make_worker_id
+from gmail_api_sender import DEFAULT_BATCH_SIZE, GmailApiSender
+from message_builder import PreparedMessage, get_prepared_message, submit_prepared_message
+from retry_policy import (
+    PERMANENT, PermanentError, RetryPolicy, SMTP_RETRY_POLICY, THROTTLE, classify_exception
+)
+from send_scheduler import (
+    DEFAULT_DOMAIN_MAX_CONCURRENCY, DEFAULT_DOMAIN_MIN_GAP,
+    DomainThrottle, build_domain_index, drain_by_domain, shared_domain_throttle
+)
+from send_window import SendWindow, SendWindowQueue, drain_in_send_windows, utc_now
+from suppression import DEFAULT_FALSE_POSITIVE_RATE, SuppressionList
+
+
+def send_prepared_email_smtp(prepared: PreparedMessage, gmail_config: Dict) -> bool:
+    """レンダリング済みメールをGmail SMTP経由で送信（メッセージ再構築なし）"""
+    # SMTP設定
+    smtp_server = gmail_config.get('smtp_server', "smtp.gmail.com")
+    smtp_port = gmail_config.get('smtp_port', 587)
+    
+    # SMTP接続・送信（生バイト列をそのまま渡す）
+    with smtplib.SMTP(smtp_server, smtp_port) as server:
+        server.starttls()
+        server.login(gmail_config['email'], gmail_config['password'])
+        submit_prepared_message(server, prepared, envelope_from=gmail_config['email'])
+    
+    return True
 
 
 def send_email_smtp(to_email: str, subject: str, body: str, gmail_config: Dict) -> bool:
     """Gmail SMTP経由でメール送信"""
     try:
-        # SMTP設定
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
-        
-        # MIMEメッセージ作成
-        msg = MIMEMultipart()
-        msg['From'] = f"{gmail_config['sender_name']} <{gmail_config['email']}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # 本文添付
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # SMTP接続・送信
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(gmail_config['email'], gmail_config['password'])
-        server.send_message(msg)
-        server.quit()
-        
-        return True
+        # メッセージは一度だけレンダリング（キャッシュ済みなら再利用）
+        prepared = get_prepared_message(to_email, subject, body, gmail_config)
+        return send_prepared_email_smtp(prepared, gmail_config)
         
     except Exception as e:
         st.error(f"メール送信エラー: {str(e)}")
         return False
 
 
-def send_email_smtp_with_retry(to_email: str, subject: str, body: str, gmail_config: Dict, max_retries: int = 3) -> bool:
-    """リトライ機能付きメール送信"""
-    for attempt in range(max_retries):
-        try:
-            # SMTP設定
-            smtp_server = "smtp.gmail.com"
-            smtp_port = 587
-            
-            # MIMEメッセージ作成
-            msg = MIMEMultipart()
-            msg['From'] = f"{gmail_config['sender_name']} <{gmail_config['email']}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # 本文添付
-            msg.attach(MIMEText(body, 'plain', 'utf-8'))
-            
-            # SMTP接続・送信
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-            server.login(gmail_config['email'], gmail_config['password'])
-            server.send_message(msg)
-            server.quit()
-            
-            return True
-            
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(30)  # 30秒待機してリトライ
-                continue
-            else:
-                raise e
+def send_email_smtp_with_retry(to_email: str, subject: str, body: str, gmail_config: Dict, max_retries: int = 3,
+                               delivery_key: Optional[str] = None) -> bool:
+    """リトライ機能付きメール送信（恒久エラーはPermanentErrorで即時失敗）
+
+    delivery_keyを指定すると、同じキーでget_prepared_messageを呼べば送信したメッセージを取得できる
+    """
+    # リトライ前に一度だけレンダリング（各試行で同じバイト列を送信）
+    prepared = get_prepared_message(to_email, subject, body, gmail_config, delivery_key=delivery_key)
+    
+    # 一時エラー・送信制限のみ指数バックオフ（ジッター付き）でリトライ
+    policy = SMTP_RETRY_POLICY
+    if max_retries != policy.max_attempts:
+        policy = RetryPolicy(max_attempts=max_retries, base_delay=policy.base_delay, max_delay=policy.max_delay)
+    
+    return policy.call(send_prepared_email_smtp, prepared, gmail_config)
+
+
+def flush_gmail_batch(db: IntegratedEmailDatabase, sender: GmailApiSender, batch: List[tuple],
+                      language: str, template_type: str, campaign: str, worker_id: str) -> tuple:
+    """溜めたメールをGmail APIのHTTPバッチで送信し、パートごとに結果を記録
+
+    配信キーは送信直前にまとめて確保する（バッチが埋まるまでのドメイン待ちで
+    予約が期限切れになり、他ワーカーに回収・再送されないように）
+    戻り値: (成功数, 失敗数, 処理を停止すべきか)
+    """
+    reserved = []
+    for company, stored_email, prepared in batch:
+        if db.reserve_delivery(company.get('company_name'), language, template_type, campaign, worker_id):
+            reserved.append((company, stored_email, prepared))
+        else:
+            st.info(f"⚠️ {company.get('company_name')} - 既に送信済みのためスキップ")
+    batch = reserved
+    
+    if not batch:
+        return 0, 0, False
+    
+    sent_count = 0
+    failed_count = 0
+    stop = False
+    
+    try:
+        outcomes = sender.send_batch([prepared for _, _, prepared in batch])
+    except Exception as e:
+        # 認証失敗等でバッチを実行できない場合は全件の予約を解放
+        for company, _, _ in batch:
+            db.release_delivery(company.get('company_name'), language, template_type, campaign, worker_id)
+        st.error(f"❌ Gmail APIエラー: {str(e)[:100]}")
+        return 0, len(batch), True
+    
+    for (company, stored_email, prepared), (success, detail, error_class) in zip(batch, outcomes):
+        company_name = company.get('company_name')
+        
+        if success:
+            status = 'success'
+            smtp_response = f"gmail_api: {detail}"
+            db.complete_delivery(company_name, language, template_type, campaign, worker_id)
+            sent_count += 1
+            st.success(f"✅ {company_name} - 送信成功")
+        elif error_class == PERMANENT:
+            # 恒久エラーは再送対象から外す
+            status = 'failed'
+            smtp_response = f"permanent: {detail}"
+            db.complete_delivery(company_name, language, template_type, campaign, worker_id, status='failed')
+            failed_count += 1
+            st.error(f"❌ {company_name} - 恒久エラー（再送しません）: {detail[:50]}")
+        else:
+            status = 'error'
+            smtp_response = detail
+            db.release_delivery(company_name, language, template_type, campaign, worker_id)
+            failed_count += 1
+            st.error(f"❌ {company_name} - エラー: {detail[:50]}")
+            if error_class == THROTTLE:
+                stop = True
+        
+        db.save_send_history({
+            'company_id': company.get('company_id', ''),
+            'company_name': company_name,
+            'recipient_email': company.get('email'),
+            'language': language,
+            'subject': stored_email['subject'],
+            'status': status,
+            'smtp_response': smtp_response[:100],
+            'template_type': template_type,
+            'message_id': prepared.message_id
+        })
     
-    return False
+    if stop:
+        st.error("🚫 Gmail API送信制限に達しました。時間をおいて再開してください。")
+    
+    return sent_count, failed_count, stop
 
 
 def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config: Dict, 
                                         max_emails: int = 50, language: str = 'english',
                                         template_type: str = 'standard', send_interval: int = 60,
-                                        resume_mode: bool = False) -> Dict:
-    """重複なし再開機能付き瞬時送信"""
+                                        resume_mode: bool = False, campaign: Optional[str] = None,
+                                        domain_max_concurrency: int = DEFAULT_DOMAIN_MAX_CONCURRENCY,
+                                        domain_min_gap: int = DEFAULT_DOMAIN_MIN_GAP,
+                                        share_domain_limits: bool = False,
+                                        respect_send_window: bool = False,
+                                        send_window: Optional[SendWindow] = None,
+                                        max_window_wait: Optional[int] = None,
+                                        suppression_fp_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+                                        provider: str = 'smtp',
+                                        gmail_batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+    """重複なし再開機能付き瞬時送信
+
+    provider='gmail_api'の場合はgmail_config['credentials']（OAuth認証情報）を使い、
+    gmail_batch_size件ずつHTTPバッチで送信する（送信間隔はバッチ単位）
+    send_intervalは前回の送信開始からの間隔で、同一ドメインの待ち時間もこれに含める（加算しない）。
+    share_domain_limits=Trueの場合のみ、ドメイン制御をプロセス内の他のセッションと共有する（既定値のみ）
+    """
     db = IntegratedEmailDatabase()
     
+    # 送信方式
+    gmail_sender = None
+    gmail_batch = []
+    if provider == 'gmail_api':
+        gmail_sender = GmailApiSender(gmail_config['credentials'], batch_size=gmail_batch_size)
+    elif provider != 'smtp':
+        raise ValueError(f"Unknown provider: {provider}")
+    
+    # 配信キー（企業・言語・テンプレート・キャンペーン）の単位。既定は当日
+    campaign = campaign or datetime.now().strftime('%Y-%m-%d')
+    worker_id = make_worker_id()
+    db.reap_stale_reservations()
+    
+    # 宛先アドレスを検証し、無効な企業は送信キューに入れない
+    company_list, validation_counts = validate_company_list(company_list)
+    if validation_counts.get('rejected'):
+        st.warning(format_validation_summary(validation_counts))
+    
     # 送信済み企業を除外
     if resume_mode:
         already_sent = db.get_already_sent_companies(language, template_type)
-        remaining_companies = [c for c in company_list if c.get('company_name') not in already_sent]
+        claimed = set(already_sent) | set(db.get_claimed_companies(language, template_type, campaign))
+        remaining_companies = [c for c in company_list if c.get('company_name') not in claimed]
         st.info(f"📧 送信済み: {len(already_sent)}社 | 残り: {len(remaining_companies)}社")
     else:
         remaining_companies = company_list
         already_sent = []
     
+    # 配信停止リスト（起動時に読み込み、送信前に差分更新）
+    suppression = SuppressionList(db, suppression_fp_rate)
+    suppressed_count = sum(1 for c in remaining_companies if suppression.is_suppressed(c.get('email')))
+    if suppressed_count:
+        remaining_companies = [c for c in remaining_companies if not suppression.is_suppressed(c.get('email'))]
+        st.info(f"🚫 配信停止リスト該当: {suppressed_count}社を除外")
+    
     target_companies = remaining_companies[:max_emails]
     
     if not target_companies:
@@ -103,6 +208,16 @@ def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config:
     
     st.write(f"📤 {'再開' if resume_mode else '開始'}: {len(target_companies)}社への送信")
     
+    # 宛先ドメイン単位の制御（指定した場合のみプロセス内の全セッションで共有）
+    if share_domain_limits:
+        if (domain_max_concurrency, domain_min_gap) != (DEFAULT_DOMAIN_MAX_CONCURRENCY, DEFAULT_DOMAIN_MIN_GAP):
+            raise ValueError("共有のドメイン制御は既定の同時送信数・送信間隔でのみ使用できます")
+        domain_throttle = shared_domain_throttle
+    else:
+        domain_throttle = DomainThrottle(domain_max_concurrency, domain_min_gap)
+    st.caption(f"🌐 宛先ドメイン数: {len(build_domain_index(target_companies))} | "
+               f"同一ドメイン間隔: {domain_min_gap}秒{'（全セッション共有）' if share_domain_limits else ''}")
+    
     sent_count = 0
     failed_count = 0
     
@@ -111,8 +226,21 @@ def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config:
     time_remaining_text = st.empty()
     
     start_time = time.time()
+    # 前回の送信開始時刻（ドメイン待ちで経過した時間は送信間隔に含める）
+    last_send_started = None
     
-    for i, company in enumerate(target_companies):
+    # 現地の営業時間帯を考慮する場合は、送信可能時刻の早い順に継続して送信
+    window_queue = None
+    if respect_send_window:
+        window_queue = SendWindowQueue(target_companies, send_window)
+        st.info(f"🕘 現地営業時間内: {window_queue.due_count(utc_now())}社 | "
+                f"時間帯待ち: {len(window_queue) - window_queue.due_count(utc_now())}社")
+        send_queue = drain_in_send_windows(window_queue, domain_throttle, max_wait=max_window_wait)
+    else:
+        # ドメイン間でインターリーブし、送信可能なドメインから順に送信
+        send_queue = drain_by_domain(target_companies, domain_throttle)
+    
+    for i, company in enumerate(send_queue):
         # 進捗更新
         progress = (i + 1) / len(target_companies)
         progress_bar.progress(progress)
@@ -125,20 +253,48 @@ def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config:
             remaining = estimated_total - elapsed
             time_remaining_text.text(f"⏱️ 残り時間: {remaining/60:.1f}分")
         
-        # 送信前に再度確認（他のプロセスで送信済みの場合）
+        # 送信直前に配信停止リストを再確認（実行中の配信停止・バウンスを反映）
         company_name = company.get('company_name')
-        if company_name in db.get_already_sent_companies(language, template_type):
+        suppression.refresh()
+        if suppression.is_suppressed(company.get('email')):
+            st.info(f"🚫 {company_name} - 配信停止リスト該当のためスキップ")
+            continue
+        
+        # 送信前に配信キーを確保（他のプロセスで送信済み・送信中の場合はスキップ）
+        # Gmail APIはバッチ送信時に確保する（flush_gmail_batch）
+        if gmail_sender is None and not db.reserve_delivery(company_name, language, template_type, campaign, worker_id):
             st.info(f"⚠️ {company_name} - 既に送信済みのためスキップ")
             continue
         
         # データベースからメール取得
         stored_email = db.get_generated_email(company_name, language, template_type)
+        # この実行での送信試行の識別子（同じ試行内のみレンダリング済みメッセージを再利用）
+        delivery_key = f"{worker_id}:{company_name}"
         
-        if stored_email:
+        if stored_email and gmail_sender is not None:
+            # Gmail API: バッチに溜め、上限に達したら1往復でまとめて送信
+            prepared = get_prepared_message(company.get('email'), stored_email['subject'],
+                                            stored_email['email_body'], gmail_config,
+                                            delivery_key=delivery_key)
+            gmail_batch.append((company, stored_email, prepared))
+            if len(gmail_batch) >= gmail_batch_size:
+                if last_send_started is not None:
+                    time.sleep(max(0.0, send_interval - (time.monotonic() - last_send_started)))
+                last_send_started = time.monotonic()
+                batch_sent, batch_failed, stop = flush_gmail_batch(
+                    db, gmail_sender, gmail_batch, language, template_type, campaign, worker_id
+                )
+                gmail_batch = []
+                sent_count += batch_sent
+                failed_count += batch_failed
+                if stop:
+                    break
+        elif stored_email:
             try:
-                # Gmail制限対策: より長い間隔
-                if i > 0:
-                    time.sleep(send_interval)
+                # Gmail制限対策: 前回の送信開始から送信間隔が経つまで待機（ドメイン待ちの分は差し引く）
+                if last_send_started is not None:
+                    time.sleep(max(0.0, send_interval - (time.monotonic() - last_send_started)))
+                last_send_started = time.monotonic()
                 
                 # 送信実行（リトライ機能付き）
                 success = send_email_smtp_with_retry(
@@ -146,10 +302,14 @@ def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config:
                     subject=stored_email['subject'],
                     body=stored_email['email_body'],
                     gmail_config=gmail_config,
-                    max_retries=3
+                    max_retries=3,
+                    delivery_key=delivery_key
                 )
                 
-                # 送信履歴保存
+                # 送信履歴保存（Message-IDはバウンス照合用。送信時と同じキャッシュ済みメッセージから取得）
+                prepared = get_prepared_message(company.get('email'), stored_email['subject'],
+                                                stored_email['email_body'], gmail_config,
+                                                delivery_key=delivery_key)
                 send_record = {
                     'company_id': company.get('company_id', ''),
                     'company_name': company_name,
@@ -158,24 +318,55 @@ def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config:
                     'subject': stored_email['subject'],
                     'status': 'success' if success else 'failed',
                     'smtp_response': 'OK' if success else 'SMTP Error',
-                    'template_type': template_type
+                    'template_type': template_type,
+                    'message_id': prepared.message_id
                 }
                 db.save_send_history(send_record)
                 
+                if success:
+                    db.complete_delivery(company_name, language, template_type, campaign, worker_id)
+                else:
+                    db.release_delivery(company_name, language, template_type, campaign, worker_id)
+                
                 if success:
                     sent_count += 1
                     st.success(f"✅ {company.get('company_name')} - 送信成功")
                 else:
                     failed_count += 1
                     st.error(f"❌ {company.get('company_name')} - 送信失敗")
+            
+            except PermanentError as e:
+                failed_count += 1
+                error_msg = str(e)
+                
+                # 認証エラーは全件に影響するため処理を停止
+                if isinstance(e.cause, smtplib.SMTPAuthenticationError):
+                    db.release_delivery(company_name, language, template_type, campaign, worker_id)
+                    st.error(f"❌ Gmail認証エラー: {error_msg[:100]}")
+                    break
+                
+                # 恒久エラー（無効アドレス等）は即時記録し、再送対象から外して次へ
+                db.complete_delivery(company_name, language, template_type, campaign, worker_id, status='failed')
+                st.error(f"❌ {company.get('company_name')} - 恒久エラー（再送しません）: {error_msg[:50]}")
+                db.save_send_history({
+                    'company_id': company.get('company_id', ''),
+                    'company_name': company_name,
+                    'recipient_email': company.get('email'),
+                    'language': language,
+                    'subject': stored_email.get('subject', 'Unknown'),
+                    'status': 'failed',
+                    'smtp_response': f"permanent: {error_msg}"[:100],
+                    'template_type': template_type
+                })
                     
             except Exception as e:
                 failed_count += 1
                 error_msg = str(e)
+                db.release_delivery(company_name, language, template_type, campaign, worker_id)
                 st.error(f"❌ {company.get('company_name')} - エラー: {error_msg[:50]}")
                 
                 # Gmail制限検知
-                if "quota" in error_msg.lower() or "limit" in error_msg.lower() or "authentication" in error_msg.lower():
+                if classify_exception(e) == THROTTLE or "quota" in error_msg.lower() or "limit" in error_msg.lower():
                     st.error("🚫 Gmail送信制限に達しました。24時間後に再開してください。")
                     break
                 
@@ -193,8 +384,24 @@ def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config:
                 db.save_send_history(send_record)
         else:
             failed_count += 1
+            db.release_delivery(company_name, language, template_type, campaign, worker_id)
             st.warning(f"⚠️ {company.get('company_name')} - 事前生成メールなし")
     
+    send_queue.close()
+    
+    # 残りのバッチを送信
+    if gmail_batch:
+        if last_send_started is not None:
+            time.sleep(max(0.0, send_interval - (time.monotonic() - last_send_started)))
+        batch_sent, batch_failed, _ = flush_gmail_batch(
+            db, gmail_sender, gmail_batch, language, template_type, campaign, worker_id
+        )
+        sent_count += batch_sent
+        failed_count += batch_failed
+    deferred_count = len(window_queue) if window_queue is not None else 0
+    if deferred_count:
+        st.info(f"🕘 {deferred_count}社は現地営業時間外のため次回に持ち越し")
+    
     # 完了処理
     total_time = time.time() - start_time
     total_sent_today = len(already_sent) + sent_count
@@ -206,7 +413,10 @@ def send_pregenerated_emails_with_resume(company_list: List[Dict], gmail_config:
         'total_sent_today': total_sent_today,
         'success_rate': (sent_count / len(target_companies)) * 100 if target_companies else 0,
         'total_time_minutes': total_time / 60,
-        'remaining_companies': len(remaining_companies) - len(target_companies)
+        'remaining_companies': len(remaining_companies) - len(target_companies) + deferred_count,
+        'deferred_out_of_window': deferred_count,
+        'suppressed': suppressed_count,
+        'invalid_addresses': validation_counts.get('rejected', 0)
     }
     
     st.success(f"🎉 送信{'再開' if resume_mode else ''}完了！")
@@ -0,0 +1,129 @@
+"""
+GAS一括追加クライアント
+企業データをチャンクに分割してadd_companies_batchへ順に送信し、
+サーバー実行時間に応じてチャンクサイズを調整（Apps Scriptの実行時間上限対策）
+"""
+
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from gas_bulk_sender import ChunkSizer
+from retry_policy import HTTP_RETRY_POLICY, PERMANENT, BackendError, RetryPolicy, classify_exception
+
+
+# シート書き込みは1行あたりが軽いため、送信より大きなチャンクで開始
+TARGET_CHUNK_SECONDS = 45
+DEFAULT_CHUNK_SIZE = 200
+MAX_CHUNK_SIZE = 2000
+REQUEST_TIMEOUT = 120
+
+
+class GasBatchUploader:
+    """add_companies_batchをチャンク単位で実行し、行ごとの結果を統合
+
+    各チャンクにはchunkIdを付与し、サーバー側で処理済みのチャンクは再送しても二重追加されない
+    """
+
+    def __init__(self, gas_url: str, sizer: Optional[ChunkSizer] = None, max_attempts: int = 3,
+                 timeout: float = REQUEST_TIMEOUT, session=None, headers: Optional[Dict] = None,
+                 retry_policy: RetryPolicy = HTTP_RETRY_POLICY):
+        self.gas_url = gas_url
+        self.sizer = sizer or ChunkSizer(target_seconds=TARGET_CHUNK_SECONDS,
+                                         initial_size=DEFAULT_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE)
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.session = session or requests
+        self.headers = headers or {'Content-Type': 'application/json'}
+        self.retry_policy = retry_policy
+
+    def _post_chunk(self, chunk: List[Dict], chunk_id: str) -> Dict:
+        """1チャンクを送信し、実行時間を記録"""
+        started = time.monotonic()
+        response = self.session.post(
+            self.gas_url,
+            json={"action": "add_companies_batch", "companies": chunk, "chunkId": chunk_id},
+            headers=self.headers,
+            timeout=self.timeout
+        )
+        elapsed = time.monotonic() - started
+
+        response.raise_for_status()
+        result = response.json()
+        if not result.get('success'):
+            raise BackendError(result.get('error') or result.get('message') or 'Unknown error', result)
+
+        # サーバーが実行時間を返す場合はそれを優先（ミリ秒）。再送で返された前回結果は計測しない
+        if not result.get('duplicate_chunk'):
+            server_ms = result.get('executionTime')
+            self.sizer.observe(len(chunk), server_ms / 1000 if server_ms else elapsed)
+        return result
+
+    def send_chunk(self, chunk: List[Dict], chunk_id: Optional[str] = None) -> Dict:
+        """1チャンクを送信（chunk_idを固定すると、プロセスをまたいだ再送でも二重追加されない）"""
+        return self._send_with_retry(chunk, chunk_id)
+
+    def _send_with_retry(self, chunk: List[Dict], chunk_id: Optional[str] = None) -> Dict:
+        """同じchunkIdで再送（タイムアウト時もサーバー側で重複を防ぐ）"""
+        chunk_id = chunk_id or uuid.uuid4().hex
+        for attempt in range(self.max_attempts):
+            try:
+                return self._post_chunk(chunk, chunk_id)
+            except Exception as e:
+                self.sizer.shrink()
+                error_class = classify_exception(e)
+                if error_class == PERMANENT or attempt + 1 >= self.max_attempts:
+                    raise
+                self.retry_policy.sleep(self.retry_policy.compute_delay(error_class, attempt))
+
+    def upload(self, companies: List[Dict],
+               on_progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """全企業を追加し、add_companies_batchと同じ形式（results.success/errors/details）で返す"""
+        total = len(companies)
+        position = 0
+        successful = errors = 0
+        details: List[str] = []
+        rows: List[Dict] = []
+        chunk_count = 0
+        failed_chunks = 0
+
+        while position < total:
+            size = self.sizer.size
+            chunk = companies[position:position + size]
+            chunk_count += 1
+
+            try:
+                result = self._send_with_retry(chunk)
+            except Exception as e:
+                failed_chunks += 1
+                errors += len(chunk)
+                details.append(f"❌ {position + 1}〜{position + len(chunk)}行目: {str(e)[:200]}")
+                rows.extend({'index': position + i, 'success': False, 'error': str(e)[:200]}
+                            for i in range(len(chunk)))
+            else:
+                chunk_results = result.get('results', {})
+                successful += chunk_results.get('success', 0)
+                errors += chunk_results.get('errors', 0)
+                details.extend(chunk_results.get('details', []))
+                # 行番号をアップロード全体の位置に変換
+                rows.extend(dict(row, index=position + row.get('index', 0)) for row in result.get('rows', []))
+
+            position += len(chunk)
+            if on_progress:
+                on_progress(position, total)
+
+        return {
+            'success': successful > 0 or total == 0,
+            'error': None if successful > 0 or total == 0 else (details[0] if details else 'Unknown error'),
+            'status': 'completed' if errors == 0 else 'partial',
+            'total': total,
+            'results': {'success': successful, 'errors': errors, 'details': details},
+            'rows': rows,
+            'chunks': chunk_count,
+            'failed_chunks': failed_chunks,
+            'last_chunk_size': self.sizer.size,
+            'timestamp': datetime.now().isoformat()
+        }
@@ -0,0 +1,247 @@
+"""
+GAS一括送信クライアント
+宛先をチャンクに分割して並列送信し、サーバー実行時間に応じてチャンクサイズを調整
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from retry_policy import HTTP_RETRY_POLICY, PERMANENT, TRANSIENT, RetryPolicy, classify_exception
+
+
+# Apps Scriptの実行時間上限（6分）に対し余裕を持たせた1チャンクの目標時間（秒）
+TARGET_CHUNK_SECONDS = 90
+CHUNK_TIMEOUT = 330
+
+# チャンクサイズの初期値・上下限、同時実行数
+DEFAULT_CHUNK_SIZE = 20
+MIN_CHUNK_SIZE = 1
+MAX_CHUNK_SIZE = 100
+DEFAULT_MAX_PARALLEL = 3
+
+# 1宛先あたり実行時間の平滑化係数
+SMOOTHING = 0.3
+
+
+class AmbiguousChunkError(Exception):
+    """サーバー側で一部送信済みの可能性がある失敗（タイムアウト・5xx・エラー応答）
+
+    チャンクを丸ごと再送せず、宛先ごとの結果で成功が確認できなかった宛先のみ同じchunkIdで再送する
+    （宛先ごとの結果がなければ再送しない）
+    """
+
+    def __init__(self, message: str, results: Optional[List[Dict]] = None):
+        super().__init__(message)
+        self.results = results or []
+
+
+class ChunkSizer:
+    """観測したサーバー実行時間から次のチャンクサイズを決定（スレッドセーフ）"""
+
+    def __init__(self, target_seconds: float = TARGET_CHUNK_SECONDS,
+                 initial_size: int = DEFAULT_CHUNK_SIZE,
+                 min_size: int = MIN_CHUNK_SIZE, max_size: int = MAX_CHUNK_SIZE):
+        self.target_seconds = target_seconds
+        self.min_size = min_size
+        self.max_size = max_size
+        self._size = initial_size
+        self._per_recipient: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._size
+
+    def observe(self, recipients: int, seconds: float):
+        """チャンクの実行時間を記録し、目標時間に収まるサイズへ更新"""
+        if recipients <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            sample = seconds / recipients
+            if self._per_recipient is None:
+                self._per_recipient = sample
+            else:
+                self._per_recipient = SMOOTHING * sample + (1 - SMOOTHING) * self._per_recipient
+            ideal = int(self.target_seconds / self._per_recipient)
+            self._size = max(self.min_size, min(self.max_size, ideal))
+
+    def shrink(self):
+        """実行時間超過などの失敗時はサイズを半減"""
+        with self._lock:
+            self._size = max(self.min_size, self._size // 2)
+
+
+class GasBulkSender:
+    """send_bulk_emailsをチャンク単位で並列実行し、宛先ごとの結果を統合"""
+
+    def __init__(self, gas_url: str, max_parallel: int = DEFAULT_MAX_PARALLEL,
+                 sizer: Optional[ChunkSizer] = None, max_attempts: int = 3,
+                 timeout: float = CHUNK_TIMEOUT, session=None,
+                 retry_policy: RetryPolicy = HTTP_RETRY_POLICY):
+        self.gas_url = gas_url
+        self.max_parallel = max_parallel
+        self.sizer = sizer or ChunkSizer()
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.session = session or requests
+        self.retry_policy = retry_policy
+
+    def _post_chunk(self, chunk: List[Dict], chunk_id: str, subject: str, body: str,
+                    sender_name: str) -> Dict:
+        """1チャンクを送信し、実行時間を記録"""
+        payload = {
+            "action": "send_bulk_emails",
+            "recipients": chunk,
+            "subject": subject,
+            "body": body,
+            "senderName": sender_name,
+            "chunkId": chunk_id
+        }
+
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                self.gas_url,
+                json=payload,
+                headers={'Content-Type': 'application/json'},
+                timeout=self.timeout
+            )
+        except requests.exceptions.ReadTimeout as e:
+            raise AmbiguousChunkError(f"timeout: {e}") from e
+        elapsed = time.monotonic() - started
+
+        # 5xx・エラー応答は途中まで送信済みの可能性がある（429等の4xxは未処理のため通常の再送対象）
+        if response.status_code >= 500:
+            raise AmbiguousChunkError(f"HTTP {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+        result = response.json()
+        if result.get("status") not in ("completed", "success"):
+            raise AmbiguousChunkError(result.get("message") or result.get("error") or "Unknown error",
+                                      result.get("results"))
+
+        # サーバーが実行時間を返す場合はそれを優先（ミリ秒）
+        server_ms = result.get("executionTime") or result.get("execution_time_ms")
+        self.sizer.observe(len(chunk), server_ms / 1000 if server_ms else elapsed)
+        return result
+
+    @staticmethod
+    def _failed_results(chunk: List[Dict], status: str, message: str) -> List[Dict]:
+        return [{'email': r.get('email'), 'company_name': r.get('company_name'),
+                 'status': status, 'message': message[:200]} for r in chunk]
+
+    def send(self, recipients: List[Dict], subject: str, body: str,
+             sender_name: str = "PicoCELA CRM System",
+             on_progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """全宛先を送信し、send_bulk_emailsと同じ形式で結果を返す"""
+        total = len(recipients)
+        remaining = deque(recipients)
+        retry_queue: List[tuple] = []   # (再送可能になる時刻, chunk, chunk_id, attempt)
+        results: List[Dict] = []
+        successful = failed = unknown = 0
+        chunk_count = retried_chunks = 0
+        done = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            in_flight = {}
+
+            while remaining or retry_queue or in_flight:
+                now = time.monotonic()
+                if retry_queue and not in_flight and not remaining:
+                    # 待機中の再送のみ残っている場合は、最も早い再送時刻まで待つ
+                    wait_seconds = min(item[0] for item in retry_queue) - now
+                    if wait_seconds > 0:
+                        self.retry_policy.sleep(wait_seconds)
+                    now = max(time.monotonic(), now + wait_seconds)
+
+                # 空き枠に再送時刻を過ぎた失敗チャンク → 新規チャンクの順で投入（待機中の再送は枠を使わない）
+                while len(in_flight) < self.max_parallel:
+                    due = [item for item in retry_queue if item[0] <= now]
+                    if due:
+                        item = min(due, key=lambda item: item[0])
+                        retry_queue.remove(item)
+                        _, chunk, chunk_id, attempt = item
+                        retried_chunks += 1
+                    elif remaining:
+                        size = self.sizer.size
+                        chunk = [remaining.popleft() for _ in range(min(size, len(remaining)))]
+                        chunk_id = uuid.uuid4().hex
+                        attempt = 0
+                    else:
+                        break
+                    chunk_count += 1
+                    future = executor.submit(self._post_chunk, chunk, chunk_id, subject, body, sender_name)
+                    in_flight[future] = (chunk, chunk_id, attempt)
+
+                # 再送待ちがある場合は、最も早い再送時刻で待機を打ち切って投入し直す
+                timeout = None
+                if retry_queue:
+                    timeout = max(0.0, min(item[0] for item in retry_queue) - time.monotonic())
+                finished, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk, chunk_id, attempt = in_flight.pop(future)
+                    settled = len(chunk)
+                    try:
+                        result = future.result()
+                    except AmbiguousChunkError as e:
+                        self.sizer.shrink()
+                        if not e.results:
+                            # 送信済みか判断できないため再送しない
+                            unknown += len(chunk)
+                            results.extend(self._failed_results(chunk, 'unknown', str(e)))
+                        else:
+                            delivered = [r for r in e.results if r.get('status') == 'success']
+                            delivered_emails = {r.get('email') for r in delivered}
+                            pending = [r for r in chunk if r.get('email') not in delivered_emails]
+                            successful += len(delivered)
+                            results.extend(delivered)
+                            if pending and attempt + 1 < self.max_attempts:
+                                # 成功が確認できなかった宛先のみ、同じchunkIdで再送（サーバー側の重複防止を有効に保つ）
+                                delay = self.retry_policy.compute_delay(TRANSIENT, attempt)
+                                retry_queue.append((time.monotonic() + delay, pending, chunk_id, attempt + 1))
+                                settled -= len(pending)
+                            else:
+                                failed += len(pending)
+                                results.extend(self._failed_results(pending, 'error', str(e)))
+                    except Exception as e:
+                        error_class = classify_exception(e)
+                        self.sizer.shrink()
+                        if error_class != PERMANENT and attempt + 1 < self.max_attempts:
+                            # 接続失敗・送信制限など未処理のチャンクは、同じ構成・同じchunkIdで再送
+                            delay = self.retry_policy.compute_delay(error_class, attempt)
+                            retry_queue.append((time.monotonic() + delay, chunk, chunk_id, attempt + 1))
+                            continue
+                        failed += len(chunk)
+                        results.extend(self._failed_results(chunk, 'error', str(e)))
+                    else:
+                        chunk_results = result.get('results', [])
+                        chunk_success = result.get('successful')
+                        if chunk_success is None:
+                            chunk_success = sum(1 for r in chunk_results if r.get('status') == 'success')
+                        successful += chunk_success
+                        failed += result.get('failed', len(chunk) - chunk_success)
+                        results.extend(chunk_results)
+
+                    done += settled
+                    if on_progress:
+                        on_progress(done, total)
+
+        return {
+            'status': 'completed' if failed == 0 and unknown == 0 else 'partial',
+            'total': total,
+            'successful': successful,
+            'failed': failed,
+            'unknown': unknown,
+            'chunks': chunk_count,
+            'retried_chunks': retried_chunks,
+            'last_chunk_size': self.sizer.size,
+            'timestamp': datetime.now().isoformat(),
+            'results': results
+        }
@@ -0,0 +1,24 @@
+"""
+GAS接続先の設定
+環境変数またはStreamlit secretsで接続先URLを切り替える（ローカルGASサーバーでの検証用）
+"""
+
+import os
+
+
+GAS_URL_ENV = "FUSIONCRM_GAS_URL"
+GAS_URL_SECRET = "gas_url_override"
+
+
+def resolve_gas_url(default: str) -> str:
+    """接続先URL（環境変数 → secrets → 既定値の順）"""
+    url = os.environ.get(GAS_URL_ENV)
+    if url:
+        return url
+
+    try:
+        import streamlit as st
+        url = st.secrets.get(GAS_URL_SECRET)
+    except Exception:
+        url = None
+    return url or default
@@ -0,0 +1,191 @@
+"""
+Gmail API送信
+認証情報ごとにサービスをキャッシュし、HTTPバッチで複数メールを1往復で送信
+"""
+
+import base64
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from google.auth.transport.requests import Request
+    from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
+    GMAIL_API_AVAILABLE = True
+except ImportError:
+    GMAIL_API_AVAILABLE = False
+
+from message_builder import PreparedMessage
+from retry_policy import PERMANENT, THROTTLE, TRANSIENT, RetryPolicy, classify_exception, classify_http_status
+
+
+# 1バッチの件数（上限は100だが、レート制限を避けるため50件を推奨）
+DEFAULT_BATCH_SIZE = 50
+
+# 有効期限の何秒前にトークンを更新するか
+TOKEN_REFRESH_MARGIN = 300
+
+# Gmail APIのレート制限・送信上限を示すエラー理由
+GMAIL_THROTTLE_REASONS = ('ratelimitexceeded', 'userratelimitexceeded', 'dailylimitexceeded', 'quotaexceeded')
+
+GMAIL_RETRY_POLICY = RetryPolicy(max_attempts=3, base_delay=2.0, max_delay=30.0,
+                                 throttle_base_delay=10.0, throttle_max_delay=120.0)
+
+
+class _CachedService:
+    """キャッシュ済みサービス（httplib2は非スレッドセーフのため実行時はロック）"""
+
+    def __init__(self, service, credentials):
+        self.service = service
+        self.credentials = credentials
+        self.lock = threading.Lock()
+
+
+_service_cache: Dict[str, _CachedService] = {}
+_service_cache_lock = threading.Lock()
+
+
+def credential_key(credentials) -> str:
+    """認証情報のキャッシュキー（クライアントID + リフレッシュトークン）"""
+    refresh_token = getattr(credentials, 'refresh_token', None)
+    if not refresh_token:
+        return f"object:{id(credentials)}"
+    digest = hashlib.sha256()
+    digest.update(str(getattr(credentials, 'client_id', '') or '').encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(refresh_token.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def ensure_fresh_token(credentials, margin: int = TOKEN_REFRESH_MARGIN, force: bool = False) -> bool:
+    """有効期限が近ければ送信前にトークンを更新（更新した場合True）"""
+    if not getattr(credentials, 'refresh_token', None):
+        return False
+
+    expiry = getattr(credentials, 'expiry', None)   # google-authはUTCのnaive datetime
+    expiring = expiry is not None and expiry - datetime.utcnow() < timedelta(seconds=margin)
+
+    if force or not credentials.valid or expiring:
+        credentials.refresh(Request())
+        return True
+    return False
+
+
+def get_gmail_service(credentials) -> _CachedService:
+    """認証情報ごとにGmail APIサービスを一度だけ構築して再利用"""
+    key = credential_key(credentials)
+    with _service_cache_lock:
+        cached = _service_cache.get(key)
+        if cached is None:
+            service = build('gmail', 'v1', credentials=credentials, cache_discovery=False)
+            cached = _CachedService(service, credentials)
+            _service_cache[key] = cached
+    return cached
+
+
+def clear_service_cache():
+    """サービスキャッシュをクリア（認証解除時）"""
+    with _service_cache_lock:
+        _service_cache.clear()
+
+
+def encode_raw(prepared: PreparedMessage) -> str:
+    """レンダリング済みメールをGmail APIのraw形式に変換"""
+    return base64.urlsafe_b64encode(prepared.raw).decode('ascii')
+
+
+def classify_gmail_error(error: BaseException) -> str:
+    """Gmail APIのエラーを分類（401はトークン更新後に再試行）"""
+    if GMAIL_API_AVAILABLE and isinstance(error, HttpError):
+        text = str(error).lower()
+        if any(reason in text for reason in GMAIL_THROTTLE_REASONS):
+            return THROTTLE
+        status = int(getattr(error.resp, 'status', 0) or 0)
+        if status == 401:
+            return TRANSIENT
+        return classify_http_status(status)
+    return classify_exception(error)
+
+
+class GmailApiSender:
+    """Gmail APIによる送信（単発・HTTPバッチ）"""
+
+    def __init__(self, credentials, batch_size: int = DEFAULT_BATCH_SIZE,
+                 retry_policy: RetryPolicy = GMAIL_RETRY_POLICY):
+        if not GMAIL_API_AVAILABLE:
+            raise ImportError("google-api-python-client / google-auth が必要です")
+        self.cached = get_gmail_service(credentials)
+        self.batch_size = batch_size
+        self.retry_policy = retry_policy
+        self._force_refresh = False
+
+    def _prepare_credentials(self):
+        ensure_fresh_token(self.cached.credentials, force=self._force_refresh)
+        self._force_refresh = False
+
+    def send(self, prepared: PreparedMessage) -> str:
+        """1通送信してGmailのメッセージIDを返す"""
+        with self.cached.lock:
+            self._prepare_credentials()
+            result = self.cached.service.users().messages().send(
+                userId='me',
+                body={'raw': encode_raw(prepared)}
+            ).execute()
+        return result['id']
+
+    def _execute_batch(self, indexes: List[int], messages: List[PreparedMessage],
+                       results: List[Optional[Tuple[bool, str, str]]]):
+        """1回のHTTPバッチで送信し、パートごとの結果をresultsに格納"""
+        service = self.cached.service
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            if exception is None:
+                results[index] = (True, response.get('id', ''), '')
+                return
+            error_class = classify_gmail_error(exception)
+            if getattr(getattr(exception, 'resp', None), 'status', None) == 401:
+                self._force_refresh = True
+            results[index] = (False, str(exception), error_class)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for index in indexes:
+            batch.add(
+                service.users().messages().send(userId='me', body={'raw': encode_raw(messages[index])}),
+                request_id=str(index)
+            )
+
+        try:
+            batch.execute()
+        except Exception as e:
+            # バッチ全体の失敗（接続断等）は未完了のパートすべてに反映
+            error_class = classify_gmail_error(e)
+            for index in indexes:
+                if results[index] is None or not results[index][0]:
+                    results[index] = (False, str(e), error_class)
+
+    def send_batch(self, messages: List[PreparedMessage]) -> List[Tuple[bool, str, str]]:
+        """複数メールをバッチ送信。入力順に（成功, メッセージIDまたはエラー, エラー分類）を返す
+
+        一時エラー・レート制限のパートのみ、バックオフ後に再送する
+        """
+        results: List[Optional[Tuple[bool, str, str]]] = [None] * len(messages)
+        pending = list(range(len(messages)))
+
+        for attempt in range(self.retry_policy.max_attempts):
+            with self.cached.lock:
+                self._prepare_credentials()
+                for start in range(0, len(pending), self.batch_size):
+                    self._execute_batch(pending[start:start + self.batch_size], messages, results)
+
+            failed = [i for i in pending if not results[i][0] and results[i][2] != PERMANENT]
+            if not failed or not self.retry_policy.should_retry(TRANSIENT, attempt):
+                break
+
+            error_class = THROTTLE if any(results[i][2] == THROTTLE for i in failed) else TRANSIENT
+            self.retry_policy.sleep(self.retry_policy.compute_delay(error_class, attempt))
+            pending = failed
+
+        return results
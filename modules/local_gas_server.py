@@ -0,0 +1,595 @@
+"""
+ローカルGASサーバー
+google_apps_script_backend.js と同じdoGet/doPostのアクションをSQLite上で実装した代替サーバー
+遅延・エラーを注入でき、ネットワークなしでアプリ全体の動作確認・負荷測定を行う
+
+起動例:
+    python modules/local_gas_server.py --port 8765 --latency 0.3 --error-rate 0.05 --seed-companies 1000
+    FUSIONCRM_GAS_URL=http://127.0.0.1:8765/exec streamlit run fusion_crm_unified.py
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from columnar_transport import encode_columnar
+
+
+# シート構成のバージョン（バックエンドのSCHEMA_VERSIONと同じ値）
+SCHEMA_VERSION = 1
+
+# get_companies_pageの既定件数と上限（バックエンドと同じ値）
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+# 企業データの項目（バックエンドの列名）と、Python側の同義の項目名
+COMPANY_FIELDS = [
+    "id", "name", "industry", "website", "contact_person", "email", "phone",
+    "picoCela_score", "status", "notes", "created_date", "last_updated"
+]
+FIELD_ALIASES = {
+    "id": "company_id",
+    "name": "company_name",
+    "status": "sales_status",
+    "created_date": "created_at",
+    "last_updated": "updated_at",
+}
+
+
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _to_time(value) -> float:
+    """最終更新日を比較用の数値に変換（不正な値は0）"""
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def normalize_company(data: Dict, company_id: str, now: str) -> Dict:
+    """両方の項目名（id/company_id, name/company_name等）を持つ企業データに変換"""
+    company = dict(data)
+    company['id'] = company['company_id'] = company_id
+    company_name = data.get('company_name') or data.get('name') or ''
+    company['name'] = company['company_name'] = company_name
+    status = data.get('sales_status') or data.get('status') or 'New'
+    company['status'] = company['sales_status'] = status
+    created = data.get('created_at') or data.get('created_date') or now
+    company['created_date'] = company['created_at'] = created
+    company['last_updated'] = company['updated_at'] = now
+    return company
+
+
+class LocalGasStore:
+    """企業データ・履歴・送信記録のSQLiteストア"""
+
+    def __init__(self, db_path: str = "local_gas_server.db"):
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_database(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS companies (
+                row_number INTEGER PRIMARY KEY AUTOINCREMENT,
+                company_id TEXT UNIQUE,
+                last_updated TEXT,
+                data TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS status_history (
+                history_id TEXT PRIMARY KEY,
+                company_id TEXT,
+                company_name TEXT,
+                old_status TEXT,
+                new_status TEXT,
+                note TEXT,
+                changed_at TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipient TEXT,
+                subject TEXT,
+                body TEXT,
+                sender_name TEXT,
+                chunk_id TEXT,
+                sent_at TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS processed_chunks (
+                chunk_id TEXT PRIMARY KEY,
+                result TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+
+        conn.commit()
+        conn.close()
+
+    # ---- バージョン ----
+
+    def get_version(self, conn: Optional[sqlite3.Connection] = None) -> int:
+        own = conn is None
+        conn = conn or self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        if own:
+            conn.close()
+        return int(row[0]) if row else 0
+
+    def _bump_version(self, cursor):
+        cursor.execute("""
+            INSERT INTO meta (key, value) VALUES ('data_version', '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """)
+
+    # ---- 読み込み ----
+
+    def count_rows(self) -> int:
+        conn = self._connect()
+        total = conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+        conn.close()
+        return total
+
+    def get_companies(self, since: Optional[str] = None, offset: int = 0, limit: Optional[int] = None,
+                      fields: Optional[List[str]] = None) -> List[Dict]:
+        conn = self._connect()
+        query = "SELECT data FROM companies ORDER BY row_number"
+        params: List = []
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset]
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+
+        companies = [json.loads(row[0]) for row in rows]
+        if since:
+            since_time = _to_time(since)
+            companies = [c for c in companies if _to_time(c.get('last_updated')) > since_time]
+        if fields:
+            keep = set(fields) | {FIELD_ALIASES.get(f) for f in fields} | {'id', 'company_id'}
+            companies = [{k: v for k, v in c.items() if k in keep} for c in companies]
+        return companies
+
+    # ---- 書き込み ----
+
+    def add_companies(self, companies: List[Dict], chunk_id: Optional[str] = None) -> Dict:
+        with self._write_lock:
+            conn = self._connect()
+            cursor = conn.cursor()
+
+            if chunk_id:
+                row = cursor.execute("SELECT result FROM processed_chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+                if row:
+                    conn.close()
+                    return dict(json.loads(row[0]), duplicate_chunk=True)
+
+            now = utc_now_iso()
+            rows, details, values = [], [], []
+            for index, data in enumerate(companies or []):
+                name = (data or {}).get('company_name') or (data or {}).get('name')
+                if not name:
+                    rows.append({'index': index, 'success': False, 'error': '企業名がありません'})
+                    details.append(f"❌ {index + 1}行目: 企業名がありません")
+                    continue
+                company_id = "CMP_" + uuid.uuid4().hex[:8]
+                company = normalize_company(data, company_id, now)
+                values.append((company_id, now, json.dumps(company, ensure_ascii=False, default=str)))
+                rows.append({'index': index, 'success': True, 'id': company_id})
+                details.append(f"✅ {name}")
+
+            cursor.executemany("INSERT INTO companies (company_id, last_updated, data) VALUES (?, ?, ?)", values)
+            if values:
+                self._bump_version(cursor)
+
+            result = {
+                'status': 'success',
+                'success': True,
+                'results': {'success': len(values), 'errors': len(rows) - len(values), 'details': details},
+                'rows': rows
+            }
+            if chunk_id:
+                cursor.execute("INSERT INTO processed_chunks (chunk_id, result) VALUES (?, ?)",
+                               (chunk_id, json.dumps(result, ensure_ascii=False)))
+            conn.commit()
+            conn.close()
+            return result
+
+    def update_statuses(self, updates: List[Dict], default_status: Optional[str] = None,
+                        default_note: str = "") -> Dict:
+        with self._write_lock:
+            conn = self._connect()
+            cursor = conn.cursor()
+            now = utc_now_iso()
+            results = []
+            changed = 0
+
+            for update in updates or []:
+                company_id = update.get('company_id') or update.get('companyId')
+                new_status = update.get('new_status') or update.get('status') or default_status
+                note = update.get('note', default_note) or ""
+                row = cursor.execute("SELECT data FROM companies WHERE company_id = ?", (company_id,)).fetchone()
+                if not company_id or not new_status or not row:
+                    results.append({'company_id': company_id, 'success': False,
+                                    'error': '指定された企業が見つかりません' if company_id else '企業IDがありません'})
+                    continue
+
+                company = json.loads(row[0])
+                old_status = company.get('sales_status')
+                company['status'] = company['sales_status'] = new_status
+                company['last_updated'] = company['updated_at'] = now
+                cursor.execute("UPDATE companies SET data = ?, last_updated = ? WHERE company_id = ?",
+                               (json.dumps(company, ensure_ascii=False, default=str), now, company_id))
+                cursor.execute("""
+                    INSERT INTO status_history (history_id, company_id, company_name, old_status, new_status, note, changed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, ("HST_" + uuid.uuid4().hex[:8], company_id, company.get('company_name'),
+                      old_status, new_status, note, now))
+                results.append({'company_id': company_id, 'success': True,
+                                'old_status': old_status, 'new_status': new_status})
+                changed += 1
+
+            if changed:
+                self._bump_version(cursor)
+            conn.commit()
+            conn.close()
+            return {'status': 'success', 'success': True, 'updated': changed,
+                    'failed': len(results) - changed, 'results': results}
+
+    def record_emails(self, recipients: List[Dict], subject: str, body: str, sender_name: str,
+                      chunk_id: Optional[str] = None) -> List[Dict]:
+        """送信の代わりに送信記録へ保存（同じchunkIdで記録済みの宛先は再送しても記録しない）"""
+        now = utc_now_iso()
+        with self._write_lock:
+            conn = self._connect()
+            cursor = conn.cursor()
+            recorded = set()
+            if chunk_id:
+                recorded = {row[0] for row in cursor.execute(
+                    "SELECT recipient FROM outbox WHERE chunk_id = ?", (chunk_id,))}
+            cursor.executemany("""
+                INSERT INTO outbox (recipient, subject, body, sender_name, chunk_id, sent_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(r.get('email'), subject, body, sender_name, chunk_id, now)
+                  for r in recipients if r.get('email') not in recorded])
+            conn.commit()
+            conn.close()
+        return [{'email': r.get('email'), 'company_name': r.get('company_name'),
+                 'status': 'success', 'message': 'recorded'} for r in recipients]
+
+    def seed_companies(self, count: int, domains: int = 50):
+        """検証用の企業データを登録"""
+        self.add_companies([{
+            'company_name': f"Local Company {i}",
+            'email': f"contact{i}@domain{i % max(1, domains)}.example.com",
+            'website': f"https://domain{i % max(1, domains)}.example.com",
+            'description': "Construction site WiFi network deployment",
+            'wifi_needs': ['High', 'Medium', 'Low'][i % 3],
+            'picoCELA_relevance': (i * 7) % 100,
+        } for i in range(count)])
+
+
+class FaultInjector:
+    """応答遅延とエラーの注入"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, timeout_rate: float = 0.0, hang_seconds: float = 60.0,
+                 per_row_latency: float = 0.0, action_latency: Optional[Dict[str, float]] = None,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.per_row_latency = per_row_latency
+        self.action_latency = action_latency or {}
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _random(self) -> float:
+        with self._lock:
+            return self.rng.random()
+
+    def delay(self, action: str, rows: int = 0) -> float:
+        base = self.action_latency.get(action, self.latency)
+        jitter = self.jitter * (2 * self._random() - 1)
+        return max(0.0, base + jitter + self.per_row_latency * rows)
+
+    def pick_fault(self) -> Optional[str]:
+        """'timeout' / 'throttle' / 'error' / None"""
+        value = self._random()
+        if value < self.timeout_rate:
+            return 'timeout'
+        value -= self.timeout_rate
+        if value < self.throttle_rate:
+            return 'throttle'
+        value -= self.throttle_rate
+        if value < self.error_rate:
+            return 'error'
+        return None
+
+
+class LocalGasBackend:
+    """アクションの振り分け（google_apps_script_backend.jsのdoPost/doGetに対応）"""
+
+    def __init__(self, store: LocalGasStore):
+        self.store = store
+
+    def handle(self, action: str, request: Dict) -> Dict:
+        handler = getattr(self, f"action_{action}", None) or getattr(self, f"action_{self._snake(action)}", None)
+        if handler is None:
+            raise ValueError(f"未知のアクション: {action}")
+        return handler(request)
+
+    @staticmethod
+    def _snake(name: str) -> str:
+        return ''.join('_' + c.lower() if c.isupper() else c for c in name or '')
+
+    def action_ping(self, request: Dict) -> Dict:
+        return {'status': 'success', 'success': True,
+                'message': 'FusionCRM ローカルバックエンドが正常に動作しています', 'timestamp': utc_now_iso()}
+
+    action_test = action_ping
+
+    def action_init_database(self, request: Dict) -> Dict:
+        self.store.init_database()
+        return {'status': 'success', 'success': True, 'spreadsheet_url': f"sqlite:///{self.store.db_path}",
+                'schema_version': SCHEMA_VERSION}
+
+    @staticmethod
+    def _companies_payload(companies: List[Dict], request: Dict, fields: Optional[List[str]] = None) -> Dict:
+        """format=columnarなら列形式（compress=gzipで圧縮）、それ以外は行形式"""
+        if request.get('format') == 'columnar':
+            return encode_columnar(companies, fields, request.get('compress'))
+        return {'data': companies, 'companies': companies, 'count': len(companies)}
+
+    def action_get_companies(self, request: Dict) -> Dict:
+        server_time = utc_now_iso()
+        companies = self.store.get_companies(request.get('since'))
+        return dict({'status': 'success', 'success': True, 'total': self.store.count_rows(),
+                     'since': request.get('since'), 'server_time': server_time},
+                    **self._companies_payload(companies, request))
+
+    def action_get_companies_page(self, request: Dict) -> Dict:
+        total_rows = self.store.count_rows()
+        offset = max(int(request.get('offset') or 0), 0)
+        limit = min(max(int(request.get('limit') or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        fields = request.get('fields')
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(',') if f.strip()]
+        companies = self.store.get_companies(request.get('since'), offset, limit, fields)
+        next_offset = offset + limit
+        return dict({'status': 'success', 'success': True, 'offset': offset, 'limit': limit,
+                     'total_rows': total_rows, 'has_more': next_offset < total_rows,
+                     'next_offset': next_offset if next_offset < total_rows else None,
+                     'fields': fields or COMPANY_FIELDS, 'version': self.store.get_version()},
+                    **self._companies_payload(companies, request))
+
+    def action_get_companies_if_changed(self, request: Dict) -> Dict:
+        version = self.store.get_version()
+        client_version = request.get('version')
+        if client_version not in (None, '') and int(client_version) == version:
+            return {'status': 'success', 'success': True, 'modified': False, 'version': version}
+        if str(request.get('version_only')).lower() == 'true':
+            return {'status': 'success', 'success': True, 'modified': True, 'version': version,
+                    'total_rows': self.store.count_rows()}
+        companies = self.store.get_companies()
+        return dict({'status': 'success', 'success': True, 'modified': True, 'version': version},
+                    **self._companies_payload(companies, request))
+
+    def action_add_company(self, request: Dict) -> Dict:
+        company = request.get('company') or request.get('data') or {}
+        result = self.store.add_companies([company])
+        row = result['rows'][0]
+        if not row['success']:
+            raise ValueError(row['error'])
+        return {'status': 'success', 'success': True, 'message': '企業が正常に追加されました',
+                'id': row['id'], 'company_id': row['id']}
+
+    def action_add_companies_batch(self, request: Dict) -> Dict:
+        started = time.monotonic()
+        result = self.store.add_companies(request.get('companies') or [], request.get('chunkId'))
+        result.setdefault('executionTime', int((time.monotonic() - started) * 1000))
+        return result
+
+    def action_update_status(self, request: Dict) -> Dict:
+        result = self.store.update_statuses([{
+            'company_id': request.get('company_id') or request.get('companyId'),
+            'new_status': request.get('new_status') or request.get('status'),
+            'note': request.get('note', '')
+        }])
+        item = result['results'][0]
+        if not item['success']:
+            raise ValueError(item['error'])
+        return {'status': 'success', 'success': True,
+                'message': f"ステータスを {item['old_status']} から {item['new_status']} に更新しました"}
+
+    def action_update_status_batch(self, request: Dict) -> Dict:
+        updates = request.get('updates') or [
+            {'company_id': company_id}
+            for company_id in (request.get('company_ids') or request.get('companyIds') or [])
+        ]
+        return self.store.update_statuses(updates, request.get('new_status') or request.get('status'),
+                                          request.get('note', ''))
+
+    def action_send_email(self, request: Dict) -> Dict:
+        self.store.record_emails([{'email': request.get('recipient')}], request.get('subject', ''),
+                                 request.get('body', ''), request.get('senderName', ''))
+        return {'status': 'success', 'success': True,
+                'message': f"{request.get('recipient')} に送信しました（ローカル記録）", 'timestamp': utc_now_iso()}
+
+    def action_send_bulk_emails(self, request: Dict) -> Dict:
+        started = time.monotonic()
+        recipients = request.get('recipients') or []
+        results = self.store.record_emails(recipients, request.get('subject', ''), request.get('body', ''),
+                                           request.get('senderName', ''), request.get('chunkId'))
+        return {'status': 'completed', 'success': True, 'total': len(recipients),
+                'successful': len(results), 'failed': 0, 'results': results,
+                'executionTime': int((time.monotonic() - started) * 1000), 'timestamp': utc_now_iso()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """HTTPリクエストをバックエンドへ渡し、遅延・エラーを注入"""
+
+    server_version = "LocalGAS/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, status_code: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, request: Dict):
+        server = self.server
+        action = request.get('action')
+        rows = len(request.get('companies') or request.get('recipients') or request.get('updates') or [])
+        server.stats[action] = server.stats.get(action, 0) + 1
+
+        fault = server.faults.pick_fault()
+        if fault == 'timeout':
+            time.sleep(server.faults.hang_seconds)
+        else:
+            time.sleep(server.faults.delay(action, rows))
+        if fault == 'throttle':
+            return self._reply(429, {'status': 'error', 'message': 'Rate limit exceeded (injected)'})
+        if fault == 'error':
+            return self._reply(500, {'status': 'error', 'message': 'Internal error (injected)'})
+
+        # Apps Scriptと同じく、処理エラーはHTTP 200のエラーJSONで返す
+        try:
+            if not action:
+                result = server.backend.action_ping(request)
+                result['spreadsheetUrl'] = f"sqlite:///{server.backend.store.db_path}"
+            else:
+                result = server.backend.handle(action, request)
+        except Exception as e:
+            result = {'status': 'error', 'success': False, 'message': str(e), 'error': str(e),
+                      'timestamp': utc_now_iso()}
+        self._reply(200, result)
+
+    def do_GET(self):
+        params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self._dispatch(params)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            return self._reply(200, {'status': 'error', 'success': False, 'message': f"JSON解析エラー: {e}"})
+        self._dispatch(request)
+
+
+class LocalGasServer:
+    """ローカルGASサーバー（バックグラウンドスレッドで起動、with文で使用可）"""
+
+    def __init__(self, db_path: str = "local_gas_server.db", host: str = "127.0.0.1", port: int = 0,
+                 faults: Optional[FaultInjector] = None, verbose: bool = False):
+        self.store = LocalGasStore(db_path)
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.backend = LocalGasBackend(self.store)
+        self.httpd.faults = faults or FaultInjector()
+        self.httpd.stats = {}
+        self.httpd.verbose = verbose
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/exec"
+
+    @property
+    def faults(self) -> FaultInjector:
+        return self.httpd.faults
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """アクションごとのリクエスト数"""
+        return self.httpd.stats
+
+    def start(self) -> "LocalGasServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ローカルGASサーバー（SQLite）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db', default='local_gas_server.db', help='SQLiteファイル')
+    parser.add_argument('--latency', type=float, default=0.0, help='応答遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='遅延のゆらぎ（±秒）')
+    parser.add_argument('--per-row-latency', type=float, default=0.0, help='一括処理の1件あたり遅延（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='HTTP 500を返す割合')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='HTTP 429を返す割合')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='応答を止める割合')
+    parser.add_argument('--hang-seconds', type=float, default=60.0, help='応答を止める時間（秒）')
+    parser.add_argument('--seed', type=int, default=None, help='乱数シード')
+    parser.add_argument('--seed-companies', type=int, default=0, help='起動時に登録する検証用企業数')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = LocalGasServer(args.db, args.host, args.port, FaultInjector(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds, per_row_latency=args.per_row_latency, seed=args.seed
+    ), verbose=args.verbose)
+    if args.seed_companies:
+        server.store.seed_companies(args.seed_companies)
+
+    print(f"ローカルGASサーバー起動: {server.url}")
+    print(f"環境変数 FUSIONCRM_GAS_URL={server.url} でアプリの接続先を切り替えます")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
@@ -0,0 +1,162 @@
+"""
+メッセージ事前レンダリング
+送信メールを一度だけRFC 5322バイト列に変換し、リトライ・アカウント切替時に再利用
+"""
+
+import hashlib
+import math
+from collections import OrderedDict
+from email import charset as email_charset
+from email import quoprimime
+from email.mime.text import MIMEText
+from email.policy import compat32
+from email.utils import formataddr, formatdate, make_msgid
+from typing import Dict, List, Optional
+
+
+# SMTP送信用ポリシー（CRLF改行）
+SMTP_POLICY = compat32.clone(linesep='\r\n')
+
+# RFC 5322の1行最大長
+MAX_LINE_LENGTH = 998
+
+# キャッシュ上限（件数）
+DEFAULT_CACHE_SIZE = 1000
+
+
+class PreparedMessage:
+    """レンダリング済みメール（エンベロープ情報 + 生バイト列）"""
+
+    def __init__(self, from_addr: str, to_addrs: List[str], raw: bytes,
+                 message_id: str, encoding: str):
+        self.from_addr = from_addr
+        self.to_addrs = to_addrs
+        self.raw = raw
+        self.message_id = message_id
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.raw)
+
+
+def choose_transfer_encoding(body: str) -> str:
+    """本文に対して最小サイズとなるContent-Transfer-Encodingを選択"""
+    body_bytes = body.encode('utf-8')
+
+    # ASCIIのみかつ行長制限内なら変換不要
+    if body.isascii() and all(len(line) <= MAX_LINE_LENGTH for line in body.splitlines()):
+        return '7bit'
+
+    qp_chars = quoprimime.body_length(body_bytes)
+    qp_length = qp_chars + 3 * (qp_chars // 75)
+    b64_chars = 4 * math.ceil(len(body_bytes) / 3)
+    b64_length = b64_chars + 2 * (b64_chars // 76)
+
+    return 'quoted-printable' if qp_length <= b64_length else 'base64'
+
+
+def _make_body_part(body: str, subtype: str, encoding: str) -> MIMEText:
+    """選択したエンコーディングで本文パートを作成"""
+    if encoding == '7bit':
+        return MIMEText(body, subtype, 'us-ascii')
+
+    cs = email_charset.Charset('utf-8')
+    cs.header_encoding = email_charset.BASE64
+    cs.body_encoding = email_charset.QP if encoding == 'quoted-printable' else email_charset.BASE64
+    return MIMEText(body, subtype, cs)
+
+
+def build_message(to_email: str, subject: str, body: str, gmail_config: Dict,
+                  subtype: str = 'plain', reply_to: Optional[str] = None) -> PreparedMessage:
+    """メールを一度だけレンダリングしてPreparedMessageを返す"""
+    sender_email = gmail_config['email']
+    sender_name = gmail_config.get('sender_name', '')
+    domain = sender_email.split('@')[-1] if '@' in sender_email else None
+
+    encoding = choose_transfer_encoding(body)
+    msg = _make_body_part(body, subtype, encoding)
+
+    msg['From'] = formataddr((sender_name, sender_email)) if sender_name else sender_email
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg['Date'] = formatdate(localtime=True)
+    message_id = make_msgid(domain=domain)
+    msg['Message-ID'] = message_id
+    if reply_to:
+        msg['Reply-To'] = reply_to
+
+    raw = msg.as_bytes(policy=SMTP_POLICY)
+
+    return PreparedMessage(
+        from_addr=sender_email,
+        to_addrs=[to_email],
+        raw=raw,
+        message_id=message_id,
+        encoding=encoding
+    )
+
+
+class MessageCache:
+    """レンダリング済みメールのLRUキャッシュ
+
+    キーには配信キー（送信試行の識別子）を含める。同じ試行のリトライでは同じバイト列・Message-IDを送り、
+    別の試行（後日の再送等）ではDate・Message-IDを新しく生成する
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def make_key(to_email: str, subject: str, body: str, gmail_config: Dict,
+                 subtype: str = 'plain', reply_to: Optional[str] = None, delivery_key: str = '') -> str:
+        """キャッシュキー（配信キー・宛先・送信者・内容のハッシュ）"""
+        digest = hashlib.sha256()
+        for part in (delivery_key, to_email, subject, body, gmail_config.get('email', ''),
+                     gmail_config.get('sender_name', ''), subtype, reply_to or ''):
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+
+    def get_or_build(self, to_email: str, subject: str, body: str, gmail_config: Dict,
+                     subtype: str = 'plain', reply_to: Optional[str] = None,
+                     delivery_key: Optional[str] = None) -> PreparedMessage:
+        """キャッシュ済みならそのまま返し、なければレンダリングして保存（配信キーなしは毎回レンダリング）"""
+        if delivery_key is None:
+            return build_message(to_email, subject, body, gmail_config, subtype, reply_to)
+
+        key = self.make_key(to_email, subject, body, gmail_config, subtype, reply_to, delivery_key)
+
+        prepared = self._cache.get(key)
+        if prepared is not None:
+            self._cache.move_to_end(key)
+            return prepared
+
+        prepared = build_message(to_email, subject, body, gmail_config, subtype, reply_to)
+        self._cache[key] = prepared
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return prepared
+
+    def clear(self):
+        """キャッシュをクリア"""
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+# プロセス共通キャッシュ
+message_cache = MessageCache()
+
+
+def get_prepared_message(to_email: str, subject: str, body: str, gmail_config: Dict,
+                         subtype: str = 'plain', reply_to: Optional[str] = None,
+                         delivery_key: Optional[str] = None) -> PreparedMessage:
+    """共通キャッシュ経由でレンダリング済みメールを取得（delivery_keyは送信試行ごとに一意な値）"""
+    return message_cache.get_or_build(to_email, subject, body, gmail_config, subtype, reply_to, delivery_key)
+
+
+def submit_prepared_message(server, prepared: PreparedMessage, envelope_from: Optional[str] = None) -> Dict:
+    """ログイン済みSMTP接続へ生バイト列をそのまま送信（再シリアライズなし）"""
+    return server.sendmail(envelope_from or prepared.from_addr, prepared.to_addrs, prepared.raw)
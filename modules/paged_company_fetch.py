@@ -0,0 +1,82 @@
+"""
+企業データのページ並列取得
+get_companies_pageを複数ページ同時に取得し、ページ順に組み立てながら逐次処理へ渡す
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+from columnar_transport import COLUMNAR_PARAMS, companies_records
+
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_MAX_PARALLEL = 4
+REQUEST_TIMEOUT = 60
+
+
+class PagedCompanyFetcher:
+    """ページ単位の並列取得（1ページ目で総行数を取得し、残りを並列に要求）"""
+
+    def __init__(self, gas_url: str, page_size: int = DEFAULT_PAGE_SIZE,
+                 max_parallel: int = DEFAULT_MAX_PARALLEL, fields: Optional[Sequence[str]] = None,
+                 session=None, headers: Optional[Dict] = None, columnar: bool = False):
+        self.gas_url = gas_url
+        self.page_size = page_size
+        self.max_parallel = max_parallel
+        self.fields = list(fields) if fields else None
+        self.session = session or requests
+        self.headers = headers or {'Accept': 'application/json'}
+        # 列形式（gzip圧縮）で要求し、転送量を削減
+        self.columnar = columnar
+
+    def fetch_page(self, offset: int) -> Dict:
+        """1ページ取得"""
+        params = {'action': 'get_companies_page', 'offset': offset, 'limit': self.page_size}
+        if self.fields:
+            params['fields'] = ','.join(self.fields)
+        if self.columnar:
+            params.update(COLUMNAR_PARAMS)
+
+        response = self.session.get(self.gas_url, params=params, headers=self.headers, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        result = response.json()
+        if not result.get('success'):
+            raise RuntimeError(result.get('error') or result.get('message') or 'Unknown error')
+        return result
+
+    def iter_pages(self) -> Iterator[Tuple[int, int, List[Dict]]]:
+        """(ページ番号, 総行数, 企業データ)をページ順に返す
+
+        先読み中のページは並列に取得し、順序が前後して届いたページは前のページが揃うまで保持する
+        """
+        first = self.fetch_page(0)
+        total_rows = int(first.get('total_rows', 0))
+        yield 0, total_rows, companies_records(first)
+
+        # サーバー側で上限に丸められた場合はその件数で続きを要求
+        page_size = int(first.get('limit') or self.page_size)
+        offsets = list(range(page_size, total_rows, page_size))
+        if not offsets:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            # 順番に結果を取り出すので、先頭から最大max_parallel件のみ先行させる
+            futures = {}
+            next_submit = 0
+            for page_number in range(1, len(offsets) + 1):
+                while next_submit < len(offsets) and next_submit < page_number - 1 + self.max_parallel:
+                    futures[next_submit + 1] = executor.submit(self.fetch_page, offsets[next_submit])
+                    next_submit += 1
+                result = futures.pop(page_number).result()
+                yield page_number, total_rows, companies_records(result)
+
+    def fetch_all(self, on_page: Optional[Callable[[int, int, List[Dict]], None]] = None) -> List[Dict]:
+        """全ページを取得して結合（on_pageには到着順ではなくページ順で渡す）"""
+        companies: List[Dict] = []
+        for page_number, total_rows, page in self.iter_pages():
+            companies.extend(page)
+            if on_page:
+                on_page(page_number, total_rows, page)
+        return companies
@@ -0,0 +1,176 @@
+"""
+リトライポリシー
+SMTP応答コード・HTTPステータス・ネットワーク例外を恒久/一時/制限に分類し、
+一時エラーと制限にのみ上限付き指数バックオフ（ジッター付き）でリトライ
+"""
+
+import random
+import socket
+import smtplib
+import time
+from typing import Callable, Optional
+
+
+# エラー分類
+PERMANENT = 'permanent'   # リトライしても成功しない（無効アドレス等）
+TRANSIENT = 'transient'   # 一時的な障害（接続断、5xx等）
+THROTTLE = 'throttle'     # 送信制限・レート制限（長めに待つ）
+
+# Gmail等の送信制限を示す応答文言
+THROTTLE_MARKERS = ('quota', 'rate limit', 'too many', 'try again later', '4.7.0', '5.4.5')
+
+# 一時エラーとして扱うSMTP 5xxコード（拡張コードで判断できない場合）
+TRANSIENT_SMTP_CODES = {421, 450, 451, 452, 454}
+
+
+class PermanentError(Exception):
+    """リトライ不要な恒久エラー"""
+
+    def __init__(self, message: str, error_class: str = PERMANENT, cause: Optional[BaseException] = None):
+        super().__init__(message)
+        self.error_class = error_class
+        self.cause = cause
+
+
+class BackendError(PermanentError):
+    """GAS等のバックエンドが返したエラー応答（success: false / status: error）
+
+    HTTPとしては成功しており、同じ要求を再送しても結果は変わらないため恒久エラーとして扱う
+    """
+
+    def __init__(self, message: str, result: Optional[dict] = None):
+        super().__init__(message, PERMANENT)
+        self.result = result or {}
+
+
+def _decode(text) -> str:
+    """SMTP応答メッセージを文字列化"""
+    if isinstance(text, bytes):
+        return text.decode('utf-8', errors='replace')
+    return str(text or '')
+
+
+def classify_smtp_reply(code: int, message='') -> str:
+    """SMTP応答コードを分類"""
+    text = _decode(message).lower()
+
+    if any(marker in text for marker in THROTTLE_MARKERS):
+        return THROTTLE
+    if code in TRANSIENT_SMTP_CODES or 400 <= code < 500:
+        return TRANSIENT
+    if 500 <= code < 600:
+        return PERMANENT
+    return TRANSIENT
+
+
+def classify_http_status(status_code: int) -> str:
+    """HTTPステータスコードを分類（GAS・OpenAI共通）"""
+    if status_code == 429:
+        return THROTTLE
+    if status_code in (408, 425) or status_code >= 500:
+        return TRANSIENT
+    if 400 <= status_code < 500:
+        return PERMANENT
+    return TRANSIENT
+
+
+def classify_exception(error: BaseException) -> str:
+    """例外を分類（smtplib・requests・openai・ソケット）"""
+    # 分類済みの例外（BackendError等）
+    if isinstance(error, PermanentError):
+        return error.error_class
+
+    # 宛先拒否: 全宛先が4xxなら一時エラー、それ以外は恒久
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        classes = [classify_smtp_reply(code, msg) for code, msg in error.recipients.values()]
+        if classes and all(c == TRANSIENT for c in classes):
+            return TRANSIENT
+        if THROTTLE in classes:
+            return THROTTLE
+        return PERMANENT
+
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return PERMANENT
+
+    if isinstance(error, smtplib.SMTPResponseException):
+        return classify_smtp_reply(error.smtp_code, error.smtp_error)
+
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return TRANSIENT
+
+    # openai（APIStatusError）・requests（HTTPError）のステータスコード
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        response = getattr(error, 'response', None)
+        status_code = getattr(response, 'status_code', None)
+    if isinstance(status_code, int):
+        return classify_http_status(status_code)
+
+    name = type(error).__name__
+    if name == 'RateLimitError':
+        return THROTTLE
+    if name in ('Timeout', 'ReadTimeout', 'ConnectTimeout', 'ConnectionError',
+                'APIConnectionError', 'APITimeoutError', 'ChunkedEncodingError'):
+        return TRANSIENT
+
+    if isinstance(error, (socket.timeout, TimeoutError, ConnectionError, OSError)):
+        return TRANSIENT
+
+    # 値の不正など、同じ入力で再実行しても結果が変わらないもの
+    if isinstance(error, (ValueError, TypeError, KeyError)):
+        return PERMANENT
+
+    return TRANSIENT
+
+
+class RetryPolicy:
+    """上限付き指数バックオフ（フルジッター）"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 2.0, max_delay: float = 60.0,
+                 throttle_base_delay: float = 30.0, throttle_max_delay: float = 300.0,
+                 sleep: Callable[[float], None] = time.sleep, rng: Optional[random.Random] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_base_delay = throttle_base_delay
+        self.throttle_max_delay = throttle_max_delay
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+
+    def should_retry(self, error_class: str, attempt: int) -> bool:
+        """リトライ可否（attemptは0始まり）"""
+        return error_class != PERMANENT and attempt < self.max_attempts - 1
+
+    def compute_delay(self, error_class: str, attempt: int) -> float:
+        """待機秒数を計算"""
+        if error_class == THROTTLE:
+            ceiling = min(self.throttle_max_delay, self.throttle_base_delay * (2 ** attempt))
+        else:
+            ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return self.rng.uniform(0, ceiling)
+
+    def call(self, func: Callable, *args, classify: Callable[[BaseException], str] = classify_exception,
+             on_retry: Optional[Callable[[BaseException, str, int, float], None]] = None, **kwargs):
+        """funcを実行し、分類に応じてリトライ。恒久エラーはPermanentErrorで即時送出"""
+        for attempt in range(self.max_attempts):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                error_class = classify(e)
+
+                if error_class == PERMANENT:
+                    raise PermanentError(str(e), PERMANENT, e) from e
+                if not self.should_retry(error_class, attempt):
+                    raise
+
+                delay = self.compute_delay(error_class, attempt)
+                if on_retry:
+                    on_retry(e, error_class, attempt, delay)
+                self.sleep(delay)
+
+
+# 用途別の既定ポリシー
+SMTP_RETRY_POLICY = RetryPolicy(max_attempts=3, base_delay=5.0, max_delay=60.0)
+HTTP_RETRY_POLICY = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=30.0)
+OPENAI_RETRY_POLICY = RetryPolicy(max_attempts=4, base_delay=2.0, max_delay=30.0,
+                                  throttle_base_delay=10.0, throttle_max_delay=120.0)
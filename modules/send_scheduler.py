@@ -0,0 +1,166 @@
+"""
+送信スケジューラー
+宛先ドメイン単位の同時送信数上限・最小送信間隔と、ドメイン間のインターリーブ
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+
+# 既定値: 同一ドメインへの同時送信数と最小送信間隔（秒）
+# 間隔は送信全体の間隔（send_interval）と重ねて数えるため、単一ドメイン中心のリストでも大きく遅くならない値
+DEFAULT_DOMAIN_MAX_CONCURRENCY = 1
+DEFAULT_DOMAIN_MIN_GAP = 30
+
+
+def extract_domain(email: Optional[str]) -> str:
+    """メールアドレスからドメインを取得（小文字化）"""
+    if not email:
+        return ''
+    email = str(email).strip()
+    if '@' not in email:
+        return ''
+    return email.rsplit('@', 1)[1].strip().strip('>').lower()
+
+
+def build_domain_index(companies: List[Dict]) -> "OrderedDict[str, List[Dict]]":
+    """company.get('email')のドメインごとに企業をまとめる（出現順を保持）"""
+    index = OrderedDict()
+    for company in companies:
+        domain = extract_domain(company.get('email'))
+        index.setdefault(domain, []).append(company)
+    return index
+
+
+def interleave_by_domain(companies: List[Dict]) -> List[Dict]:
+    """ドメイン間でラウンドロビンに並べ替え、同一ドメインの連続送信を避ける"""
+    queues = deque(deque(group) for group in build_domain_index(companies).values())
+    ordered = []
+
+    while queues:
+        group = queues.popleft()
+        ordered.append(group.popleft())
+        if group:
+            queues.append(group)
+
+    return ordered
+
+
+class DomainThrottle:
+    """ドメイン単位の同時送信数上限と最小送信間隔（スレッドセーフ）"""
+
+    def __init__(self, max_concurrency: int = DEFAULT_DOMAIN_MAX_CONCURRENCY,
+                 min_gap: float = DEFAULT_DOMAIN_MIN_GAP,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.min_gap = min_gap
+        self.clock = clock
+        self._active: Dict[str, int] = {}
+        self._last_started: Dict[str, float] = {}
+        self._condition = threading.Condition()
+
+    def wait_time(self, domain: str) -> float:
+        """送信可能になるまでの秒数（0なら即時送信可）"""
+        with self._condition:
+            return self._wait_time_locked(domain)
+
+    def _wait_time_locked(self, domain: str) -> float:
+        if not domain:
+            return 0.0
+        if self._active.get(domain, 0) >= self.max_concurrency:
+            # 同時送信枠の解放待ち（最小間隔分を目安とする）
+            return max(self.min_gap, 0.001)
+        last = self._last_started.get(domain)
+        if last is None:
+            return 0.0
+        return max(0.0, last + self.min_gap - self.clock())
+
+    def try_acquire(self, domain: str) -> bool:
+        """待たずに送信枠を確保（不可ならFalse）"""
+        with self._condition:
+            if self._wait_time_locked(domain) > 0:
+                return False
+            self._start_locked(domain)
+            return True
+
+    def acquire(self, domain: str, sleep: Callable[[float], None] = None):
+        """送信枠を確保できるまで待機"""
+        with self._condition:
+            while True:
+                wait = self._wait_time_locked(domain)
+                if wait <= 0:
+                    self._start_locked(domain)
+                    return
+                if sleep is None:
+                    self._condition.wait(timeout=wait)
+                else:
+                    # 外部の待機関数（仮想時計等）を使う場合はロックを外して待つ
+                    self._condition.release()
+                    try:
+                        sleep(wait)
+                    finally:
+                        self._condition.acquire()
+
+    def _start_locked(self, domain: str):
+        if not domain:
+            return
+        self._active[domain] = self._active.get(domain, 0) + 1
+        self._last_started[domain] = self.clock()
+
+    def release(self, domain: str):
+        """送信完了後に送信枠を返却"""
+        if not domain:
+            return
+        with self._condition:
+            self._active[domain] = max(0, self._active.get(domain, 0) - 1)
+            self._condition.notify_all()
+
+
+class DomainAwareQueue:
+    """送信可能なドメインの企業を優先して取り出す送信キュー"""
+
+    def __init__(self, companies: List[Dict], throttle: DomainThrottle):
+        self.throttle = throttle
+        self._pending = deque(interleave_by_domain(companies))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pop_ready(self) -> Optional[Dict]:
+        """送信枠を確保できた最初の企業を返す（全ドメイン待機中ならNone）"""
+        for _ in range(len(self._pending)):
+            company = self._pending.popleft()
+            if self.throttle.try_acquire(extract_domain(company.get('email'))):
+                return company
+            self._pending.append(company)
+        return None
+
+    def next_wait(self) -> float:
+        """いずれかのドメインが送信可能になるまでの最短秒数"""
+        if not self._pending:
+            return 0.0
+        return min(self.throttle.wait_time(extract_domain(c.get('email'))) for c in self._pending)
+
+
+def drain_by_domain(companies: List[Dict], throttle: DomainThrottle,
+                    sleep: Callable[[float], None] = time.sleep):
+    """ドメイン制御に従って企業を順に取り出す（次の取り出し時に前の送信枠を返却）"""
+    queue = DomainAwareQueue(companies, throttle)
+
+    while len(queue):
+        company = queue.pop_ready()
+        if company is None:
+            sleep(queue.next_wait())
+            continue
+
+        domain = extract_domain(company.get('email'))
+        try:
+            yield company
+        finally:
+            throttle.release(domain)
+
+
+# プロセス内の全セッションで共有するドメイン制御（既定値・明示的に指定した場合のみ使用）
+shared_domain_throttle = DomainThrottle()
@@ -0,0 +1,301 @@
+"""
+送信シミュレーター
+modules/email_sender .py の送信処理をそのまま仮想時計上で実行し、
+模擬SMTPプロバイダーに対する所要時間・送信枠消費・リトライ量を見積もる（実際には送信しない）
+"""
+
+import importlib.util
+import itertools
+import os
+import random
+import smtplib
+import tempfile
+import time
+import types
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Dict, List, Optional
+
+from email_database import IntegratedEmailDatabase
+from retry_policy import SMTP_RETRY_POLICY, RetryPolicy
+from send_scheduler import DomainThrottle, drain_by_domain
+from send_window import SendWindowQueue, drain_in_send_windows
+
+
+EMAIL_SENDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_sender .py')
+
+_module_counter = itertools.count()
+
+
+class VirtualClock:
+    """仮想時計（sleepは待たずに時刻を進める）"""
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.start = start or datetime.now(timezone.utc)
+        self.now = 0.0
+        self.slept = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        seconds = max(0.0, float(seconds or 0))
+        self.now += seconds
+        self.slept += seconds
+
+    def advance(self, seconds: float):
+        """処理時間（SMTP応答待ち等）として時刻を進める"""
+        self.now += max(0.0, seconds)
+
+    def utc_now(self) -> datetime:
+        return self.start + timedelta(seconds=self.now)
+
+    def as_time_module(self) -> types.SimpleNamespace:
+        """timeモジュールの代替（送信処理が参照するtime/sleep/monotonicのみ）"""
+        return types.SimpleNamespace(time=self.time, sleep=self.sleep, monotonic=self.monotonic)
+
+
+class ProviderProfile:
+    """模擬SMTPプロバイダーの特性（既定値は個人Gmail相当）"""
+
+    def __init__(self, connect_latency: float = 0.8, login_latency: float = 0.5,
+                 send_latency: float = 1.2, latency_jitter: float = 0.5,
+                 transient_failure_rate: float = 0.02, permanent_failure_rate: float = 0.01,
+                 rate_limit: int = 20, rate_window: float = 60.0, daily_quota: int = 500,
+                 auth_failure: bool = False):
+        self.connect_latency = connect_latency
+        self.login_latency = login_latency
+        self.send_latency = send_latency
+        self.latency_jitter = latency_jitter
+        self.transient_failure_rate = transient_failure_rate
+        self.permanent_failure_rate = permanent_failure_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.daily_quota = daily_quota
+        self.auth_failure = auth_failure
+
+
+class SimulatedProvider:
+    """模擬SMTPサーバー（応答時間・送信レート制限・日次上限・失敗を再現）"""
+
+    def __init__(self, profile: ProviderProfile, clock: VirtualClock, rng: random.Random):
+        self.profile = profile
+        self.clock = clock
+        self.rng = rng
+        self.accepted_at: List[float] = []
+        self.stats = {'connections': 0, 'attempts': 0, 'accepted': 0, 'transient': 0,
+                      'throttled': 0, 'permanent': 0, 'quota_exceeded': 0}
+        self._permanent_recipients = set()
+        self._attempted_recipients = set()
+
+    def _latency(self, base: float) -> float:
+        jitter = self.profile.latency_jitter
+        return max(0.0, base * (1 + self.rng.uniform(-jitter, jitter)))
+
+    @property
+    def retries(self) -> int:
+        """同一宛先への再送回数"""
+        return self.stats['attempts'] - len(self._attempted_recipients)
+
+    def smtp_factory(self, *args, **kwargs) -> "SimulatedSMTP":
+        return SimulatedSMTP(self)
+
+    def deliver(self, to_addrs: List[str]):
+        """1通分の送信判定（smtplibと同じ例外を送出）"""
+        profile = self.profile
+        self.stats['attempts'] += 1
+        self._attempted_recipients.update(to_addrs)
+        self.clock.advance(self._latency(profile.send_latency))
+        now = self.clock.time()
+
+        if len(self.accepted_at) >= profile.daily_quota:
+            self.stats['quota_exceeded'] += 1
+            raise smtplib.SMTPDataError(550, b'5.4.5 Daily user sending quota exceeded.')
+
+        recent = [t for t in self.accepted_at if now - t < profile.rate_window]
+        if len(recent) >= profile.rate_limit:
+            self.stats['throttled'] += 1
+            raise smtplib.SMTPDataError(421, b'4.7.0 Try again later, closing connection.')
+
+        # 恒久エラーは宛先ごとに固定（リトライしても同じ結果）
+        recipient = to_addrs[0] if to_addrs else ''
+        if recipient in self._permanent_recipients or self.rng.random() < profile.permanent_failure_rate:
+            self._permanent_recipients.add(recipient)
+            self.stats['permanent'] += 1
+            raise smtplib.SMTPRecipientsRefused({recipient: (550, b'5.1.1 The email account does not exist.')})
+
+        if self.rng.random() < profile.transient_failure_rate:
+            self.stats['transient'] += 1
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+        self.accepted_at.append(now)
+        self.stats['accepted'] += 1
+
+
+class SimulatedSMTP:
+    """smtplib.SMTP互換の模擬接続"""
+
+    def __init__(self, provider: SimulatedProvider):
+        self.provider = provider
+        provider.stats['connections'] += 1
+        provider.clock.advance(provider._latency(provider.profile.connect_latency))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        self.provider.clock.advance(self.provider._latency(self.provider.profile.login_latency))
+        if self.provider.profile.auth_failure:
+            raise smtplib.SMTPAuthenticationError(535, b'5.7.8 Username and Password not accepted.')
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.provider.deliver(list(to_addrs))
+        return {}
+
+    def quit(self):
+        pass
+
+
+class _QuietStreamlit:
+    """UI出力を記録するだけのstreamlit代替"""
+
+    def __init__(self):
+        self.messages = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            if args and isinstance(args[0], str):
+                self.messages.append((name, args[0]))
+            if name == 'columns':
+                count = args[0] if isinstance(args[0], int) else len(args[0])
+                return [self] * count
+            return self
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def load_email_sender(module_name: Optional[str] = None) -> types.ModuleType:
+    """modules/email_sender .py を独立したモジュールとして読み込む（ファイル名に空白を含むため）"""
+    module_name = module_name or f"email_sender_simulation_{next(_module_counter)}"
+    spec = importlib.util.spec_from_file_location(module_name, EMAIL_SENDER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def seed_generated_emails(db: IntegratedEmailDatabase, companies: List[Dict],
+                          language: str = 'english', template_type: str = 'standard'):
+    """シミュレーション用DBに事前生成メールを登録"""
+    for company in companies:
+        db.save_generated_email({
+            'company_id': company.get('company_id'),
+            'company_name': company.get('company_name'),
+            'language': language,
+            'subject': f"Partnership Opportunity - {company.get('company_name')}",
+            'customized_email': f"Dear {company.get('company_name')} Team,\n\nSimulation body.",
+            'template_type': template_type
+        })
+
+
+def make_synthetic_companies(count: int, domains: int = 50, country: str = 'USA') -> List[Dict]:
+    """検証用の企業リストを生成"""
+    return [{
+        'company_id': f"SIM_{i:05d}",
+        'company_name': f"Simulated Company {i}",
+        'email': f"contact{i}@domain{i % max(1, domains)}.example.com",
+        'country': country
+    } for i in range(count)]
+
+
+def simulate_send_run(companies: List[Dict], profile: Optional[ProviderProfile] = None,
+                      max_emails: int = 50, send_interval: int = 60,
+                      language: str = 'english', template_type: str = 'standard',
+                      seed: int = 0, start: Optional[datetime] = None, **sender_kwargs) -> Dict:
+    """実際の送信処理を仮想時計・模擬SMTPで実行し、所要時間・送信枠消費・リトライ量を返す
+
+    sender_kwargsはsend_pregenerated_emails_with_resumeにそのまま渡す（domain_min_gap等）
+    """
+    wall_start = time.perf_counter()
+    profile = profile or ProviderProfile()
+    clock = VirtualClock(start)
+    rng = random.Random(seed)
+    provider = SimulatedProvider(profile, clock, rng)
+    quiet_ui = _QuietStreamlit()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'simulation.db')
+        seed_generated_emails(IntegratedEmailDatabase(db_path), companies, language, template_type)
+
+        # 送信処理は変更せず、時計・SMTP・DB・UIの参照先のみ差し替える
+        sender = load_email_sender()
+        sender.time = clock.as_time_module()
+        sender.st = quiet_ui
+        sender.smtplib = types.SimpleNamespace(**{
+            name: getattr(smtplib, name) for name in dir(smtplib) if not name.startswith('__')
+        })
+        sender.smtplib.SMTP = provider.smtp_factory
+        sender.IntegratedEmailDatabase = partial(IntegratedEmailDatabase, db_path)
+        sender.SMTP_RETRY_POLICY = RetryPolicy(
+            max_attempts=SMTP_RETRY_POLICY.max_attempts, base_delay=SMTP_RETRY_POLICY.base_delay,
+            max_delay=SMTP_RETRY_POLICY.max_delay, throttle_base_delay=SMTP_RETRY_POLICY.throttle_base_delay,
+            throttle_max_delay=SMTP_RETRY_POLICY.throttle_max_delay, sleep=clock.sleep, rng=rng
+        )
+        sender.DomainThrottle = partial(DomainThrottle, clock=clock.monotonic)
+        sender.shared_domain_throttle = DomainThrottle(clock=clock.monotonic)
+        sender.drain_by_domain = partial(drain_by_domain, sleep=clock.sleep)
+        sender.utc_now = clock.utc_now
+        sender.SendWindowQueue = lambda targets, window=None: SendWindowQueue(targets, window, now=clock.utc_now())
+        sender.drain_in_send_windows = partial(drain_in_send_windows, clock=clock.utc_now, sleep=clock.sleep)
+
+        summary = sender.send_pregenerated_emails_with_resume(
+            companies, {'email': 'simulation@example.com', 'password': '', 'sender_name': 'Simulation'},
+            max_emails=max_emails, language=language, template_type=template_type,
+            send_interval=send_interval, **sender_kwargs
+        )
+
+    stats = provider.stats
+    completion = clock.time()
+    return {
+        'completion_seconds': completion,
+        'completion_hours': completion / 3600,
+        'idle_seconds': clock.slept,
+        'sent': stats['accepted'],
+        'attempts': stats['attempts'],
+        'retries': provider.retries,
+        'connections': stats['connections'],
+        'throttled': stats['throttled'],
+        'transient_errors': stats['transient'],
+        'permanent_errors': stats['permanent'],
+        'quota_exceeded': stats['quota_exceeded'],
+        'quota_used': stats['accepted'],
+        'quota_usage_rate': stats['accepted'] / profile.daily_quota if profile.daily_quota else 0.0,
+        'emails_per_hour': stats['accepted'] / (completion / 3600) if completion else 0.0,
+        'stopped_early': any('送信制限' in text or '認証エラー' in text for _, text in quiet_ui.messages),
+        'summary': summary,
+        'wall_seconds': time.perf_counter() - wall_start
+    }
+
+
+def compare_send_settings(companies: List[Dict], settings: List[Dict],
+                          profile: Optional[ProviderProfile] = None, seed: int = 0) -> List[Dict]:
+    """複数の送信設定（send_interval・max_emails等）を同じ条件で比較"""
+    results = []
+    for setting in settings:
+        report = simulate_send_run(companies, profile, seed=seed, **setting)
+        report['setting'] = setting
+        results.append(report)
+    return results
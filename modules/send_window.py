@@ -0,0 +1,176 @@
+"""
+送信時間帯スケジューラー
+宛先の国・地域からタイムゾーンを推定し、現地の営業時間帯が早く来る順に送信
+"""
+
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from datetime import time as dtime
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python 3.8
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+from send_scheduler import DomainThrottle, drain_by_domain
+
+
+# 国・地域名（小文字）→ IANAタイムゾーン
+COUNTRY_TIMEZONES = {
+    'japan': 'Asia/Tokyo', 'jp': 'Asia/Tokyo', '日本': 'Asia/Tokyo',
+    'usa': 'America/New_York', 'us': 'America/New_York', 'united states': 'America/New_York',
+    'united states of america': 'America/New_York', 'アメリカ': 'America/New_York', '米国': 'America/New_York',
+    'us-east': 'America/New_York', 'us-central': 'America/Chicago',
+    'us-mountain': 'America/Denver', 'us-west': 'America/Los_Angeles',
+    'canada': 'America/Toronto', 'ca': 'America/Toronto',
+    'mexico': 'America/Mexico_City', 'mx': 'America/Mexico_City',
+    'brazil': 'America/Sao_Paulo', 'br': 'America/Sao_Paulo',
+    'uk': 'Europe/London', 'gb': 'Europe/London', 'united kingdom': 'Europe/London', 'イギリス': 'Europe/London',
+    'ireland': 'Europe/Dublin', 'ie': 'Europe/Dublin',
+    'germany': 'Europe/Berlin', 'de': 'Europe/Berlin', 'ドイツ': 'Europe/Berlin',
+    'france': 'Europe/Paris', 'fr': 'Europe/Paris',
+    'netherlands': 'Europe/Amsterdam', 'nl': 'Europe/Amsterdam',
+    'spain': 'Europe/Madrid', 'es': 'Europe/Madrid',
+    'italy': 'Europe/Rome', 'it': 'Europe/Rome',
+    'sweden': 'Europe/Stockholm', 'se': 'Europe/Stockholm',
+    'switzerland': 'Europe/Zurich', 'ch': 'Europe/Zurich',
+    'uae': 'Asia/Dubai', 'ae': 'Asia/Dubai', 'united arab emirates': 'Asia/Dubai',
+    'saudi arabia': 'Asia/Riyadh', 'sa': 'Asia/Riyadh',
+    'india': 'Asia/Kolkata', 'in': 'Asia/Kolkata',
+    'singapore': 'Asia/Singapore', 'sg': 'Asia/Singapore',
+    'china': 'Asia/Shanghai', 'cn': 'Asia/Shanghai', '中国': 'Asia/Shanghai',
+    'hong kong': 'Asia/Hong_Kong', 'hk': 'Asia/Hong_Kong',
+    'taiwan': 'Asia/Taipei', 'tw': 'Asia/Taipei', '台湾': 'Asia/Taipei',
+    'korea': 'Asia/Seoul', 'south korea': 'Asia/Seoul', 'kr': 'Asia/Seoul', '韓国': 'Asia/Seoul',
+    'australia': 'Australia/Sydney', 'au': 'Australia/Sydney',
+    'new zealand': 'Pacific/Auckland', 'nz': 'Pacific/Auckland',
+}
+
+# 国不明時の既定タイムゾーン（ENRリストは米国企業が中心）
+DEFAULT_TIMEZONE = 'America/New_York'
+
+
+def get_timezone(name: str):
+    """タイムゾーンを取得（利用不可ならUTC）"""
+    if ZoneInfo is None:
+        return timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+
+def resolve_timezone(company: Dict, default: str = DEFAULT_TIMEZONE):
+    """企業のcountry/regionからタイムゾーンを推定"""
+    explicit = company.get('timezone')
+    if explicit:
+        return get_timezone(str(explicit))
+
+    for field in ('region', 'country'):
+        value = str(company.get(field) or '').strip().lower()
+        if value in COUNTRY_TIMEZONES:
+            return get_timezone(COUNTRY_TIMEZONES[value])
+
+    return get_timezone(default)
+
+
+class SendWindow:
+    """現地の営業時間帯（既定: 平日9時〜17時）"""
+
+    def __init__(self, start_hour: int = 9, end_hour: int = 17, weekdays=(0, 1, 2, 3, 4)):
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.weekdays = set(weekdays)
+
+    def next_open(self, now_utc: datetime, tz) -> datetime:
+        """次に送信可能になる時刻（UTC）。営業時間内ならnow_utcを返す"""
+        local_now = now_utc.astimezone(tz)
+
+        for day_offset in range(8):
+            day = (local_now + timedelta(days=day_offset)).date()
+            if day.weekday() not in self.weekdays:
+                continue
+            start = datetime.combine(day, dtime(self.start_hour), tzinfo=tz)
+            end = datetime.combine(day, dtime(self.end_hour), tzinfo=tz)
+            if local_now < end:
+                return max(local_now, start).astimezone(timezone.utc)
+
+        return now_utc
+
+    def is_open(self, now_utc: datetime, tz) -> bool:
+        """現在が営業時間内か"""
+        return self.next_open(now_utc, tz) <= now_utc
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class SendWindowQueue:
+    """現地営業時間の開始が早い順に並ぶ優先度キュー"""
+
+    def __init__(self, companies: List[Dict], window: Optional[SendWindow] = None,
+                 now: Optional[datetime] = None, default_timezone: str = DEFAULT_TIMEZONE):
+        self.window = window or SendWindow()
+        self.default_timezone = default_timezone
+        self._heap = []
+        self._counter = itertools.count()
+
+        now = now or utc_now()
+        for company in companies:
+            self.push(company, now)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, company: Dict, now: datetime):
+        """企業を次の送信可能時刻で登録"""
+        tz = resolve_timezone(company, self.default_timezone)
+        ready_at = self.window.next_open(now, tz)
+        heapq.heappush(self._heap, (ready_at, next(self._counter), company))
+
+    def pop_due(self, now: datetime) -> List[Dict]:
+        """送信可能時刻を過ぎた企業をすべて取り出す（窓が既に閉じたものは次の窓へ再登録）"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, company = heapq.heappop(self._heap)
+            tz = resolve_timezone(company, self.default_timezone)
+            if self.window.is_open(now, tz):
+                due.append(company)
+            else:
+                self.push(company, now)
+        return due
+
+    def next_due_in(self, now: datetime) -> float:
+        """次の企業が送信可能になるまでの秒数"""
+        if not self._heap:
+            return 0.0
+        return max(0.0, (self._heap[0][0] - now).total_seconds())
+
+    def due_count(self, now: datetime) -> int:
+        """現在送信可能な企業数"""
+        return sum(1 for ready_at, _, _ in self._heap if ready_at <= now)
+
+
+def drain_in_send_windows(queue: SendWindowQueue, throttle: DomainThrottle,
+                          clock: Callable[[], datetime] = utc_now,
+                          sleep: Callable[[float], None] = time.sleep,
+                          max_wait: Optional[float] = None) -> Iterator[Dict]:
+    """送信可能になった企業から順に取り出し、ドメイン制御を通して返す
+
+    次の営業時間までの待ちがmax_wait秒を超える場合は終了し、残りはキューに残す
+    """
+    while len(queue):
+        due = queue.pop_due(clock())
+        if not due:
+            wait = queue.next_due_in(clock())
+            if max_wait is not None and wait > max_wait:
+                return
+            sleep(wait)
+            continue
+
+        yield from drain_by_domain(due, throttle, sleep)
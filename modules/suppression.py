@@ -0,0 +1,129 @@
+"""
+配信停止リスト
+アドレス・ドメイン単位の配信停止をBloomフィルター＋完全一致セットで O(1) 判定
+"""
+
+import hashlib
+import math
+from typing import Iterable, Optional
+
+from email_database import IntegratedEmailDatabase
+
+
+# 既定の偽陽性率と初期容量
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+DEFAULT_CAPACITY = 10000
+
+
+class BloomFilter:
+    """ビット配列によるBloomフィルター（ダブルハッシュ方式）"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY,
+                 false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE):
+        self.capacity = max(1, capacity)
+        self.false_positive_rate = false_positive_rate
+
+        # 最適なビット数 m = -n ln p / (ln 2)^2、ハッシュ数 k = m/n ln 2
+        self.num_bits = max(8, int(math.ceil(-self.capacity * math.log(false_positive_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def is_saturated(self) -> bool:
+        """設計容量を超えたか（偽陽性率が設定値を上回る）"""
+        return self.count > self.capacity
+
+
+def normalize_address(email: Optional[str]) -> str:
+    """比較用にアドレスを正規化"""
+    return str(email or '').strip().strip('<>').lower()
+
+
+class SuppressionList:
+    """配信停止リスト（ワーカー起動時に読み込み、以降は差分更新）"""
+
+    def __init__(self, db: Optional[IntegratedEmailDatabase] = None,
+                 false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE):
+        self.db = db or IntegratedEmailDatabase()
+        self.false_positive_rate = false_positive_rate
+        self._addresses = set()
+        self._domains = set()
+        self._address_bloom = BloomFilter(DEFAULT_CAPACITY, false_positive_rate)
+        self._domain_bloom = BloomFilter(DEFAULT_CAPACITY, false_positive_rate)
+        self._last_address_id = 0
+        self._last_domain_id = 0
+        self.refresh()
+
+    def _rebuild(self, values: Iterable[str]) -> BloomFilter:
+        """容量を拡張してBloomフィルターを再構築"""
+        values = list(values)
+        bloom = BloomFilter(max(DEFAULT_CAPACITY, len(values) * 2), self.false_positive_rate)
+        for value in values:
+            bloom.add(value)
+        return bloom
+
+    def refresh(self) -> int:
+        """前回以降に追加されたエントリのみ読み込む"""
+        added = 0
+
+        for row_id, email in self.db.get_suppressions_since('suppressed_addresses', self._last_address_id):
+            value = normalize_address(email)
+            if value not in self._addresses:
+                self._addresses.add(value)
+                self._address_bloom.add(value)
+                added += 1
+            self._last_address_id = row_id
+
+        for row_id, domain in self.db.get_suppressions_since('suppressed_domains', self._last_domain_id):
+            value = normalize_address(domain).lstrip('@')
+            if value not in self._domains:
+                self._domains.add(value)
+                self._domain_bloom.add(value)
+                added += 1
+            self._last_domain_id = row_id
+
+        if self._address_bloom.is_saturated():
+            self._address_bloom = self._rebuild(self._addresses)
+        if self._domain_bloom.is_saturated():
+            self._domain_bloom = self._rebuild(self._domains)
+
+        return added
+
+    def is_suppressed(self, email: Optional[str]) -> bool:
+        """配信停止対象か判定（Bloomで大半を除外し、該当時のみ完全一致で確認）"""
+        address = normalize_address(email)
+        if not address:
+            return False
+
+        domain = address.rsplit('@', 1)[-1] if '@' in address else ''
+        if domain and domain in self._domain_bloom and domain in self._domains:
+            return True
+        return address in self._address_bloom and address in self._addresses
+
+    def add_address(self, email: str, reason: str = 'unsubscribe', source: str = 'manual'):
+        """アドレスを登録し、即時にメモリにも反映"""
+        self.db.add_suppressed_address(email, reason, source)
+        self.refresh()
+
+    def add_domain(self, domain: str, reason: str = 'unsubscribe', source: str = 'manual'):
+        """ドメインを登録し、即時にメモリにも反映"""
+        self.db.add_suppressed_domain(domain, reason, source)
+        self.refresh()
+
+    def __len__(self):
+        return len(self._addresses) + len(self._domains)
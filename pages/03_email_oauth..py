@@ -6,9 +6,6 @@ import pandas as pd
 from datetime import datetime
 import json
 import os
-import base64
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import requests
 
 # OAuth2とGmail API用のインポート
@@ -28,6 +25,9 @@ google-api-python-client
     """)
     st.stop()
 
+from modules.gmail_api_sender import DEFAULT_BATCH_SIZE, GmailApiSender
+from modules.message_builder import build_message
+
 # ページ設定
 st.set_page_config(
     page_title="Gmail OAuth2メール配信",
@@ -112,20 +112,9 @@ def authenticate_user():
     
     return None
 
-def send_gmail(to_email, subject, body, credentials):
-    """Gmail APIでメール送信"""
-    try:
-        # Gmail API サービス構築
-        service = build('gmail', 'v1', credentials=credentials)
-        
-        # メッセージ作成
-        message = MIMEMultipart()
-        message['to'] = to_email
-        message['from'] = 'tokuda@picocela.com'
-        message['subject'] = subject
-        
-        # HTML形式のメール本文
-        html_body = f"""
+def build_html_body(body):
+    """本文をHTMLメールに整形"""
+    return f"""
         <html>
         <body>
             <div style="font-family: Arial, sans-serif; max-width: 600px;">
@@ -142,23 +131,31 @@ def send_gmail(to_email, subject, body, credentials):
         </body>
         </html>
         """
-        
-        message.attach(MIMEText(html_body, 'html'))
-        
-        # Base64エンコード
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        
-        # メール送信
-        send_result = service.users().messages().send(
-            userId='me',
-            body={'raw': raw_message}
-        ).execute()
-        
-        return True, send_result['id']
+
+def prepare_gmail(to_email, subject, body):
+    """送信メールを一度だけレンダリング"""
+    return build_message(to_email, subject, build_html_body(body), {'email': 'tokuda@picocela.com'}, subtype='html')
+
+def send_gmail(to_email, subject, body, credentials):
+    """Gmail APIでメール送信（サービスは認証情報ごとにキャッシュ）"""
+    try:
+        sender = GmailApiSender(credentials)
+        message_id = sender.send(prepare_gmail(to_email, subject, body))
+        return True, message_id
         
     except Exception as e:
         return False, str(e)
 
+def send_gmail_batch(messages, credentials, batch_size=DEFAULT_BATCH_SIZE):
+    """Gmail APIのHTTPバッチで一括送信（[(to_email, subject, body)] → [(成功, ID/エラー)]）"""
+    try:
+        sender = GmailApiSender(credentials, batch_size=batch_size)
+        outcomes = sender.send_batch([prepare_gmail(*message) for message in messages])
+        return [(success, detail) for success, detail, _ in outcomes]
+        
+    except Exception as e:
+        return [(False, str(e))] * len(messages)
+
 def get_crm_data():
     """CRMデータを取得（既存のGoogle Sheets連携を使用）"""
     try:
@@ -335,36 +332,69 @@ Koji Tokuda""",
                         height=300
                     )
                     
+                    send_provider = st.radio(
+                        "送信方式:",
+                        ["Gmail API バッチ送信（推奨）", "1通ずつ送信"],
+                        help="バッチ送信は最大50通を1回のHTTPリクエストにまとめて送信します"
+                    )
+                    
                     # バッチ送信ボタン
                     if st.button("🚀 一括メール送信", type="primary"):
                         progress_bar = st.progress(0)
                         success_count = 0
                         
-                        for i, company in enumerate(selected_companies):
-                            company_data = filtered_data[filtered_data['company_name'] == company].iloc[0]
+                        if send_provider.startswith("Gmail API"):
+                            # 宛先を最大50通ずつHTTPバッチにまとめて送信
+                            targets = []
+                            for company in selected_companies:
+                                company_data = filtered_data[filtered_data['company_name'] == company].iloc[0]
+                                if pd.notna(company_data['email']) and company_data['email']:
+                                    targets.append((company, company_data['email']))
+                                else:
+                                    st.write(f"⚠️ {company}: メールアドレスなし")
                             
-                            if pd.notna(company_data['email']) and company_data['email']:
-                                # 会社名を本文に挿入
-                                personalized_body = batch_body.replace('[Company Name]', company)
-                                
-                                # メール送信
-                                success, result = send_gmail(
-                                    company_data['email'],
-                                    batch_subject,
-                                    personalized_body,
+                            for start in range(0, len(targets), DEFAULT_BATCH_SIZE):
+                                chunk = targets[start:start + DEFAULT_BATCH_SIZE]
+                                outcomes = send_gmail_batch(
+                                    [(email, batch_subject, batch_body.replace('[Company Name]', company))
+                                     for company, email in chunk],
                                     credentials
                                 )
                                 
-                                if success:
-                                    success_count += 1
-                                    st.write(f"✅ {company}: 送信成功")
+                                for (company, _), (success, result) in zip(chunk, outcomes):
+                                    if success:
+                                        success_count += 1
+                                        st.write(f"✅ {company}: 送信成功")
+                                    else:
+                                        st.write(f"❌ {company}: 送信失敗 - {result}")
+                                
+                                progress_bar.progress(min(1.0, (start + len(chunk)) / max(1, len(targets))))
+                        else:
+                            for i, company in enumerate(selected_companies):
+                                company_data = filtered_data[filtered_data['company_name'] == company].iloc[0]
+                                
+                                if pd.notna(company_data['email']) and company_data['email']:
+                                    # 会社名を本文に挿入
+                                    personalized_body = batch_body.replace('[Company Name]', company)
+                                    
+                                    # メール送信
+                                    success, result = send_gmail(
+                                        company_data['email'],
+                                        batch_subject,
+                                        personalized_body,
+                                        credentials
+                                    )
+                                    
+                                    if success:
+                                        success_count += 1
+                                        st.write(f"✅ {company}: 送信成功")
+                                    else:
+                                        st.write(f"❌ {company}: 送信失敗 - {result}")
                                 else:
-                                    st.write(f"❌ {company}: 送信失敗 - {result}")
-                            else:
-                                st.write(f"⚠️ {company}: メールアドレスなし")
-                            
-                            # プログレスバー更新
-                            progress_bar.progress((i + 1) / len(selected_companies))
+                                    st.write(f"⚠️ {company}: メールアドレスなし")
+                                
+                                # プログレスバー更新
+                                progress_bar.progress((i + 1) / len(selected_companies))
                         
                         st.success(f"🎉 一括送信完了！成功: {success_count}/{len(selected_companies)}件")
                         st.balloons()
@@ -6,6 +6,8 @@ from email.mime.multipart import MIMEMultipart
 import pandas as pd
 import requests
 
+from modules.async_gas_client import get_shared_gas_client
+
 st.set_page_config(
     page_title="シンプルメール送信",
     page_icon="📧",
@@ -27,21 +29,16 @@ def get_crm_data():
             'Cache-Control': 'no-cache'
         }
         
-        response = requests.get(
-            api_url,
-            params={"action": "get_companies"},
-            headers=headers,
-            timeout=30,
-            verify=True
-        )
+        # 同時に開いている他のセッションと実行中のリクエスト・取得結果を共有
+        data = get_shared_gas_client(api_url, headers=headers).call('get_companies')
         
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success') and 'companies' in data:
-                return pd.DataFrame(data['companies'])
+        if isinstance(data, dict) and data.get('success') and 'companies' in data:
+            return pd.DataFrame(data['companies'])
         
         return pd.DataFrame()
         
+    except requests.exceptions.HTTPError:
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"CRMデータ取得エラー: {e}")
         return pd.DataFrame()
@@ -8,6 +8,8 @@ import requests
 import time
 from datetime import datetime
 
+from modules.async_gas_client import get_shared_gas_client
+
 st.set_page_config(
     page_title="PicoCELA メール送信システム - 動作確実版",
     page_icon="📧",
@@ -30,20 +32,16 @@ def get_crm_data():
             'Accept': 'application/json',
         }
         
-        response = requests.get(
-            api_url,
-            params={"action": "get_companies"},
-            headers=headers,
-            timeout=30
-        )
+        # 同時に開いている他のセッションと実行中のリクエスト・取得結果を共有
+        data = get_shared_gas_client(api_url, headers=headers).call('get_companies')
         
-        if response.status_code == 200:
-            data = response.json()
-            if isinstance(data, list) and len(data) > 0:
-                return pd.DataFrame(data)
+        if isinstance(data, list) and len(data) > 0:
+            return pd.DataFrame(data)
         
         return pd.DataFrame()
         
+    except requests.exceptions.HTTPError:
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"CRMデータ取得エラー: {e}")
         return pd.DataFrame()
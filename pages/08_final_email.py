@@ -5,8 +5,12 @@ import time
 import pandas as pd
 from datetime import datetime
 
+from modules.gas_bulk_sender import GasBulkSender
+from modules.gas_config import resolve_gas_url
+from modules.async_gas_client import get_shared_gas_client
+
 # Google Apps Script WebアプリのURL
-GAS_URL = "https://script.google.com/macros/s/AKfycby998uiOXSrg9GEDvocVfZR7a7uN_P121G__FRqyJh2zLMJA8KUB2dtsHi7GSZxoRAD-A/exec"
+GAS_URL = resolve_gas_url("https://script.google.com/macros/s/AKfycby998uiOXSrg9GEDvocVfZR7a7uN_P121G__FRqyJh2zLMJA8KUB2dtsHi7GSZxoRAD-A/exec")
 
 def send_email_via_gas(recipient, subject, body, sender_name="PicoCELA CRM System"):
     """Google Apps Script経由でメール送信"""
@@ -37,31 +41,12 @@ def send_email_via_gas(recipient, subject, body, sender_name="PicoCELA CRM Syste
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def send_bulk_emails_via_gas(recipients, subject, body, sender_name="PicoCELA CRM System"):
-    """Google Apps Script経由で一括メール送信"""
+def send_bulk_emails_via_gas(recipients, subject, body, sender_name="PicoCELA CRM System",
+                             max_parallel=3, on_progress=None):
+    """Google Apps Script経由で一括メール送信（チャンク分割・並列送信・失敗チャンクのみ再送）"""
     try:
-        payload = {
-            "action": "send_bulk_emails",
-            "recipients": recipients,
-            "subject": subject,
-            "body": body,
-            "senderName": sender_name
-        }
-        
-        response = requests.post(
-            GAS_URL,
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=180  # 一括送信は時間がかかるため長めに設定
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {
-                "status": "error", 
-                "message": f"HTTP {response.status_code}: {response.text}"
-            }
+        sender = GasBulkSender(GAS_URL, max_parallel=max_parallel)
+        return sender.send(recipients, subject, body, sender_name, on_progress=on_progress)
             
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -69,19 +54,11 @@ def send_bulk_emails_via_gas(recipients, subject, body, sender_name="PicoCELA CR
 def get_companies_data():
     """CRMデータ取得"""
     try:
-        payload = {"action": "get_companies"}
-        response = requests.post(
-            GAS_URL,
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"status": "error", "message": f"HTTP {response.status_code}"}
+        # 同時に開いている他のセッションと実行中のリクエスト・取得結果を共有
+        return get_shared_gas_client(GAS_URL).call('get_companies', method='POST')
             
+    except requests.exceptions.HTTPError as e:
+        return {"status": "error", "message": f"HTTP {e.response.status_code}"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -208,7 +185,8 @@ with tab2:
             companies_data = get_companies_data()
             
             if companies_data.get("success") == True:
-                companies = companies_data.get("companies", [])
+                # 取得結果は他のセッションと共有されるため、コピーを保持
+                companies = list(companies_data.get("companies", []))
                 st.session_state.companies = companies
                 st.success(f"✅ **{len(companies)}社のデータを取得しました**")
                 
@@ -308,12 +286,17 @@ with tab2:
                                 progress_bar = st.progress(0)
                                 status_text = st.empty()
                                 
-                                # 送信実行
+                                def update_progress(done, total):
+                                    progress_bar.progress(int(done / total * 100))
+                                    status_text.text(f"送信済み: {done}/{total}")
+                                
+                                # 送信実行（チャンク単位で並列送信）
                                 result = send_bulk_emails_via_gas(
                                     recipients=recipients,
                                     subject=bulk_subject,
                                     body=bulk_body,
-                                    sender_name=bulk_sender
+                                    sender_name=bulk_sender,
+                                    on_progress=update_progress
                                 )
                                 
                                 progress_bar.progress(100)
@@ -329,6 +312,21 @@ with tab2:
                                     """)
                                     
                                     # 送信結果の詳細表示
+                                    with st.expander("📋 送信結果詳細"):
+                                        results_df = pd.DataFrame(result.get('results', []))
+                                        if not results_df.empty:
+                                            st.dataframe(results_df, use_container_width=True)
+                                elif result.get("status") == "partial":
+                                    st.warning(f"""
+                                    ⚠️ **一部送信失敗**
+                                    
+                                    📊 総送信数: {result.get('total', 0)}
+                                    ✅ 成功: {result.get('successful', 0)}
+                                    ❌ 失敗: {result.get('failed', 0)}
+                                    ❓ 応答なし（送信済みの可能性あり）: {result.get('unknown', 0)}
+                                    🔁 再送チャンク: {result.get('retried_chunks', 0)}
+                                    """)
+                                    
                                     with st.expander("📋 送信結果詳細"):
                                         results_df = pd.DataFrame(result.get('results', []))
                                         if not results_df.empty: